@@ -0,0 +1,301 @@
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from query_cache import normalize_sql
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS query_log (
+    shape TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL,
+    score REAL NOT NULL,
+    total_ms REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS answers (
+    shape TEXT PRIMARY KEY,
+    data BLOB,
+    row_count INTEGER,
+    refreshed_at REAL,
+    refresh_ms REAL,
+    lease_until REAL NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Refresh failures after which an answer (and its log entry) is dropped
+MAX_FAILURES = 3
+
+
+class AnswerStore:
+    """
+    Materialized answers for the hottest SELECTs, kept in a SQLite file that
+    every server process shares.
+
+    ``record`` notes each live execution (statement and duration); ``run_once``
+    (called by AnswerRefresher) flushes those notes into the query log, picks
+    the ``max_entries`` statements with the most time to save (decayed hit
+    count x average duration, counting only ones seen at least ``min_hits``
+    times and slower than ``min_ms``), re-runs those older than
+    ``refresh_interval`` through ``execute`` and loads the results into
+    memory. ``lookup`` answers from memory while a result is younger than
+    ``max_age`` seconds.
+
+    A shape is the statement with whitespace normalised (as for the result
+    cache): only an identical statement can be answered with stored rows.
+    Hits decay with a ``half_life`` (seconds), so answers follow what is
+    asked now. Several processes may refresh concurrently; each answer is
+    claimed with a lease first, so it runs once per interval.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 50,
+        min_hits: float = 3.0,
+        min_ms: float = 200.0,
+        refresh_interval: float = 300.0,
+        max_age: float = 900.0,
+        half_life: float = 86400.0,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.min_hits = min_hits
+        self.min_ms = min_ms
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.half_life = half_life
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = 0
+        self._db_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List[float]] = {}  # shape -> [hits, total_ms]
+        # shape -> (refreshed_at epoch, refresh_ms, rows)
+        self._ready: Dict[str, Tuple[float, float, List[Dict[str, Any]]]] = {}
+        self._stats = {"served": 0, "misses_stale": 0, "refreshes": 0, "refresh_failures": 0}
+
+    # ----------------------------
+    # Internals
+    # ----------------------------
+    def _db(self) -> sqlite3.Connection:
+        # One connection per process: a forked worker must not reuse its parent's.
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _decayed(self, score: float, last_seen: float, now: float) -> float:
+        return score * 0.5 ** (max(0.0, now - last_seen) / self.half_life) if self.half_life > 0 else score
+
+    def _flush(self, db: sqlite3.Connection, now: float) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for shape, (hits, total_ms) in pending.items():
+                row = db.execute("SELECT score, last_seen FROM query_log WHERE shape = ?", (shape,)).fetchone()
+                score = self._decayed(row[0], row[1], now) + hits if row else hits
+                db.execute(
+                    "INSERT INTO query_log (shape, hits, score, total_ms, last_seen) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(shape) DO UPDATE SET hits = hits + excluded.hits, score = excluded.score, "
+                    "total_ms = total_ms + excluded.total_ms, last_seen = excluded.last_seen",
+                    (shape, int(hits), score, total_ms, now),
+                )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def _select(self, db: sqlite3.Connection, now: float) -> None:
+        """Make the answer set the current top shapes; forget shapes that went cold."""
+        ranked = []
+        cold = []
+        for shape, hits, score, total_ms, last_seen in db.execute("SELECT shape, hits, score, total_ms, last_seen FROM query_log"):
+            decayed = self._decayed(score, last_seen, now)
+            avg_ms = total_ms / hits if hits else 0.0
+            if decayed < 0.01:
+                cold.append((shape,))
+            elif decayed >= self.min_hits and avg_ms >= self.min_ms:
+                ranked.append((decayed * avg_ms, shape))
+        hot = [shape for _, shape in sorted(ranked, reverse=True)[:self.max_entries]]
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany("DELETE FROM query_log WHERE shape = ?", cold)
+            db.executemany("INSERT OR IGNORE INTO answers (shape) VALUES (?)", [(s,) for s in hot])
+            current = [row[0] for row in db.execute("SELECT shape FROM answers")]
+            keep = set(hot)
+            db.executemany("DELETE FROM answers WHERE shape = ?", [(s,) for s in current if s not in keep])
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def _refresh_due(self, db: sqlite3.Connection, execute: Callable[[str], Sequence[Any]], now: float) -> int:
+        due = [
+            row[0] for row in db.execute(
+                "SELECT shape FROM answers WHERE (refreshed_at IS NULL OR refreshed_at < ?) AND lease_until < ?",
+                (now - self.refresh_interval, now),
+            )
+        ]
+        refreshed = 0
+        for shape in due:
+            started = time.time()
+            # Claim it; another process may have taken it since the SELECT.
+            claimed = db.execute(
+                "UPDATE answers SET lease_until = ? WHERE shape = ? AND lease_until < ?",
+                (started + self.refresh_interval, shape, started),
+            ).rowcount
+            if not claimed:
+                continue
+            try:
+                rows = execute(shape)
+            except Exception as e:
+                with self._lock:
+                    self._stats["refresh_failures"] += 1
+                print(f"[AnswerStoreError] Refresh failed for {shape[:80]!r}: {e}", file=sys.stderr)
+                db.execute("UPDATE answers SET failures = failures + 1 WHERE shape = ?", (shape,))
+                if db.execute("SELECT failures FROM answers WHERE shape = ?", (shape,)).fetchone()[0] >= MAX_FAILURES:
+                    db.execute("DELETE FROM answers WHERE shape = ?", (shape,))
+                    db.execute("DELETE FROM query_log WHERE shape = ?", (shape,))
+                continue
+            # Pickled, so Decimal/datetime values come back as the live query returns them
+            db.execute(
+                "UPDATE answers SET data = ?, row_count = ?, refreshed_at = ?, refresh_ms = ?, lease_until = 0, "
+                "failures = 0 WHERE shape = ?",
+                (pickle.dumps(list(rows), protocol=pickle.HIGHEST_PROTOCOL), len(rows), time.time(),
+                 (time.time() - started) * 1000, shape),
+            )
+            refreshed += 1
+        with self._lock:
+            self._stats["refreshes"] += refreshed
+        return refreshed
+
+    def _load(self, db: sqlite3.Connection) -> None:
+        """Bring the in-memory answers up to date with the file (including other processes' refreshes)."""
+        current = {
+            shape: (refreshed_at, refresh_ms)
+            for shape, refreshed_at, refresh_ms in db.execute(
+                "SELECT shape, refreshed_at, refresh_ms FROM answers WHERE data IS NOT NULL"
+            )
+        }
+        ready = {}
+        for shape, (refreshed_at, refresh_ms) in current.items():
+            known = self._ready.get(shape)
+            if known is not None and known[0] == refreshed_at:
+                ready[shape] = known
+                continue
+            row = db.execute("SELECT data FROM answers WHERE shape = ?", (shape,)).fetchone()
+            if row is None or row[0] is None:
+                continue
+            ready[shape] = (refreshed_at, refresh_ms or 0.0, pickle.loads(row[0]))
+        with self._lock:
+            self._ready = ready
+
+    # ----------------------------
+    # Public API
+    # ----------------------------
+    def record(self, query: str, elapsed_ms: float) -> None:
+        """Note one live execution of ``query``; written to the log by the next ``run_once``."""
+        shape = normalize_sql(query)
+        with self._lock:
+            entry = self._pending.setdefault(shape, [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed_ms
+
+    def lookup(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Stored rows for ``query`` with their freshness, or None when it is not
+        materialized or its result is older than ``max_age``.
+        """
+        shape = normalize_sql(query)
+        with self._lock:
+            entry = self._ready.get(shape)
+            if entry is None:
+                return None
+            refreshed_at, refresh_ms, rows = entry
+            age = time.time() - refreshed_at
+            if age > self.max_age:
+                self._stats["misses_stale"] += 1
+                return None
+            self._stats["served"] += 1
+        return {
+            "rows": rows,
+            "materialized": {
+                "refreshed_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(refreshed_at)),
+                "age_seconds": round(age, 1),
+                "refresh_interval_seconds": self.refresh_interval,
+                "refresh_ms": round(refresh_ms, 1),
+            },
+        }
+
+    def run_once(self, execute: Callable[[str], Sequence[Any]]) -> int:
+        """Flush the log, choose the hot shapes and refresh the due ones. Returns the refresh count."""
+        with self._db_lock:
+            db = self._db()
+            now = time.time()
+            self._flush(db, now)
+            self._select(db, now)
+            refreshed = self._refresh_due(db, execute, now)
+            self._load(db)
+            return refreshed
+
+    def clear(self) -> None:
+        """
+        Drop every stored answer (e.g. the schema changed); the query log is
+        kept, so hot shapes are materialized again on the next pass.
+        """
+        with self._db_lock:
+            self._db().execute("DELETE FROM answers")
+            with self._lock:
+                self._ready = {}
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            out = {
+                **self._stats,
+                "path": self.path,
+                "answers": len(self._ready),
+                "max_entries": self.max_entries,
+                "refresh_interval": self.refresh_interval,
+                "max_age": self.max_age,
+                "pending_log": len(self._pending),
+                "oldest_age_seconds": round(max((now - r[0] for r in self._ready.values()), default=0.0), 1),
+            }
+        return out
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+class AnswerRefresher(threading.Thread):
+    """Daemon thread running ``store.run_once(execute)`` every ``period`` seconds."""
+
+    def __init__(self, store: AnswerStore, execute: Callable[[str], Sequence[Any]], period: float = 30.0):
+        super().__init__(name="answer-refresher", daemon=True)
+        self.store = store
+        self.execute = execute
+        self.period = period
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.period):
+            try:
+                self.store.run_once(self.execute)
+            except Exception as e:
+                print(f"[AnswerStoreError] {e}", file=sys.stderr)
+
+    def stop(self) -> None:
+        self._stop_event.set()
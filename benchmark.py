@@ -0,0 +1,525 @@
+"""
+Reproducible performance benchmark for the schema, retrieval and SQL pipeline.
+
+Loads db_tables_module/*.yaml plus schema_1.yaml (or a synthetic schema with
+--synthetic-tables N), times each component over a fixed corpus of questions
+and SQL, and runs ask_db end to end against a stub LLM and an in-memory SQLite
+stand-in for MySQL. Results are written as JSON; --compare prints the change
+against an earlier run.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --synthetic-tables 10000 --retrieval-modes bm25 --output bench_10k.json
+    python benchmark.py --compare bench.json --fail-on-regression 25
+"""
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import platform
+import random
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import yaml
+
+ROOT = pathlib.Path(__file__).resolve().parent
+
+QUESTIONS = [
+    "list candidates with their email and interview status",
+    "how many job applications were received per job post last month",
+    "offer letters generated for candidates with interview feedback",
+    "employees in each department with their designation",
+    "pending leave reports for employees this week",
+    "assets allotted to employees by asset category",
+    "total import invoice charges paid per currency",
+    "bill of entry numbers for import invoices from supplier contracts",
+    "purchase orders raised against each import contract",
+    "project invoices per project with vendor name",
+    "bom items and their contingency for each project section",
+    "installation budget for approved bbu versions",
+    "leads by company and their calling remarks",
+    "company loans with bank details and outstanding amount",
+    "daily check in and check out times of sales staff",
+    "dispatch details and eway bills for delivered invoices",
+    "payments awaiting approval for logistics invoices",
+    "daily stock out summary by product",
+    "cities and countries of billing addresses for importers",
+    "app versions released for each organisation",
+    "bookings with their products and quantities",
+    "invoice status history for orders invoices",
+    "quotations sent to clients with their products",
+    "total sales per client city for product transactions",
+    "inventory quantity per warehouse and product",
+]
+
+EXTRA_SQL = [
+    "SELECT COUNT(*) FROM {a} WHERE updated_at > '2024-01-01'",
+    "WITH recent AS (SELECT * FROM {a} ORDER BY id DESC LIMIT 100) SELECT * FROM recent",
+    "SELECT * FROM {a} WHERE id IN (SELECT id FROM {a} WHERE created_at >= NOW() - INTERVAL 7 DAY) LIMIT 500",
+    "SELECT * FROM {a}; DELETE FROM {a}",
+    "UPDATE {a} SET id = id",
+    "SELECT * FROM information_schema.tables",
+    "SELECT SLEEP(10) FROM {a}",
+    "SELECT * FROM unknown_table_xyz",
+]
+
+MODULE_WORDS = [
+    "accounts", "hrm", "imports", "project", "leads", "logistics", "master", "orders",
+    "finance", "sales", "crm", "inventory", "billing", "payroll", "support", "audit",
+    "catalog", "shipping", "vendor", "analytics",
+]
+ENTITY_WORDS = [
+    "candidate", "employee", "invoice", "payment", "order", "product", "client", "vendor",
+    "contract", "shipment", "warehouse", "booking", "quotation", "asset", "loan", "lead",
+    "project", "budget", "ledger", "dispatch", "receipt", "policy", "region", "currency",
+    "report", "ticket", "campaign", "account", "document", "approval",
+]
+FIELD_WORDS = [
+    "name", "email", "phone", "status", "amount", "quantity", "price", "total", "remark",
+    "date", "code", "address", "city", "country", "rate", "tax", "discount", "balance",
+    "reference", "number", "title", "description", "type", "level", "score", "weight",
+]
+FIELD_TYPES = ["int", "varchar(100)", "varchar(255)", "decimal(12,2)", "datetime", "date", "tinyint(1)", "text"]
+
+
+# ----------------------------
+# Timing
+# ----------------------------
+def _percentile(sorted_values: Sequence[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(samples_us: List[float]) -> Dict[str, Any]:
+    values = sorted(samples_us)
+    return {
+        "n": len(values),
+        "mean_us": round(sum(values) / len(values), 2) if values else 0.0,
+        "p50_us": round(_percentile(values, 50), 2),
+        "p95_us": round(_percentile(values, 95), 2),
+        "p99_us": round(_percentile(values, 99), 2),
+        "min_us": round(values[0], 2) if values else 0.0,
+        "max_us": round(values[-1], 2) if values else 0.0,
+    }
+
+
+def bench(fn: Callable[[Any], Any], inputs: Sequence[Any], repeat: int = 1, before: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """Time ``fn(x)`` for every input, ``repeat`` rounds; ``before`` runs untimed before each call."""
+    samples = []
+    for _ in range(repeat):
+        for x in inputs:
+            if before is not None:
+                before()
+            start = time.perf_counter_ns()
+            fn(x)
+            samples.append((time.perf_counter_ns() - start) / 1000.0)
+    return summarize(samples)
+
+
+def bench_async(fn: Callable[[Any], Any], inputs: Sequence[Any], repeat: int = 1, before: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    async def _run() -> List[float]:
+        samples = []
+        for _ in range(repeat):
+            for x in inputs:
+                if before is not None:
+                    before()
+                start = time.perf_counter_ns()
+                await fn(x)
+                samples.append((time.perf_counter_ns() - start) / 1000.0)
+        return samples
+    return summarize(asyncio.run(_run()))
+
+
+def once(fn: Callable[[], Any]) -> Dict[str, Any]:
+    start = time.perf_counter_ns()
+    fn()
+    return summarize([(time.perf_counter_ns() - start) / 1000.0])
+
+
+# ----------------------------
+# Schema corpus
+# ----------------------------
+def prepare_real_schema(schema_dir: pathlib.Path) -> None:
+    for file in sorted((ROOT / "db_tables_module").glob("*.yaml")):
+        shutil.copy(file, schema_dir / file.name)
+    if (ROOT / "schema_1.yaml").exists():
+        shutil.copy(ROOT / "schema_1.yaml", schema_dir / "schema_1.yaml")
+
+
+def prepare_synthetic_schema(schema_dir: pathlib.Path, n_tables: int, seed: int) -> None:
+    """
+    ``n_tables`` tables spread over MODULE_WORDS modules, 6-30 fields each,
+    with ``<entity>_id`` references to other tables of the same module.
+    """
+    rng = random.Random(seed)
+    modules: Dict[str, Dict[str, Any]] = {m: {} for m in MODULE_WORDS}
+    names: Dict[str, List[str]] = {m: [] for m in MODULE_WORDS}
+    for i in range(n_tables):
+        module = MODULE_WORDS[i % len(MODULE_WORDS)]
+        entity = rng.choice(ENTITY_WORDS)
+        table = f"{module}_{entity}{rng.choice(['', 'detail', 'history', 'item', 'log'])}{i}"
+        fields: Dict[str, Any] = {"id": {"type": "int", "description": f"Primary key of {table}."}}
+        for other in rng.sample(names[module], min(2, len(names[module]))):
+            fields[f"{other.split('_', 1)[1]}_id"] = {"type": "int", "description": f"Reference to {other}."}
+        for _ in range(rng.randint(5, 28)):
+            word = rng.choice(FIELD_WORDS)
+            col = f"{rng.choice(ENTITY_WORDS)}_{word}" if word in fields or rng.random() < 0.5 else word
+            fields[col] = {
+                "type": rng.choice(FIELD_TYPES),
+                "description": f"The {word} of the {entity} recorded in {table}.",
+            }
+        fields["created_at"] = {"type": "datetime", "description": "Row creation time."}
+        modules[module][table] = {
+            "description": f"Stores {entity} {rng.choice(FIELD_WORDS)} records for the {module} module.",
+            "fields": fields,
+        }
+        names[module].append(table)
+    for module, tables in modules.items():
+        with open(schema_dir / f"{module}.yaml", "w") as f:
+            yaml.dump(tables, f, sort_keys=False, Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper))
+
+
+def synthetic_questions(tables: Dict[str, Any], n: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    out = []
+    for table in rng.sample(sorted(tables), min(n, len(tables))):
+        words = table.split("_")
+        fields = [f for f in (tables[table].get("fields") or {}) if not f.endswith("_id") and f != "id"]
+        picked = " and ".join(f.replace("_", " ") for f in rng.sample(fields, min(2, len(fields))))
+        out.append(f"show {picked} for each {words[-1].rstrip('0123456789')} in {words[0]}")
+    return out
+
+
+def sql_corpus(tool: Any, tables: List[str], n: int, seed: int) -> List[str]:
+    """Valid SELECTs (single table, FK joins, CTEs, subqueries) plus rejected statements."""
+    rng = random.Random(seed)
+    schema = tool.get_schema()
+    out = []
+    for table in rng.sample(tables, min(n, len(tables))):
+        fields = list((schema.tables[table].get("fields") or {}))[:4] or ["*"]
+        out.append(f"SELECT {', '.join(fields)} FROM {table} WHERE {fields[0]} IS NOT NULL ORDER BY {fields[0]} DESC LIMIT 50")
+        neighbours = schema.join_graph.neighbors(table)
+        if neighbours:
+            other, (condition, _) = next(iter(neighbours.items()))
+            on = condition.replace(f"{table}.", "a.", 1).replace(f"{other}.", "b.", 1)
+            out.append(f"SELECT a.*, b.* FROM {table} a JOIN {other} b ON {on}")
+        out.append(rng.choice(EXTRA_SQL).format(a=table))
+    return out
+
+
+# ----------------------------
+# Stand-ins for the LLM and MySQL
+# ----------------------------
+class StubLLM:
+    """
+    AsyncOpenAI look-alike: answers every prompt with a SELECT over the first
+    table listed in it, after ``latency_ms`` of simulated model time. Batch
+    prompts (ask_db_batch) get that SELECT for each numbered request, as JSON.
+    """
+
+    _TABLE_RE = re.compile(r"^table (\w+)", re.MULTILINE)
+    _COL_RE = re.compile(r"^  (\w+) ", re.MULTILINE)
+    _REQUEST_RE = re.compile(r"^(\d+)\. ", re.MULTILINE)
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self.chat = types.SimpleNamespace(completions=self)
+
+    async def create(self, model: str, messages: List[Dict[str, str]], **kwargs: Any) -> Any:
+        self.calls += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000.0)
+        prompt = messages[0]["content"]
+        table_match = self._TABLE_RE.search(prompt)
+        if table_match is None:
+            sql = "SELECT 1"
+        else:
+            cols = self._COL_RE.findall(prompt[table_match.end():])[:3] or ["*"]
+            sql = f"SELECT {', '.join(cols)} FROM {table_match.group(1)} LIMIT 20"
+        if "User requests:" in prompt:
+            ids = self._REQUEST_RE.findall(prompt.split("User requests:", 1)[1])
+            content = json.dumps({"queries": [{"id": int(i), "sql": sql} for i in ids]})
+        else:
+            content = f"```sql\n{sql}\n```"
+        message = types.SimpleNamespace(content=content)
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=message)],
+            usage=types.SimpleNamespace(total_tokens=len(prompt) // 4),
+        )
+
+
+class SqliteCursor:
+    def __init__(self, owner: "SqliteConnection", dictionary: bool):
+        self._owner = owner
+        self._cursor = owner.db.cursor()
+        self._dictionary = dictionary
+        self.column_names: List[str] = []
+
+    def execute(self, query: str, params: Any = None) -> None:
+        try:
+            self._cursor.execute(query, params or ())
+        except sqlite3.OperationalError as e:
+            match = re.match(r"no such table: (\w+)", str(e))
+            if not match or not self._owner.create_table(match.group(1)):
+                raise
+            self._cursor.execute(query, params or ())
+        self.column_names = [d[0] for d in (self._cursor.description or [])]
+
+    def _row(self, row: Any) -> Any:
+        return dict(zip(self.column_names, row)) if self._dictionary else row
+
+    def fetchall(self) -> List[Any]:
+        return [self._row(r) for r in self._cursor.fetchall()]
+
+    def fetchmany(self, size: int) -> List[Any]:
+        return [self._row(r) for r in self._cursor.fetchmany(size)]
+
+    def fetchone(self) -> Any:
+        row = self._cursor.fetchone()
+        return None if row is None else self._row(row)
+
+    def close(self) -> None:
+        self._cursor.close()
+
+
+class SqliteConnection:
+    """
+    Just enough of a mysql.connector connection for ConnectionPool and
+    run_sql_query, backed by one shared in-memory SQLite database. Tables are
+    created and filled with ``rows`` synthetic rows the first time a query
+    touches them.
+    """
+
+    _ids = 0
+
+    def __init__(self, db: sqlite3.Connection, tables: Dict[str, Any], rows: int):
+        SqliteConnection._ids += 1
+        self.connection_id = SqliteConnection._ids
+        self.db = db
+        self.tables = tables
+        self.rows = rows
+
+    def create_table(self, table: str) -> bool:
+        info = self.tables.get(table)
+        if info is None:
+            return False
+        cols = list(info.get("fields") or {}) or ["id"]
+        self.db.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({", ".join(f"{chr(34)}{c}{chr(34)}" for c in cols)})')
+        placeholders = ", ".join("?" for _ in cols)
+        self.db.executemany(
+            f'INSERT INTO "{table}" VALUES ({placeholders})',
+            ([i if c in ("id",) or c.endswith("_id") else f"{c}-{i}" for c in cols] for i in range(1, self.rows + 1)),
+        )
+        return True
+
+    def cursor(self, dictionary: bool = False, buffered: bool = True) -> SqliteCursor:
+        return SqliteCursor(self, dictionary)
+
+    def ping(self, reconnect: bool = False) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+# ----------------------------
+# Runner
+# ----------------------------
+def configure_environment(workdir: pathlib.Path, schema_dir: pathlib.Path, embedding: str) -> None:
+    """Settings tool.py reads at import; the stand-ins make the DB/API values unused."""
+    os.environ.update({
+        "DB_HOST": "benchmark", "DB_USER": "benchmark", "DB_PASSWORD": "benchmark", "DB_NAME": "benchmark",
+        "OPENAI_API_KEY": "benchmark",
+        "SCHEMA_DIR": str(schema_dir),
+        "SCHEMA_SNAPSHOT": str(workdir / "schema_snapshot.pkl"),
+        "VECTOR_INDEX_DIR": str(workdir / "vector_index"),
+        "FEWSHOT_STORE": str(workdir / "fewshot_examples.db"),
+        "SCHEMA_WATCH_INTERVAL": "0",
+        "EMBEDDING_BACKEND": embedding,
+        "PLAN_GUARD": "off",
+        "DB_MAX_EXECUTION_MS": "0",
+    })
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = pathlib.Path(tempfile.mkdtemp(prefix="sqltool-bench-"))
+    schema_dir = workdir / "schemas"
+    schema_dir.mkdir()
+    if args.synthetic_tables:
+        prepare_synthetic_schema(schema_dir, args.synthetic_tables, args.seed)
+    else:
+        prepare_real_schema(schema_dir)
+    configure_environment(workdir, schema_dir, args.embedding)
+    modes = [m.strip() for m in args.retrieval_modes.split(",") if m.strip()] or ["bm25"]
+
+    sys.path.insert(0, str(ROOT))
+    import schema_snapshot
+    from llm_client import LLMClient
+    from sql_validator import analyze_sql
+
+    results: Dict[str, Any] = {}
+    try:
+        results["load_schema_descriptions"] = bench(schema_snapshot.load_schema_descriptions, [str(schema_dir)], repeat=args.load_repeat)
+        results["snapshot_build"] = bench(schema_snapshot.SchemaSnapshot.from_directory, [str(schema_dir)], repeat=args.load_repeat)
+        snapshot_path = os.environ["SCHEMA_SNAPSHOT"]
+        schema_snapshot.load_schema(str(schema_dir), snapshot_path)
+        results["snapshot_load"] = bench(lambda _: schema_snapshot.load_schema(str(schema_dir), snapshot_path), [None], repeat=args.load_repeat)
+
+        import tool
+        tool.get_schema()
+        tables = tool.get_schema().tables
+        questions = synthetic_questions(tables, len(QUESTIONS), args.seed) if args.synthetic_tables else list(QUESTIONS)
+        keywords = sorted({w for q in questions for w in q.split() if len(w) > 4})[:40]
+        sql = sql_corpus(tool, sorted(tables), args.sql_corpus, args.seed)
+
+        if any(m != "bm25" for m in modes):
+            results["vector_index_build"] = once(lambda: tool.get_retriever().warm())
+        for mode in modes:
+            tool.RETRIEVAL_MODE = mode
+            results[f"pick_relevant_tables[{mode}]"] = bench(tool.pick_relevant_tables, questions, repeat=args.repeat)
+        # Everything downstream retrieves with the last mode listed
+        results["search_schema"] = bench(tool.search_schema, keywords, repeat=args.repeat)
+
+        selections = [tool.pick_relevant_tables(q) for q in questions]
+        results["schema_subset_yaml"] = bench(tool.schema_subset_yaml, selections, repeat=args.repeat)
+        pairs = list(zip(selections, questions))
+        results["build_schema_context[compact]"] = bench(lambda p: tool.build_schema_context(p[0], p[1], tool.PROMPT_TOKEN_BUDGET), pairs, repeat=args.repeat)
+
+        results["validate_query[cold]"] = bench(tool.validate_query, sql, repeat=args.repeat, before=analyze_sql.cache_clear)
+        for q in sql:  # refill the parse cache emptied by the cold round
+            tool.validate_query(q)
+        results["validate_query[cached]"] = bench(tool.validate_query, sql, repeat=args.repeat)
+        results["ensure_limit"] = bench(lambda q: tool.ensure_limit(q, 200), sql, repeat=args.repeat)
+        results["with_max_execution_time"] = bench(lambda q: tool.with_max_execution_time(q, 30000), sql, repeat=args.repeat)
+
+        # End to end: stub LLM + SQLite behind the real pool, executor and caches
+        llm = StubLLM(args.llm_latency_ms)
+        tool.LLM = LLMClient(async_client=llm)
+        db = sqlite3.connect(":memory:", check_same_thread=False)
+        tool.DB_POOL._connect = lambda **_: SqliteConnection(db, tables, args.rows)
+
+        def clear_caches() -> None:
+            tool.SQL_CACHE.clear()
+            tool.RESULT_CACHE.clear()
+            tool.EXAMPLES.clear()
+
+        bench_async(tool.ask_db, questions[:3], before=clear_caches)  # warm-up: tables, pool
+        results["ask_db[cold]"] = bench_async(tool.ask_db, questions, repeat=args.repeat, before=clear_caches)
+        # The cold rounds clear the caches before every call; refill them.
+        failures = [q for q in questions if "error" in asyncio.run(tool.ask_db(q))]
+        results["ask_db[cached]"] = bench_async(tool.ask_db, questions, repeat=args.repeat)
+        batches = [questions[k:k + args.batch_size] for k in range(0, len(questions), args.batch_size)]
+        results["ask_db_batch[cold]"] = bench_async(tool.ask_db_batch, batches, repeat=args.repeat, before=clear_caches)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    schema = tool.get_schema()
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+            "schema": {
+                "files": len(schema.sources),
+                "tables": len(schema.tables),
+                "fields": sum(len(t.get("fields") or {}) for t in schema.tables.values()),
+                "join_edges": schema.join_graph.stats()["edges"],
+            },
+            "corpus": {"questions": len(questions), "sql": len(sql), "keywords": len(keywords)},
+            "llm_calls": llm.calls,
+            "ask_db_failures": failures,
+        },
+        "results": results,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold_pct: float) -> List[str]:
+    """Print p50 changes against ``baseline``; return the metrics slower by more than ``threshold_pct``."""
+    regressions = []
+    print(f"{'metric':44} {'base p50':>12} {'now p50':>12} {'change':>9}")
+    for name, now in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base.get("p50_us"):
+            print(f"{name:44} {'-':>12} {now['p50_us']:>12.1f} {'new':>9}")
+            continue
+        change = (now["p50_us"] - base["p50_us"]) / base["p50_us"] * 100
+        flag = ""
+        if threshold_pct and change > threshold_pct:
+            regressions.append(name)
+            flag = "  <-- regression"
+        print(f"{name:44} {base['p50_us']:>12.1f} {now['p50_us']:>12.1f} {change:>+8.1f}%{flag}")
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark schema loading, retrieval, validation and ask_db.")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file to write")
+    parser.add_argument("--compare", default="", help="earlier results JSON to compare against")
+    parser.add_argument("--fail-on-regression", type=float, default=0.0,
+                        help="exit non-zero if any p50 is this many percent slower than --compare")
+    parser.add_argument("--synthetic-tables", type=int, default=0,
+                        help="benchmark a generated schema with this many tables instead of the bundled YAML")
+    parser.add_argument("--retrieval-modes", default="bm25,vector,hybrid",
+                        help="comma-separated modes to time; ask_db uses the last one "
+                             "(use bm25 alone for very large synthetic schemas without numpy)")
+    parser.add_argument("--embedding", default="hashing", help="EMBEDDING_BACKEND spec for the vector modes")
+    parser.add_argument("--repeat", type=int, default=5, help="rounds over the corpus per component")
+    parser.add_argument("--load-repeat", type=int, default=3, help="rounds for schema loading")
+    parser.add_argument("--sql-corpus", type=int, default=40, help="tables sampled to build the SQL corpus")
+    parser.add_argument("--rows", type=int, default=200, help="rows per SQLite stand-in table")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated model latency")
+    parser.add_argument("--batch-size", type=int, default=10, help="questions per ask_db_batch call")
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    report = run(args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    meta = report["meta"]["schema"]
+    print(f"Schema: {meta['files']} file(s), {meta['tables']} tables, {meta['fields']} fields")
+    for name, stats in report["results"].items():
+        print(f"{name:44} p50 {stats['p50_us']:>12.1f}us  p95 {stats['p95_us']:>12.1f}us  n={stats['n']}")
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.fail_on_regression)
+        if regressions:
+            print(f"Regressions over {args.fail_on_regression}%: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+import sys
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, Optional
+
+import mysql.connector
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection could be checked out within the acquire timeout."""
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn: Any):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of MySQL connections.
+
+    Connections are created lazily up to ``max_size``. On checkout an idle
+    connection is recycled if it has been idle longer than ``max_idle_seconds``
+    or alive longer than ``max_lifetime_seconds``, and pinged otherwise so that
+    connections dropped by the server are replaced transparently.
+    """
+
+    def __init__(
+        self,
+        config: Dict[str, Any],
+        max_size: int = 5,
+        acquire_timeout: float = 10.0,
+        max_idle_seconds: float = 300.0,
+        max_lifetime_seconds: float = 1800.0,
+        connect: Callable[..., Any] = mysql.connector.connect,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be >= 1")
+        self._config = dict(config)
+        self._connect = connect
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_idle_seconds = max_idle_seconds
+        self.max_lifetime_seconds = max_lifetime_seconds
+
+        self._idle: Deque[_PooledConnection] = deque()
+        self._in_use: Dict[int, _PooledConnection] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_ms": 0.0,
+            "timeouts": 0,
+            "creates": 0,
+            "create_failures": 0,
+            "recycled_idle": 0,
+            "recycled_stale": 0,
+            "health_check_failures": 0,
+            "discarded": 0,
+        }
+
+    # ----------------------------
+    # Internals
+    # ----------------------------
+    def _size(self) -> int:
+        return len(self._idle) + len(self._in_use)
+
+    def _close_quietly(self, conn: Any) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_expired(self, item: _PooledConnection) -> bool:
+        """Age checks only; call with ``self._cond`` held."""
+        now = time.monotonic()
+        if now - item.created_at > self.max_lifetime_seconds:
+            self._stats["recycled_stale"] += 1
+            return True
+        if now - item.last_used > self.max_idle_seconds:
+            self._stats["recycled_idle"] += 1
+            return True
+        return False
+
+    def _ping(self, item: _PooledConnection) -> bool:
+        """Round trip to the server; call without ``self._cond`` so other checkouts are not held up."""
+        try:
+            item.conn.ping(reconnect=False)
+            return True
+        except Exception:
+            with self._cond:
+                self._stats["health_check_failures"] += 1
+            return False
+
+    def _create(self) -> _PooledConnection:
+        try:
+            conn = self._connect(**self._config)
+        except Exception:
+            with self._cond:
+                self._stats["create_failures"] += 1
+            raise
+        with self._cond:
+            self._stats["creates"] += 1
+        return _PooledConnection(conn)
+
+    # ----------------------------
+    # Public API
+    # ----------------------------
+    @property
+    def config(self) -> Dict[str, Any]:
+        """Connection arguments, e.g. for a side connection that kills a query."""
+        return dict(self._config)
+
+    def acquire(self) -> Any:
+        """
+        Check out a healthy connection, creating one if the pool has room.
+        Blocks up to ``acquire_timeout`` seconds when the pool is exhausted.
+        """
+        deadline = time.monotonic() + self.acquire_timeout
+        waited_since: Optional[float] = None
+
+        while True:
+            item: Optional[_PooledConnection] = None
+            expired = []
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("Connection pool is closed.")
+
+                    while self._idle:
+                        candidate = self._idle.pop()
+                        if self._is_expired(candidate):
+                            expired.append(candidate.conn)
+                            continue
+                        # Counted as in use while it is pinged outside the lock.
+                        item = candidate
+                        self._in_use[id(item.conn)] = item
+                        break
+                    if item is not None:
+                        break
+
+                    if self._size() < self.max_size:
+                        # Reserve the slot before releasing the lock to connect.
+                        placeholder = _PooledConnection(None)
+                        self._in_use[id(placeholder)] = placeholder
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        for conn in expired:
+                            self._close_quietly(conn)
+                        raise PoolTimeoutError(
+                            f"Timed out after {self.acquire_timeout}s waiting for a database connection."
+                        )
+                    if waited_since is None:
+                        waited_since = time.monotonic()
+                        self._stats["waits"] += 1
+                    self._cond.wait(remaining)
+
+            for conn in expired:
+                self._close_quietly(conn)
+            if item is None:
+                break
+            if self._ping(item):
+                with self._cond:
+                    self._checkout(item, waited_since)
+                return item.conn
+            self._close_quietly(item.conn)
+            with self._cond:
+                self._in_use.pop(id(item.conn), None)
+                self._cond.notify()
+
+        try:
+            item = self._create()
+        finally:
+            with self._cond:
+                self._in_use.pop(id(placeholder), None)
+                self._cond.notify()
+
+        with self._cond:
+            self._checkout(item, waited_since)
+        return item.conn
+
+    def _checkout(self, item: _PooledConnection, waited_since: Optional[float]) -> None:
+        self._in_use[id(item.conn)] = item
+        self._stats["checkouts"] += 1
+        if waited_since is not None:
+            self._stats["wait_time_ms"] += (time.monotonic() - waited_since) * 1000
+
+    def release(self, conn: Any, discard: bool = False) -> None:
+        """
+        Return a connection to the pool. Pass ``discard=True`` when the
+        connection is known to be broken so that it is closed instead.
+        """
+        with self._cond:
+            item = self._in_use.get(id(conn))
+            if item is None:
+                return
+            keep = not (discard or self._closed)
+        # Reset or close outside the lock: either is a round trip to the server,
+        # and the connection still counts towards the pool size meanwhile.
+        reset_failed = False
+        if keep:
+            try:
+                # Drop any open transaction snapshot so the next user sees fresh data.
+                conn.rollback()
+            except Exception:
+                keep, reset_failed = False, True
+        if not keep:
+            self._close_quietly(conn)
+        close_late = False
+        with self._cond:
+            if self._in_use.pop(id(conn), None) is None:
+                return
+            if discard or reset_failed:
+                self._stats["discarded"] += 1
+            if keep:
+                if self._closed:
+                    close_late = True
+                else:
+                    item.last_used = time.monotonic()
+                    self._idle.append(item)
+            self._cond.notify()
+        if close_late:
+            # The pool was closed while the connection was being reset.
+            self._close_quietly(conn)
+
+    def ensure_idle(self) -> None:
+        """
+        Open one connection ahead of demand if none is idle and the pool has
+        room, so a later checkout does not pay the connect handshake.
+        """
+        with self._cond:
+            if self._closed or self._idle or self._size() >= self.max_size:
+                return
+            placeholder = _PooledConnection(None)
+            self._in_use[id(placeholder)] = placeholder
+        try:
+            item = self._create()
+        except Exception:
+            # The reserved slot is free again; wake a checkout waiting on a full pool.
+            with self._cond:
+                self._in_use.pop(id(placeholder), None)
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._in_use.pop(id(placeholder), None)
+            self._idle.append(item)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """
+        Context manager around acquire/release. Connections that raised a
+        driver-level connectivity error are discarded rather than reused.
+        """
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                **self._stats,
+                "wait_time_ms": round(self._stats["wait_time_ms"], 3),
+                "max_size": self.max_size,
+                "size": self._size(),
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._close_quietly(self._idle.pop().conn)
+            self._cond.notify_all()
+        if self._in_use:
+            print(
+                f"[PoolWarning] Pool closed with {len(self._in_use)} connection(s) still checked out.",
+                file=sys.stderr,
+            )
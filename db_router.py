@@ -0,0 +1,297 @@
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import mysql.connector
+import yaml
+
+from db_pool import ConnectionPool, PoolTimeoutError
+
+
+class RoutingError(Exception):
+    """Raised when a query's tables live in different databases, or none of their servers can take it."""
+
+
+class Target:
+    """One MySQL server of a cluster (its primary or a replica) with its own pool."""
+
+    def __init__(self, name: str, role: str, pool: ConnectionPool):
+        self.name = name
+        self.role = role
+        self.pool = pool
+        self.lag: Optional[float] = None  # seconds behind the primary; None = unknown / not replicating
+        self.checked_at = 0.0
+        self.down_until = 0.0
+        self.failures = 0
+        self.last_error = ""
+        self._check_lock = threading.Lock()
+
+    def stats(self) -> Dict[str, Any]:
+        pool = self.pool.stats()
+        return {
+            "role": self.role,
+            "lag_seconds": self.lag,
+            "down": self.down_until > time.monotonic(),
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "pool": {k: pool[k] for k in ("size", "idle", "in_use", "max_size", "checkouts", "timeouts")},
+        }
+
+
+class Cluster:
+    """A database: its primary and the read replicas of that primary."""
+
+    def __init__(self, name: str, primary: Target, replicas: Sequence[Target] = ()):
+        self.name = name
+        self.primary = primary
+        self.replicas = list(replicas)
+
+
+def replication_lag(conn: Any) -> Optional[float]:
+    """
+    Seconds_Behind_Source of the replica ``conn`` is connected to, or None
+    when replication is stopped or the server is not a replica. Needs the
+    REPLICATION CLIENT privilege.
+    """
+    cursor = conn.cursor(dictionary=True)
+    try:
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except mysql.connector.Error:  # MySQL < 8.0.22
+            cursor.execute("SHOW SLAVE STATUS")
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    if not rows:
+        return None
+    lag = rows[0].get("Seconds_Behind_Source", rows[0].get("Seconds_Behind_Master"))
+    return float(lag) if lag is not None else None
+
+
+class DbRouter:
+    """
+    Sends each read-only query to the database that owns its tables and,
+    within that database, to a replica no more than ``max_lag`` seconds
+    behind its primary.
+
+    Tables map to schema modules (the YAML file they are described in) and
+    modules map to clusters; unmapped modules use ``default``. A query whose
+    tables span several clusters cannot run anywhere and raises
+    RoutingError. Replica lag is re-read at most every ``lag_check_interval``
+    seconds; replicas that fail to connect are skipped for ``down_seconds``.
+    When no replica qualifies the primary serves the read, unless
+    ``primary_fallback`` is off.
+    """
+
+    def __init__(
+        self,
+        clusters: Dict[str, Cluster],
+        modules: Optional[Dict[str, str]] = None,
+        default: str = "default",
+        max_lag: float = 30.0,
+        lag_check_interval: float = 5.0,
+        down_seconds: float = 30.0,
+        primary_fallback: bool = True,
+    ):
+        if default not in clusters:
+            raise ValueError(f"Default database '{default}' is not configured")
+        unknown = sorted({c for c in (modules or {}).values() if c not in clusters})
+        if unknown:
+            raise ValueError(f"Modules routed to unknown database(s): {', '.join(unknown)}")
+        self.clusters = clusters
+        self.modules = dict(modules or {})
+        self.default = default
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.down_seconds = down_seconds
+        self.primary_fallback = primary_fallback
+        self._lock = threading.Lock()
+        self._stats = {"primary_reads": 0, "replica_reads": 0, "failovers": 0, "cross_database": 0}
+
+    # ----------------------------
+    # Internals
+    # ----------------------------
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def _refresh_lag(self, target: Target) -> None:
+        # One thread measures; the others use the last known value meanwhile.
+        if not target._check_lock.acquire(blocking=False):
+            return
+        try:
+            with target.pool.connection() as conn:
+                target.lag = replication_lag(conn)
+        except (PoolTimeoutError, mysql.connector.Error) as e:
+            target.lag = None
+            self.mark_failed(target, e)
+        finally:
+            target.checked_at = time.monotonic()
+            target._check_lock.release()
+
+    def _usable(self, target: Target, now: float) -> bool:
+        if target.down_until > now:
+            return False
+        if self.max_lag <= 0:
+            return True
+        if now - target.checked_at >= self.lag_check_interval:
+            self._refresh_lag(target)
+        return target.lag is not None and target.lag <= self.max_lag and target.down_until <= time.monotonic()
+
+    # ----------------------------
+    # Public API (blocking; call from a worker thread)
+    # ----------------------------
+    def cluster_for(self, modules: Iterable[str]) -> Cluster:
+        names = {self.modules.get(m, self.default) for m in modules} or {self.default}
+        if len(names) > 1:
+            self._count("cross_database")
+            raise RoutingError(f"Query uses tables from different databases ({', '.join(sorted(names))}).")
+        return self.clusters[names.pop()]
+
+    def pick(self, cluster: Cluster, exclude: Sequence[Target] = ()) -> Target:
+        """The least busy usable replica of ``cluster``, else its primary."""
+        now = time.monotonic()
+        replicas = [r for r in cluster.replicas if r not in exclude and self._usable(r, now)]
+        if replicas:
+            random.shuffle(replicas)
+            return min(replicas, key=lambda r: (r.pool.stats()["in_use"], r.lag or 0.0))
+        if cluster.primary not in exclude and (self.primary_fallback or not cluster.replicas):
+            return cluster.primary
+        raise RoutingError(f"No replica of database '{cluster.name}' is within {self.max_lag}s of its primary.")
+
+    def target_for(self, modules: Iterable[str]) -> Target:
+        """Where a query over tables of ``modules`` should run (no failover: for callers with their own pool logic)."""
+        cluster = self.cluster_for(modules)
+        target = self.pick(cluster)
+        self._count("primary_reads" if target is cluster.primary else "replica_reads")
+        return target
+
+    def acquire(self, modules: Iterable[str]) -> Tuple[Target, Any]:
+        """
+        Check out a connection for a query over tables of ``modules``,
+        failing over to the next replica (then the primary) when a replica
+        cannot be reached. Release it with ``target.pool.release(conn)``.
+        """
+        cluster = self.cluster_for(modules)
+        tried: List[Target] = []
+        while True:
+            target = self.pick(cluster, tried)
+            try:
+                conn = target.pool.acquire()
+            except (PoolTimeoutError, mysql.connector.Error) as e:
+                if target is cluster.primary:
+                    raise
+                if isinstance(e, mysql.connector.Error):
+                    self.mark_failed(target, e)
+                tried.append(target)
+                self._count("failovers")
+                continue
+            self._count("primary_reads" if target is cluster.primary else "replica_reads")
+            return target, conn
+
+    def mark_failed(self, target: Target, error: Exception) -> None:
+        """Take a replica out of rotation for ``down_seconds`` (primaries always stay in)."""
+        target.failures += 1
+        target.last_error = str(error)
+        if target.role == "replica":
+            target.down_until = time.monotonic() + self.down_seconds
+            print(f"[RoutingWarning] Replica {target.name} unavailable for {self.down_seconds}s: {error}", file=sys.stderr)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._stats)
+        return {
+            **counters,
+            "max_lag_seconds": self.max_lag,
+            "default": self.default,
+            "modules": dict(self.modules),
+            "databases": {
+                name: {t.name: t.stats() for t in [c.primary, *c.replicas]}
+                for name, c in self.clusters.items()
+            },
+        }
+
+    def close(self) -> None:
+        for cluster in self.clusters.values():
+            for target in [cluster.primary, *cluster.replicas]:
+                target.pool.close()
+
+
+# ----------------------------
+# Configuration
+# ----------------------------
+def _server_config(base: Dict[str, Any], entry: Any) -> Dict[str, Any]:
+    """Connection arguments: ``base`` overridden by ``entry`` ("host[:port]" or a mapping)."""
+    if isinstance(entry, str):
+        host, _, port = entry.strip().partition(":")
+        entry = {"host": host, **({"port": int(port)} if port else {})}
+    config = {**base, **{k: v for k, v in (entry or {}).items() if k not in ("password_env", "name")}}
+    if (entry or {}).get("password_env"):
+        config["password"] = os.environ.get(entry["password_env"], "")
+    return config
+
+
+def _target_name(cluster: str, role: str, config: Dict[str, Any], entry: Any) -> str:
+    if isinstance(entry, dict) and entry.get("name"):
+        return str(entry["name"])
+    return f"{cluster}/{role}@{config.get('host')}:{config.get('port', 3306)}"
+
+
+def build_router(
+    base_config: Dict[str, Any],
+    make_pool: Callable[[Dict[str, Any]], ConnectionPool],
+    default_pool: ConnectionPool,
+    routes_file: str = "",
+    replicas: Sequence[str] = (),
+    **options: Any,
+) -> DbRouter:
+    """
+    Router from ``routes_file`` (YAML) or, without one, a single "default"
+    database served by ``default_pool`` with the ``replicas`` given as
+    "host[:port]". The file looks like::
+
+        default: main
+        databases:
+          main:                        # primary: base_config (DB_HOST, ...)
+            replicas: [main-replica-1, "main-replica-2:3307"]
+          finance:
+            primary: {host: fin-db, database: finance, password_env: FIN_DB_PASSWORD}
+            replicas:
+              - {host: fin-replica-1}
+        modules:                       # schema module (YAML file stem) -> database
+          accounts: finance
+
+    Unspecified connection arguments come from ``base_config``; every
+    server gets its own pool from ``make_pool(config)``.
+    """
+    if not routes_file:
+        primary = Target(_target_name("default", "primary", base_config, None), "primary", default_pool)
+        replica_targets = []
+        for entry in replicas:
+            config = _server_config(base_config, entry)
+            replica_targets.append(Target(_target_name("default", "replica", config, entry), "replica", make_pool(config)))
+        return DbRouter({"default": Cluster("default", primary, replica_targets)}, **options)
+
+    with open(routes_file, "r") as f:
+        spec = yaml.safe_load(f) or {}
+    databases = spec.get("databases") or {}
+    default = str(spec.get("default") or next(iter(databases), "default"))
+    clusters: Dict[str, Cluster] = {}
+    for name, db in {default: {}, **databases}.items():
+        db = db or {}
+        primary_entry = db.get("primary")
+        primary_config = _server_config(base_config, primary_entry)
+        pool = default_pool if primary_entry is None and name == default else make_pool(primary_config)
+        primary = Target(_target_name(name, "primary", primary_config, primary_entry), "primary", pool)
+        replica_targets = []
+        for entry in db.get("replicas") or []:
+            config = _server_config(primary_config, entry)
+            replica_targets.append(Target(_target_name(name, "replica", config, entry), "replica", make_pool(config)))
+        clusters[name] = Cluster(name, primary, replica_targets)
+    for key in ("max_lag", "lag_check_interval", "down_seconds", "primary_fallback"):
+        if key in spec:
+            options[key] = spec[key]
+    return DbRouter(clusters, modules={str(m): str(c) for m, c in (spec.get("modules") or {}).items()}, default=default, **options)
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import threading
+import time
+from typing import Iterable, Optional, Set
+
+
+class DescriptionCache:
+    """
+    Content-addressed on-disk cache of AI-written schema descriptions.
+
+    Each entry lives in its own file named by the SHA-256 of
+    ``(table, column, type, version)`` where ``version`` identifies the model
+    and prompt, so changing either naturally misses the old entries. Writes go
+    to a temp file in the same directory followed by ``os.replace``, which is
+    atomic, so concurrent writers (threads or separate runs) can never leave a
+    torn entry behind; the last writer wins with an equally valid value.
+    """
+
+    def __init__(self, directory: str, version: str):
+        self.directory = pathlib.Path(directory)
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        # get() is called from the generator's worker threads
+        self._lock = threading.Lock()
+
+    def key(self, table: str, column: str = "", col_type: str = "") -> str:
+        payload = json.dumps([table, column, col_type, self.version], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, table: str, column: str = "", col_type: str = "") -> Optional[str]:
+        path = self._path(self.key(table, column, col_type))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                description = json.load(f)["description"]
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return description
+
+    def put(self, table: str, column: str, col_type: str, description: str) -> None:
+        key = self.key(table, column, col_type)
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "table": table,
+            "column": column,
+            "type": col_type,
+            "version": self.version,
+            "description": description,
+            "created_at": int(time.time()),
+        }
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{key[:8]}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except Exception:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def prune(self, live_keys: Iterable[str]) -> int:
+        """
+        Delete every entry whose key is not in ``live_keys`` (tables/columns
+        that no longer exist, changed types, or an older model/prompt version),
+        plus temp files older than an hour left behind by interrupted writers.
+        Returns the number of files removed.
+        """
+        keep: Set[str] = set(live_keys)
+        removed = 0
+        if not self.directory.is_dir():
+            return 0
+        tmp_cutoff = time.time() - 3600
+        for path in self.directory.glob("*/*"):
+            if path.suffix == ".tmp":
+                try:
+                    stale = path.stat().st_mtime < tmp_cutoff
+                except OSError:
+                    continue
+            else:
+                stale = path.stem not in keep
+            if stale:
+                try:
+                    path.unlink()
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
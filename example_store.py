@@ -0,0 +1,404 @@
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from query_cache import normalize_question
+from schema_index import B, K1, tokenize
+from vector_index import reciprocal_rank_fusion
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python scoring fallback
+    np = None
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS examples (
+    signature TEXT PRIMARY KEY,
+    question TEXT NOT NULL,
+    sql TEXT NOT NULL,
+    tables TEXT NOT NULL,
+    fingerprints TEXT NOT NULL,
+    embedder TEXT,
+    vector TEXT,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+"""
+
+
+def question_signature(question: str) -> str:
+    """
+    Identity of a question for dedup: its content terms (case, punctuation,
+    stopwords, plurals and word order ignored). Too loose to reuse SQL on:
+    "shipments from Delhi to Mumbai" and "from Mumbai to Delhi" share it;
+    ``exact`` compares normalize_question forms instead.
+    """
+    return " ".join(sorted(tokenize(question)))
+
+
+def table_fingerprint(meta: Dict[str, Any]) -> str:
+    """
+    Hash of a table's columns and their types. Descriptions are left out, so
+    re-wording the YAML does not invalidate the examples using the table.
+    """
+    fields = (meta or {}).get("fields") or {}
+    columns = sorted((str(name).lower(), str((info or {}).get("type", "")).lower()) for name, info in fields.items())
+    return hashlib.blake2b(json.dumps(columns).encode(), digest_size=8).hexdigest()
+
+
+def _normalize(vec: Sequence[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+class Example:
+    """One verified question -> SQL pair."""
+
+    __slots__ = ("signature", "question", "sql", "tables", "fingerprints", "terms", "vector", "hits", "last_used")
+
+    def __init__(
+        self,
+        signature: str,
+        question: str,
+        sql: str,
+        tables: List[str],
+        fingerprints: Dict[str, str],
+        vector: Optional[List[float]] = None,
+        hits: int = 0,
+        last_used: float = 0.0,
+    ):
+        self.signature = signature
+        self.question = question
+        self.sql = sql
+        self.tables = tables
+        self.fingerprints = fingerprints
+        self.terms = tokenize(question)
+        self.vector = vector
+        self.hits = hits
+        self.last_used = last_used
+
+    def to_dict(self, similarity: float) -> Dict[str, Any]:
+        return {"question": self.question, "sql": self.sql, "similarity": round(similarity, 3)}
+
+
+class ExampleStore:
+    """
+    Question -> SQL pairs that ran successfully, kept in a SQLite file shared
+    by all server processes and searched in memory.
+
+    ``exact`` finds a pair whose question is the same once case, whitespace
+    and trailing punctuation are normalised (word order and stopwords kept),
+    so its SQL can be reused without asking the model.
+    ``similar`` ranks the pairs by BM25 over their questions and, with an
+    ``embedder``, by cosine similarity of the question embeddings (fused by
+    reciprocal rank), for use as few-shot examples.
+
+    Questions are deduplicated by signature (the latest SQL wins). Each pair
+    remembers a fingerprint of the columns of the tables it reads;
+    ``sync_schema`` drops pairs whose tables were removed or changed. Beyond
+    ``max_examples`` the least recently used pairs are evicted. Other
+    processes' additions are picked up every ``reload_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_examples: int = 500,
+        embedder: Any = None,
+        min_similarity: float = 0.3,
+        reload_interval: float = 5.0,
+    ):
+        self.path = path
+        self.max_examples = max_examples
+        self.embedder = embedder
+        self.min_similarity = min_similarity
+        self.reload_interval = reload_interval
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = 0
+        self._lock = threading.RLock()
+        self._examples: Dict[str, Example] = {}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)  # term -> {signature: tf}
+        self._by_question: Dict[str, str] = {}  # normalize_question(question) -> signature
+        self._avg_len = 0.0
+        self._matrix: Any = None  # numpy rows, aligned with self._order
+        self._order: List[str] = []
+        self._loaded_version: Optional[int] = None
+        self._checked_at = 0.0
+        self._schema_version = ""
+        self._touched: Dict[str, Tuple[int, float]] = {}  # signature -> (uses, last_used), not yet persisted
+        self._stats = {"exact_hits": 0, "lookups": 0, "injected": 0, "added": 0, "evicted": 0, "invalidated": 0}
+
+    # ----------------------------
+    # Internals (call with self._lock held)
+    # ----------------------------
+    def _db(self) -> sqlite3.Connection:
+        # One connection per process: a forked worker must not reuse its parent's.
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn, self._pid = conn, os.getpid()
+            self._loaded_version = None
+        return self._conn
+
+    def _embedder_name(self) -> Optional[str]:
+        return getattr(self.embedder, "name", type(self.embedder).__name__) if self.embedder is not None else None
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        return [_normalize(v) for v in self.embedder.embed(texts)]
+
+    def _maybe_reload(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and self._loaded_version is not None and now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        db = self._db()
+        self._flush_touched(db)
+        version = db.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._loaded_version and not force:
+            return
+        name = self._embedder_name()
+        examples: Dict[str, Example] = {}
+        missing: List[Example] = []
+        for sig, question, sql, tables, fingerprints, embedder, vector, hits, last_used in db.execute(
+            "SELECT signature, question, sql, tables, fingerprints, embedder, vector, hits, last_used FROM examples"
+        ):
+            ex = Example(sig, question, sql, json.loads(tables), json.loads(fingerprints), None, hits, last_used)
+            if name is not None:
+                if embedder == name and vector:
+                    ex.vector = json.loads(vector)
+                else:
+                    missing.append(ex)
+            examples[sig] = ex
+        if missing:  # stored with another embedder (or none): re-embed and keep for next time
+            for ex, vec in zip(missing, self._embed([ex.question for ex in missing])):
+                ex.vector = vec
+            db.executemany(
+                "UPDATE examples SET embedder = ?, vector = ? WHERE signature = ?",
+                [(name, json.dumps(ex.vector), ex.signature) for ex in missing],
+            )
+        self._examples = examples
+        self._reindex()
+        self._loaded_version = db.execute("PRAGMA data_version").fetchone()[0]
+
+    def _reindex(self) -> None:
+        self._postings = defaultdict(dict)
+        self._by_question = {normalize_question(ex.question): sig for sig, ex in self._examples.items()}
+        for sig, ex in self._examples.items():
+            for term, tf in Counter(ex.terms).items():
+                self._postings[term][sig] = tf
+        self._avg_len = sum(len(ex.terms) for ex in self._examples.values()) / max(1, len(self._examples))
+        self._order = list(self._examples)
+        self._matrix = None
+        if np is not None and self.embedder is not None and self._order:
+            self._matrix = np.asarray([self._examples[s].vector for s in self._order], dtype=np.float32)
+
+    def _flush_touched(self, db: sqlite3.Connection) -> None:
+        if not self._touched:
+            return
+        touched, self._touched = self._touched, {}
+        db.executemany(
+            "UPDATE examples SET hits = hits + ?, last_used = MAX(last_used, ?) WHERE signature = ?",
+            [(uses, last_used, sig) for sig, (uses, last_used) in touched.items()],
+        )
+
+    def _touch(self, examples: Iterable[Example]) -> None:
+        now = time.time()
+        for ex in examples:
+            ex.hits += 1
+            ex.last_used = now
+            uses, _ = self._touched.get(ex.signature, (0, 0.0))
+            self._touched[ex.signature] = (uses + 1, now)
+
+    def _bm25(self, terms: List[str]) -> Dict[str, float]:
+        n = len(self._examples)
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(terms):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1.0 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for sig, tf in postings.items():
+                length = len(self._examples[sig].terms)
+                scores[sig] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / (self._avg_len or 1.0)))
+        return scores
+
+    def _cosines(self, query_vec: List[float]) -> Dict[str, float]:
+        if self._matrix is not None:
+            return dict(zip(self._order, (float(s) for s in self._matrix @ np.asarray(query_vec, dtype=np.float32))))
+        # Only the query's non-zero dimensions contribute (cheap for sparse hashing vectors).
+        nonzero = [(d, q) for d, q in enumerate(query_vec) if q]
+        return {
+            sig: sum(ex.vector[d] * q for d, q in nonzero)
+            for sig, ex in self._examples.items() if ex.vector is not None
+        }
+
+    # ----------------------------
+    # Public API
+    # ----------------------------
+    def sync_schema(self, version: str, tables: Dict[str, Any]) -> int:
+        """
+        Drop the pairs whose tables no longer exist or whose columns changed
+        in schema ``version`` (a no-op until the version changes). Returns the
+        number dropped.
+        """
+        with self._lock:
+            if version == self._schema_version:
+                return 0
+            self._maybe_reload(force=True)
+            current = {t.lower(): table_fingerprint(meta) for t, meta in tables.items()}
+            stale = [
+                sig for sig, ex in self._examples.items()
+                if any(current.get(t) != fp for t, fp in ex.fingerprints.items())
+            ]
+            if stale:
+                db = self._db()
+                db.executemany("DELETE FROM examples WHERE signature = ?", [(s,) for s in stale])
+                for sig in stale:
+                    del self._examples[sig]
+                self._reindex()
+                self._stats["invalidated"] += len(stale)
+            self._schema_version = version
+            return len(stale)
+
+    def exact(self, question: str) -> Optional[Dict[str, Any]]:
+        """The stored pair for the same question (see normalize_question), or None."""
+        key = normalize_question(question)
+        if not key:
+            return None
+        with self._lock:
+            self._maybe_reload()
+            ex = self._examples.get(self._by_question.get(key, ""))
+            if ex is None:
+                return None
+            self._touch([ex])
+            self._stats["exact_hits"] += 1
+            return {**ex.to_dict(1.0), "tables": list(ex.tables)}
+
+    def similar(self, question: str, k: int = 3) -> List[Dict[str, Any]]:
+        """
+        Up to ``k`` stored pairs most similar to ``question``, best first,
+        each with a distinct SQL. ``similarity`` is the cosine of the question
+        embeddings, or the share of common terms without an embedder.
+        """
+        terms = tokenize(question)
+        query_vec = self._embed([question])[0] if self.embedder is not None else None
+        with self._lock:
+            self._maybe_reload()
+            self._stats["lookups"] += 1
+            if not self._examples or k <= 0:
+                return []
+            lexical = self._bm25(terms)
+            rankings = [sorted(lexical, key=lambda s: (-lexical[s], s))]
+            cosines: Dict[str, float] = {}
+            if query_vec is not None:
+                cosines = self._cosines(query_vec)
+                semantic = [s for s in cosines if cosines[s] >= self.min_similarity]
+                rankings.append(sorted(semantic, key=lambda s: (-cosines[s], s)))
+            query_terms = set(terms)
+            picked: List[Example] = []
+            similarities: List[float] = []
+            seen_sql = set()
+            for sig in reciprocal_rank_fusion(rankings):
+                ex = self._examples[sig]
+                if ex.sql in seen_sql:
+                    continue
+                if sig in cosines:
+                    similarity = cosines[sig]
+                else:
+                    example_terms = set(ex.terms)
+                    similarity = len(query_terms & example_terms) / max(1, len(query_terms | example_terms))
+                    if similarity < self.min_similarity:
+                        continue
+                seen_sql.add(ex.sql)
+                picked.append(ex)
+                similarities.append(similarity)
+                if len(picked) >= k:
+                    break
+            self._touch(picked)
+            self._stats["injected"] += len(picked)
+            return [ex.to_dict(s) for ex, s in zip(picked, similarities)]
+
+    def add(self, question: str, sql: str, tables: Sequence[str], schema_tables: Dict[str, Any]) -> bool:
+        """
+        Remember that ``sql`` answered ``question``. ``tables`` are the ones
+        the SQL reads; their column fingerprints come from ``schema_tables``.
+        Returns False for questions without content terms.
+        """
+        sig = question_signature(question)
+        if not sig:
+            return False
+        lowered = {t.lower(): meta for t, meta in schema_tables.items()}
+        fingerprints = {t.lower(): table_fingerprint(lowered.get(t.lower(), {})) for t in tables}
+        name = self._embedder_name()
+        vector = self._embed([question])[0] if self.embedder is not None else None
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            self._flush_touched(db)
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute(
+                    "INSERT INTO examples (signature, question, sql, tables, fingerprints, embedder, vector, hits, "
+                    "created_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?) "
+                    "ON CONFLICT(signature) DO UPDATE SET question = excluded.question, sql = excluded.sql, "
+                    "tables = excluded.tables, fingerprints = excluded.fingerprints, embedder = excluded.embedder, "
+                    "vector = excluded.vector, last_used = excluded.last_used",
+                    (sig, question.strip(), sql, json.dumps(list(tables)), json.dumps(fingerprints),
+                     name, json.dumps(vector) if vector is not None else None, now, now),
+                )
+                overflow = db.execute("SELECT COUNT(*) FROM examples").fetchone()[0] - self.max_examples
+                if overflow > 0:
+                    db.execute(
+                        "DELETE FROM examples WHERE signature IN "
+                        "(SELECT signature FROM examples ORDER BY last_used LIMIT ?)",
+                        (overflow,),
+                    )
+                    self._stats["evicted"] += overflow
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            self._stats["added"] += 1
+            self._maybe_reload(force=True)
+            return True
+
+    def discard(self, question: str) -> None:
+        """Forget the pair for ``question`` (e.g. its SQL stopped working)."""
+        sig = question_signature(question)
+        with self._lock:
+            self._db().execute("DELETE FROM examples WHERE signature = ?", (sig,))
+            if self._examples.pop(sig, None) is not None:
+                self._reindex()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db().execute("DELETE FROM examples")
+            self._touched.clear()
+            self._examples = {}
+            self._reindex()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "path": self.path,
+                "examples": len(self._examples),
+                "max_examples": self.max_examples,
+                "embedder": self._embedder_name(),
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._flush_touched(self._conn)
+                self._conn.close()
+            self._conn = None
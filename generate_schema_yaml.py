@@ -1,13 +1,40 @@
 import pymysql
 import yaml
 import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-import requests
+
+from description_cache import DescriptionCache
+from llm_client import LLMClient
+from query_plan import with_max_execution_time
+from result_format import encode_value
 
 # ------------------------
 # CONFIGURATION
 # ------------------------
 SCHEMA_FILE = 'schema.yaml'
+# Column fingerprints of the last run, used by --incremental
+STATE_FILE = 'schema_state.json'
+DEFAULT_WORKERS = 8
+DEFAULT_REQUESTS_PER_MINUTE = 120
+# AI descriptions are cached on disk by (table, column, type, model + prompt version).
+# Bump PROMPT_VERSION whenever the description prompt changes.
+DESCRIPTION_CACHE_DIR = '.description_cache'
+MODEL = "gpt-4o-mini"
+PROMPT_VERSION = "v1"
+# Column statistics (--stats): rows sampled per table, top values kept per
+# low-cardinality column, and the wall-clock budget (seconds) for one table
+STATS_SAMPLE_ROWS = 10000
+STATS_TOP_K = 5
+STATS_TABLE_BUDGET = 10.0
+# Columns with more distinct values than this (in the sample) get no top values
+STATS_MAX_CATEGORIES = 50
+STATS_VALUE_CHARS = 40
 
 # Load environment variables
 load_dotenv()
@@ -20,6 +47,7 @@ try:
     DB_PASSWORD = os.getenv("DB_PASSWORD")
     DB_NAME = os.getenv("DB_NAME")
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")
 
     missing_vars = [
         var for var, val in {
@@ -43,113 +71,530 @@ try:
 except Exception as e:
     raise RuntimeError(f"[RuntimeError] Failed to configure DB: {e}")
 
+# ------------------------
+# Rate Limiting
+# ------------------------
+class RateLimiter:
+    """Thread-safe token bucket: at most `per_minute` acquisitions per minute, with small bursts."""
+
+    def __init__(self, per_minute, burst=None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst or max(1, per_minute // 10))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
 # ------------------------
 # AI Description Generator
 # ------------------------
-def generate_ai_description(prompt):
-    """Generate description using OpenAI API, fallback to generic text if API key missing."""
+# Shared keep-alive connections, 429 backoff and coalescing of identical prompts
+_llm = LLMClient(api_key=OPENAI_API_KEY or "", base_url=OPENAI_BASE_URL, model=MODEL, max_concurrency=DEFAULT_WORKERS)
+_rate_limiter = RateLimiter(DEFAULT_REQUESTS_PER_MINUTE)
+_description_cache = DescriptionCache(DESCRIPTION_CACHE_DIR, f"{MODEL}:{PROMPT_VERSION}")
+
+def _fallback_description(prompt):
+    return f"{prompt} (auto-generated description)"
+
+def generate_table_descriptions(table, table_comment, columns):
+    """
+    Describe a table and all of its uncommented columns. Descriptions already
+    in the description cache are reused; everything else is requested with a
+    single LLM call and written back to the cache.
+    Returns (table_description, {field_name: description}) covering only the
+    items that had no comment in the database.
+    """
+    missing_fields = [c for c in columns if not c["comment"]]
+    table_desc = None
+    if not table_comment and _description_cache:
+        table_desc = _description_cache.get(table)
+    field_descs = {}
+    if _description_cache:
+        for c in missing_fields:
+            cached = _description_cache.get(table, c["name"], c["type"])
+            if cached is not None:
+                field_descs[c["name"]] = cached
+
+    need_table = not table_comment and table_desc is None
+    wanted_fields = [c for c in missing_fields if c["name"] not in field_descs]
+    if not need_table and not wanted_fields:
+        return table_desc, field_descs
+
+    fallback_table = _fallback_description(f"database table named '{table}'")
+    fallback_fields = {
+        c["name"]: _fallback_description(f"field '{c['name']}' of type '{c['type']}' in table '{table}'")
+        for c in wanted_fields
+    }
     if not OPENAI_API_KEY:
-        return f"{prompt} (auto-generated description)"
+        return (fallback_table if need_table else table_desc), {**field_descs, **fallback_fields}
 
+    column_lines = "\n".join(
+        f"- {c['name']} {c['type']}" + (f" -- {c['comment']}" if c["comment"] else "")
+        for c in columns
+    )
+    wanted = ", ".join(c["name"] for c in wanted_fields) or "(none)"
+    prompt = (
+        f"Table `{table}`" + (f" ({table_comment})" if table_comment else "") + f" has columns:\n{column_lines}\n\n"
+        "Return a JSON object with keys \"table\" (a short description of the table"
+        + ("" if need_table else ", or null")
+        + ") and \"fields\" (an object mapping each of these column names to a short description): "
+        + wanted
+    )
     try:
-        headers = {
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": "gpt-4o-mini",  # Fast, cost-effective model
-            "messages": [
-                {"role": "system", "content": "You are a helpful assistant that writes short, clear descriptions for database tables and fields."},
-                {"role": "user", "content": f"Write a short description for: {prompt}"}
-            ],
-            "max_tokens": 50
-        }
+        messages = [
+            {"role": "system", "content": "You are a helpful assistant that writes short, clear descriptions for database tables and fields."},
+            {"role": "user", "content": prompt}
+        ]
+        _rate_limiter.acquire()
+        response = _llm.chat_sync(
+            messages,
+            response_format={"type": "json_object"},
+            max_tokens=80 + 60 * len(wanted_fields),
+        )
+        parsed = json.loads(response.choices[0].message.content)
+    except Exception as e:
+        print(f"⚠️ AI description generation failed for `{table}`: {e}")
+        return (fallback_table if need_table else table_desc), {**field_descs, **fallback_fields}
+
+    # Only real model output is cached; fallbacks are retried on the next run.
+    generated = parsed.get("fields") or {}
+    if need_table:
+        table_desc = str(parsed.get("table") or "").strip()
+        if table_desc:
+            _cache_put(table, "", "", table_desc)
+        else:
+            table_desc = fallback_table
+    for c in wanted_fields:
+        desc = str(generated.get(c["name"]) or "").strip()
+        if desc:
+            _cache_put(table, c["name"], c["type"], desc)
+            field_descs[c["name"]] = desc
+        else:
+            field_descs[c["name"]] = fallback_fields[c["name"]]
+    return table_desc, field_descs
 
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=data)
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"].strip()
+def _cache_put(table, column, col_type, description):
+    if not _description_cache:
+        return
+    try:
+        _description_cache.put(table, column, col_type, description)
     except Exception as e:
-        print(f"⚠️ AI description generation failed: {e}")
-        return f"{prompt} (auto-generated description)"
+        print(f"⚠️ Could not cache description for `{table}.{column}`: {e}")
 
 # ------------------------
 # DB Functions
 # ------------------------
-def get_all_tables(cursor):
-    cursor.execute("SHOW TABLES;")
-    key = list(cursor.fetchone().keys())[0]
-    cursor.execute("SHOW TABLES;")
-    return [row[key] for row in cursor.fetchall()]
+def fetch_schema_metadata(cursor, db_name):
+    """
+    Read every base table and column of `db_name` with one information_schema
+    query. Returns {table: {"comment": str, "columns": [{"name", "type", "comment", "key"}]}}.
+    """
+    cursor.execute(
+        """
+        SELECT c.TABLE_NAME AS table_name,
+               t.TABLE_COMMENT AS table_comment,
+               c.COLUMN_NAME AS column_name,
+               c.COLUMN_TYPE AS column_type,
+               c.COLUMN_COMMENT AS column_comment,
+               c.COLUMN_KEY AS column_key
+        FROM information_schema.COLUMNS c
+        JOIN information_schema.TABLES t
+          ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME
+        WHERE c.TABLE_SCHEMA = %s AND t.TABLE_TYPE = 'BASE TABLE'
+        ORDER BY c.TABLE_NAME, c.ORDINAL_POSITION
+        """,
+        (db_name,),
+    )
+    tables = {}
+    for row in cursor.fetchall():
+        table = tables.setdefault(row["table_name"], {"comment": row["table_comment"] or "", "columns": []})
+        table["columns"].append({
+            "name": row["column_name"],
+            "type": row["column_type"],
+            "comment": row["column_comment"] or "",
+            "key": row["column_key"] or "",
+        })
+    return tables
 
-def get_table_description(cursor, table_name):
-    cursor.execute(f"SHOW TABLE STATUS LIKE %s;", (table_name,))
-    result = cursor.fetchone()
-    return result.get("Comment", "") if result else ""
+def fetch_foreign_keys(cursor, db_name):
+    """
+    Declared single-column foreign keys of `db_name` as
+    {table: {column: "referenced_table.referenced_column"}}.
+    """
+    cursor.execute(
+        """
+        SELECT TABLE_NAME AS table_name,
+               COLUMN_NAME AS column_name,
+               REFERENCED_TABLE_NAME AS ref_table,
+               REFERENCED_COLUMN_NAME AS ref_column
+        FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = %s
+          AND REFERENCED_TABLE_SCHEMA = %s
+          AND REFERENCED_TABLE_NAME IS NOT NULL
+        """,
+        (db_name, db_name),
+    )
+    foreign_keys = {}
+    for row in cursor.fetchall():
+        foreign_keys.setdefault(row["table_name"], {})[row["column_name"]] = f"{row['ref_table']}.{row['ref_column']}"
+    return foreign_keys
 
-def get_table_columns(cursor, table_name):
-    cursor.execute(f"SHOW FULL COLUMNS FROM `{table_name}`;")
-    return cursor.fetchall()
+def apply_foreign_keys(table_data, references):
+    """Set (or clear) each field's `references` from the live foreign keys."""
+    for name, field in table_data.get("fields", {}).items():
+        if name in references:
+            field["references"] = references[name]
+        else:
+            field.pop("references", None)
+    return table_data
+
+def live_cache_keys(cache, metadata):
+    """Cache keys that the current database schema can still hit."""
+    keys = set()
+    for table, meta in metadata.items():
+        keys.add(cache.key(table))
+        for column in meta["columns"]:
+            keys.add(cache.key(table, column["name"], column["type"]))
+    return keys
+
+def table_fingerprint(meta):
+    """Hash of a table's comment and (name, type, comment) of every column."""
+    payload = json.dumps(
+        [meta["comment"], [[c["name"], c["type"], c["comment"]] for c in meta["columns"]]],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 # ------------------------
-# Main Schema Generation
+# Column Statistics
 # ------------------------
-def generate_schema(connection):
-    schema = {}
+# Types whose values say nothing useful to the model, or are too costly to scan
+_NO_STATS_TYPES = ("tinyblob", "blob", "mediumblob", "longblob", "tinytext", "text", "mediumtext", "longtext",
+                   "json", "geometry", "point", "linestring", "polygon", "binary", "varbinary", "bit")
+# Types where min/max ground the format (dates) or range of the values
+_RANGE_TYPES = ("tinyint", "smallint", "mediumint", "int", "bigint", "decimal", "float", "double",
+                "date", "datetime", "timestamp", "time", "year")
+# Ranges say more than top values for these
+_TEMPORAL_TYPES = ("date", "datetime", "timestamp", "time", "year")
+# MySQL error for a statement stopped by MAX_EXECUTION_TIME
+_ER_QUERY_TIMEOUT = 3024
 
-    with connection.cursor() as cursor:
-        tables = get_all_tables(cursor)
+def _quote(name):
+    return "`" + name.replace("`", "``") + "`"
 
-        for table in tables:
-            print(f"📦 Processing table: {table}")
-            try:
-                table_desc = get_table_description(cursor, table)
-                if not table_desc:
-                    table_desc = generate_ai_description(f"database table named '{table}'")
+def _base_type(col_type):
+    return col_type.lower().split("(")[0].split(" ")[0]
+
+def _stats_value(value):
+    value = encode_value(value)
+    if isinstance(value, str) and len(value) > STATS_VALUE_CHARS:
+        return value[:STATS_VALUE_CHARS] + "..."
+    return value
+
+def _sample(table, meta, column_names, sample_rows):
+    """
+    Derived table with the given columns of the newest `sample_rows` rows
+    (by a single-column primary key), or of the first ones without one.
+    """
+    keys = [c["name"] for c in meta["columns"] if c.get("key") == "PRI"]
+    order = f" ORDER BY {_quote(keys[0])} DESC" if len(keys) == 1 else ""
+    cols = ", ".join(_quote(c) for c in column_names)
+    return f"(SELECT {cols} FROM {_quote(table)}{order} LIMIT {int(sample_rows)}) AS s"
+
+def _execute_within(cursor, sql, deadline):
+    """Run `sql` capped at the time left until `deadline`; False if there is none left."""
+    remaining_ms = int((deadline - time.monotonic()) * 1000)
+    if remaining_ms < 50:
+        return False
+    try:
+        cursor.execute(with_max_execution_time(sql, remaining_ms))
+        return True
+    except pymysql.err.OperationalError as e:
+        if e.args and e.args[0] == _ER_QUERY_TIMEOUT:
+            return False
+        raise
 
-                columns = get_table_columns(cursor, table)
+def collect_table_stats(table, meta, sample_rows=STATS_SAMPLE_ROWS, top_k=STATS_TOP_K, budget=STATS_TABLE_BUDGET):
+    """
+    Per-column statistics over a bounded sample of `table`: distinct count,
+    null ratio, min/max for numeric and temporal columns, and the `top_k`
+    most frequent values of low-cardinality columns. One aggregate query
+    covers all columns, then one GROUP BY per categorical column; every
+    statement gets the remaining share of `budget` seconds as its
+    MAX_EXECUTION_TIME, and columns not reached in time are left out.
+    Returns ({column: stats}, {"sampled_rows", "complete", "seconds"}).
+    """
+    started = time.monotonic()
+    deadline = started + budget
+    columns = [c for c in meta["columns"] if _base_type(c["type"]) not in _NO_STATS_TYPES]
+    stats = {}
+    summary = {"sampled_rows": 0, "complete": False}
+    if not columns:
+        summary["complete"] = True
+        return stats, summary
 
-                table_data = {
-                    "description": table_desc,
-                    "fields": {}
+    connection = pymysql.connect(**DB_CONFIG, read_timeout=int(budget) + 5)
+    try:
+        with connection.cursor() as cursor:
+            parts = ["COUNT(*) AS n"]
+            for i, c in enumerate(columns):
+                q = _quote(c["name"])
+                parts += [f"COUNT(DISTINCT {q}) AS d{i}", f"SUM({q} IS NULL) AS z{i}"]
+                if _base_type(c["type"]) in _RANGE_TYPES:
+                    parts += [f"MIN({q}) AS lo{i}", f"MAX({q}) AS hi{i}"]
+            source = _sample(table, meta, [c["name"] for c in columns], sample_rows)
+            if not _execute_within(cursor, f"SELECT {', '.join(parts)} FROM {source}", deadline):
+                return stats, summary
+            row = cursor.fetchone()
+            sampled = int(row["n"] or 0)
+            summary["sampled_rows"] = sampled
+            for i, c in enumerate(columns):
+                entry = {
+                    "distinct": int(row[f"d{i}"] or 0),
+                    "null_ratio": round(int(row[f"z{i}"] or 0) / sampled, 3) if sampled else 0.0,
                 }
+                if row.get(f"lo{i}") is not None:
+                    entry["min"] = _stats_value(row[f"lo{i}"])
+                    entry["max"] = _stats_value(row[f"hi{i}"])
+                stats[c["name"]] = entry
+
+            for c in columns:
+                entry = stats[c["name"]]
+                if (c.get("key") == "PRI" or _base_type(c["type"]) in _TEMPORAL_TYPES
+                        or not 0 < entry["distinct"] <= STATS_MAX_CATEGORIES):
+                    continue
+                q = _quote(c["name"])
+                sql = (
+                    f"SELECT {q} AS v, COUNT(*) AS n FROM {_sample(table, meta, [c['name']], sample_rows)} "
+                    f"WHERE {q} IS NOT NULL GROUP BY {q} ORDER BY n DESC LIMIT {int(top_k)}"
+                )
+                if not _execute_within(cursor, sql, deadline):
+                    return stats, summary
+                entry["top"] = [_stats_value(r["v"]) for r in cursor.fetchall()]
+        summary["complete"] = True
+        return stats, summary
+    finally:
+        summary["seconds"] = round(time.monotonic() - started, 2)
+        connection.close()
 
-                for column in columns:
-                    field_name = column["Field"]
-                    field_type = column["Type"]
-                    field_comment = column["Comment"] or ""
-                    if not field_comment:
-                        field_comment = generate_ai_description(
-                            f"field '{field_name}' of type '{field_type}' in table '{table}'"
-                        )
+def collect_column_stats(metadata, tables, workers=DEFAULT_WORKERS, **options):
+    """Run collect_table_stats over `tables` in parallel. Returns {table: (stats, summary)}."""
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(collect_table_stats, table, metadata[table], **options): table for table in tables}
+        for future in as_completed(futures):
+            table = futures[future]
+            try:
+                stats, summary = future.result()
+            except Exception as e:
+                print(f"⚠️ Column stats failed for `{table}`: {e}")
+                continue
+            results[table] = (stats, summary)
+            if not summary["complete"]:
+                print(f"⏱️ Stats budget ran out for `{table}` ({len(stats)} column(s) done)")
+    return results
+
+def apply_column_stats(table_data, stats, summary):
+    """Store `stats` on each field and the sampling summary on the table."""
+    for name, field in table_data.get("fields", {}).items():
+        if name in stats:
+            field["stats"] = stats[name]
+        else:
+            field.pop("stats", None)
+    table_data["stats"] = {
+        "sampled_rows": summary["sampled_rows"],
+        "complete": summary["complete"],
+        "collected_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    return table_data
 
-                    table_data["fields"][field_name] = {
-                        "type": field_type,
-                        "description": field_comment
-                    }
+def carry_over_stats(table_data, previous):
+    """Keep the previous run's stats for fields whose type did not change."""
+    previous_fields = (previous or {}).get("fields") or {}
+    for name, field in table_data.get("fields", {}).items():
+        old = previous_fields.get(name) or {}
+        if "stats" in old and old.get("type") == field.get("type"):
+            field["stats"] = old["stats"]
+    if previous and "stats" in previous:
+        table_data["stats"] = previous["stats"]
+    return table_data
+
+# ------------------------
+# Main Schema Generation
+# ------------------------
+def build_table_entry(table, meta):
+    table_desc, field_descs = generate_table_descriptions(table, meta["comment"], meta["columns"])
+    table_data = {
+        "description": meta["comment"] or table_desc,
+        "fields": {}
+    }
+    for column in meta["columns"]:
+        table_data["fields"][column["name"]] = {
+            "type": column["type"],
+            "description": column["comment"] or field_descs.get(column["name"], ""),
+        }
+    return table_data
 
-                schema[table] = table_data
+def generate_schema(connection, previous_schema=None, previous_state=None, workers=DEFAULT_WORKERS,
+                    collect_stats=False, stats_options=None):
+    """
+    Build the schema mapping. Tables whose fingerprint matches `previous_state`
+    are copied from `previous_schema`; the rest are described concurrently.
+    With `collect_stats`, column statistics are gathered for every table
+    (see collect_table_stats; `stats_options` are its keyword arguments),
+    otherwise each table keeps the stats of the previous run.
+    Returns (schema, state).
+    """
+    previous_schema = previous_schema or {}
+    previous_state = previous_state or {}
 
+    with connection.cursor() as cursor:
+        metadata = fetch_schema_metadata(cursor, DB_NAME)
+        foreign_keys = fetch_foreign_keys(cursor, DB_NAME)
+
+    state = {table: table_fingerprint(meta) for table, meta in metadata.items()}
+    entries = {}
+    todo = []
+    for table in metadata:
+        if table in previous_schema and previous_state.get(table) == state[table]:
+            entries[table] = previous_schema[table]
+        else:
+            todo.append(table)
+
+    print(f"📦 {len(metadata)} tables found, {len(todo)} to (re)generate, {len(entries)} unchanged")
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(build_table_entry, table, metadata[table]): table for table in todo}
+        for future in as_completed(futures):
+            table = futures[future]
+            try:
+                entries[table] = future.result()
+                print(f"📦 Processed table: {table}")
             except Exception as e:
                 print(f"❌ Error processing table `{table}`: {e}")
+                state.pop(table, None)
+
+    if collect_stats:
+        options = stats_options or {}
+        print(f"📊 Collecting column stats for {len(entries)} tables")
+        column_stats = collect_column_stats(metadata, [t for t in metadata if t in entries], **options)
+        for table, (stats, summary) in column_stats.items():
+            apply_column_stats(entries[table], stats, summary)
+    else:
+        for table in todo:
+            if table in entries:
+                carry_over_stats(entries[table], previous_schema.get(table))
 
-    return schema
+    # Foreign keys are not part of the fingerprint, so refresh them on every
+    # entry, including ones carried over unchanged (used by join_graph.py).
+    schema = {
+        table: apply_foreign_keys(entries[table], foreign_keys.get(table, {}))
+        for table in metadata if table in entries
+    }
+    return schema, state
 
 # ------------------------
 # File Writer
 # ------------------------
-def write_schema_to_file(schema):
-    with open(SCHEMA_FILE, 'w') as f:
+def load_previous_run(schema_file, state_file):
+    try:
+        with open(schema_file, 'r') as f:
+            schema = yaml.safe_load(f) or {}
+        with open(state_file, 'r') as f:
+            state = json.load(f)
+        return schema, state
+    except FileNotFoundError:
+        return {}, {}
+    except Exception as e:
+        print(f"⚠️ Ignoring previous run, full regeneration: {e}")
+        return {}, {}
+
+def write_schema_to_file(schema, state=None, schema_file=SCHEMA_FILE, state_file=STATE_FILE):
+    with open(schema_file, 'w') as f:
         yaml.dump(schema, f, sort_keys=False, default_flow_style=False)
-    print(f"\n✅ YAML file `{SCHEMA_FILE}` updated successfully.")
+    if state is not None:
+        with open(state_file, 'w') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+    print(f"\n✅ YAML file `{schema_file}` updated successfully.")
 
 # ------------------------
 # Main Runner
 # ------------------------
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a schema YAML with AI descriptions from MySQL.")
+    parser.add_argument("--output", default=SCHEMA_FILE, help="YAML file to write")
+    parser.add_argument("--state-file", default=STATE_FILE, help="fingerprint file used by --incremental")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only regenerate tables whose columns changed since the last run")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="concurrent description requests")
+    parser.add_argument("--rpm", type=int, default=DEFAULT_REQUESTS_PER_MINUTE,
+                        help="max OpenAI requests per minute")
+    parser.add_argument("--cache-dir", default=DESCRIPTION_CACHE_DIR,
+                        help="directory of the AI description cache")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="ignore the description cache and ask the model for everything")
+    parser.add_argument("--stats", action="store_true",
+                        help="collect per-column statistics (distinct count, nulls, min/max, top values)")
+    parser.add_argument("--stats-sample-rows", type=int, default=STATS_SAMPLE_ROWS,
+                        help="rows sampled per table for column statistics")
+    parser.add_argument("--stats-top-k", type=int, default=STATS_TOP_K,
+                        help="most frequent values kept per low-cardinality column")
+    parser.add_argument("--stats-table-budget", type=float, default=STATS_TABLE_BUDGET,
+                        help="seconds allowed per table for column statistics")
+    parser.add_argument("--stats-workers", type=int, default=0,
+                        help="tables sampled concurrently (default: --workers)")
+    parser.add_argument("--prune-cache", action="store_true",
+                        help="delete cached descriptions for tables/columns no longer in the database, then exit")
+    return parser.parse_args()
+
 def main():
+    global _llm, _rate_limiter, _description_cache
+    args = parse_args()
+    _rate_limiter = RateLimiter(args.rpm)
+    _llm = LLMClient(api_key=OPENAI_API_KEY or "", base_url=OPENAI_BASE_URL, model=MODEL, max_concurrency=args.workers)
+    _description_cache = None if args.no_cache else DescriptionCache(args.cache_dir, f"{MODEL}:{PROMPT_VERSION}")
     try:
+        if args.prune_cache:
+            connection = pymysql.connect(**DB_CONFIG)
+            with connection.cursor() as cursor:
+                metadata = fetch_schema_metadata(cursor, DB_NAME)
+            cache = DescriptionCache(args.cache_dir, f"{MODEL}:{PROMPT_VERSION}")
+            removed = cache.prune(live_cache_keys(cache, metadata))
+            print(f"🧹 Removed {removed} stale cached description(s) from `{args.cache_dir}`.")
+            return
+
+        previous_schema, previous_state = ({}, {})
+        if args.incremental:
+            previous_schema, previous_state = load_previous_run(args.output, args.state_file)
         connection = pymysql.connect(**DB_CONFIG)
-        schema = generate_schema(connection)
-        write_schema_to_file(schema)
+        stats_options = {
+            "workers": args.stats_workers or args.workers,
+            "sample_rows": args.stats_sample_rows,
+            "top_k": args.stats_top_k,
+            "budget": args.stats_table_budget,
+        }
+        schema, state = generate_schema(
+            connection, previous_schema, previous_state, workers=args.workers,
+            collect_stats=args.stats, stats_options=stats_options,
+        )
+        write_schema_to_file(schema, state, args.output, args.state_file)
+        if _description_cache:
+            print(f"🗄️ Description cache: {_description_cache.hits} hit(s), {_description_cache.misses} miss(es)")
+        llm_stats = _llm.stats()
+        if llm_stats["requests"]:
+            print(f"🤖 LLM: {llm_stats['requests']} request(s), {llm_stats['retries']} retried, "
+                  f"{llm_stats['rate_limited']} rate-limited, {llm_stats['coalesced']} coalesced")
     except Exception as e:
         print(f"❌ Error: {e}")
     finally:
@@ -157,4 +602,4 @@ def main():
             connection.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
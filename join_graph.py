@@ -0,0 +1,171 @@
+import heapq
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Edge costs: declared foreign keys are preferred over name-based guesses.
+FK_WEIGHT = 1.0
+NAMING_WEIGHT = 1.5
+
+
+def _singular(name: str) -> str:
+    if name.endswith("ies"):
+        return name[:-3] + "y"
+    if name.endswith("s") and not name.endswith("ss"):
+        return name[:-1]
+    return name
+
+
+def primary_key(table: str, fields: Dict[str, Any]) -> Optional[str]:
+    """
+    ``id`` or ``<table>_id`` by convention, else a leading ``*_id`` column
+    (e.g. ``transaction_id`` in ``product_transactions``).
+    """
+    for candidate in ("id", f"{_singular(table)}_id", f"{table}_id"):
+        if candidate in fields:
+            return candidate
+    first = next(iter(fields), None)
+    if first is not None and first.endswith("_id") and _singular(table).endswith(first[:-3]):
+        return first
+    return None
+
+
+def _prefix(table: str) -> str:
+    return table.split("_", 1)[0]
+
+
+class JoinGraph:
+    """
+    Undirected graph of joinable tables over a flat ``table -> {fields}``
+    mapping. Edges come from declared foreign keys (a field's ``references:
+    other_table.column``, written by generate_schema_yaml.py) and from naming
+    conventions (``client_id`` -> ``clients``/``client``/``<module>_client``).
+    Built once per schema snapshot and pickled with it.
+    """
+
+    def __init__(self, tables: Dict[str, Dict[str, Any]]):
+        # table -> neighbour -> (join condition, weight)
+        self.edges: Dict[str, Dict[str, Tuple[str, float]]] = defaultdict(dict)
+        self.fk_edges = 0
+        self.naming_edges = 0
+
+        fields_of = {t: (info.get("fields") or {}) for t, info in tables.items() if isinstance(info, dict)}
+        pks = {t: primary_key(t, f) for t, f in fields_of.items()}
+
+        # name key -> tables it may refer to: "client" -> clients, crm_client, ...
+        by_key: Dict[str, List[str]] = defaultdict(list)
+        for t in fields_of:
+            keys = {t, _singular(t)}
+            if "_" in t:
+                tail = t.split("_", 1)[1]
+                keys.update((tail, _singular(tail)))
+            for k in keys:
+                by_key[k].append(t)
+
+        for table, fields in fields_of.items():
+            for col, meta in fields.items():
+                ref = meta.get("references") if isinstance(meta, dict) else None
+                if ref and "." in str(ref):
+                    other, other_col = str(ref).split(".", 1)
+                    if other in fields_of and other != table and self._add(table, col, other, other_col, FK_WEIGHT):
+                        self.fk_edges += 1
+                    continue
+                if not col.endswith("_id") or col == pks[table]:
+                    continue
+                other = self._resolve(col[:-3], table, by_key)
+                if other is not None and pks[other] and self._add(table, col, other, pks[other], NAMING_WEIGHT):
+                    self.naming_edges += 1
+        self.edges = dict(self.edges)
+
+    @staticmethod
+    def _resolve(base: str, table: str, by_key: Dict[str, List[str]]) -> Optional[str]:
+        """Table a ``<base>_id`` column of ``table`` most plausibly points at."""
+        candidates = [t for t in dict.fromkeys(by_key.get(base, []) + by_key.get(_singular(base), [])) if t != table]
+        if len(candidates) <= 1:
+            return candidates[0] if candidates else None
+        exact = [t for t in candidates if t == base or _singular(t) == base]
+        if len(exact) == 1:
+            return exact[0]
+        same_module = [t for t in candidates if _prefix(t) == _prefix(table)]
+        if len(same_module) == 1:
+            return same_module[0]
+        return None
+
+    def _add(self, table: str, col: str, other: str, other_col: str, weight: float) -> bool:
+        """Add or cheapen the ``table``-``other`` edge; True if the pair is new."""
+        known = self.edges[table].get(other)
+        if known is not None and known[1] <= weight:
+            return False
+        condition = f"{table}.{col} = {other}.{other_col}"
+        self.edges[table][other] = self.edges[other][table] = (condition, weight)
+        return known is None
+
+    def neighbors(self, table: str) -> Dict[str, Tuple[str, float]]:
+        return self.edges.get(table, {})
+
+    def shortest_path(self, sources: Iterable[str], target: str, max_hops: int = 3) -> Optional[List[str]]:
+        """
+        Cheapest path from ``target`` to the nearest of ``sources`` (at most
+        ``max_hops`` edges), as ``[target, ..., source]``; None if unreachable.
+        """
+        goals = set(sources)
+        if target in goals:
+            return [target]
+        best = {target: 0.0}
+        prev: Dict[str, str] = {}
+        heap = [(0.0, 0, target)]
+        while heap:
+            cost, hops, node = heapq.heappop(heap)
+            if node in goals:
+                path = [node]
+                while path[-1] != target:
+                    path.append(prev[path[-1]])
+                return path[::-1]
+            if cost > best.get(node, float("inf")) or hops >= max_hops:
+                continue
+            for nxt, (_, weight) in self.neighbors(node).items():
+                c = cost + weight
+                if c < best.get(nxt, float("inf")):
+                    best[nxt] = c
+                    prev[nxt] = node
+                    heapq.heappush(heap, (c, hops + 1, nxt))
+        return None
+
+    def connect(self, tables: List[str], max_hops: int = 3, max_bridges: int = 3) -> List[str]:
+        """
+        ``tables`` plus the intermediate tables on the shortest paths that
+        join each of them to the ones before it (greedy Steiner tree, in rank
+        order). At most ``max_bridges`` tables are added; tables that cannot
+        be reached stay in the list unconnected.
+        """
+        tree: List[str] = []
+        bridges: List[str] = []
+        for table in tables:
+            if tree and len(bridges) < max_bridges:
+                path = self.shortest_path(tree + bridges, table, max_hops=max_hops)
+                if path:
+                    extra = [t for t in path[1:-1] if t not in tables and t not in bridges]
+                    if len(bridges) + len(extra) <= max_bridges:
+                        bridges.extend(extra)
+            tree.append(table)
+        return tree + bridges
+
+    def join_hints(self, tables: Iterable[str]) -> List[str]:
+        """Join conditions between every pair of adjacent tables in ``tables``."""
+        selected = list(dict.fromkeys(tables))
+        chosen = set(selected)
+        hints = []
+        seen = set()
+        for table in selected:
+            for other, (condition, _) in self.neighbors(table).items():
+                if other in chosen and condition not in seen:
+                    seen.add(condition)
+                    hints.append(condition)
+        return hints
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "tables": len(self.edges),
+            "edges": sum(len(n) for n in self.edges.values()) // 2,
+            "fk_edges": self.fk_edges,
+            "naming_edges": self.naming_edges,
+        }
@@ -0,0 +1,322 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+try:  # HTTP/2 needs the h2 package (pip install "httpx[http2]")
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except Exception:  # pragma: no cover - optional dependency
+    HTTP2_AVAILABLE = False
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+# Worth another attempt after a pause; everything else fails immediately.
+_RETRYABLE = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Server-requested delay (seconds) from a Retry-After header, if any."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class LLMClient:
+    """
+    One long-lived OpenAI client pair (async for the MCP tools, sync for the
+    schema scripts) over pooled keep-alive HTTP connections, HTTP/2 when
+    ``h2`` is installed. On top of the SDK:
+
+    - at most ``max_concurrency`` requests in flight per client,
+    - retries with exponential backoff and jitter on 429s, 5xx and
+      connection errors, honouring ``Retry-After``,
+    - single-flight: concurrent calls with identical model, messages and
+      parameters share one request and its response.
+
+    ``base_url`` points the client at any OpenAI-compatible endpoint (a
+    proxy, a local mock); ``async_client`` / ``sync_client`` replace the SDK
+    clients entirely, e.g. with stubs.
+    """
+
+    def __init__(
+        self,
+        api_key: str = "",
+        base_url: str = "",
+        model: str = DEFAULT_MODEL,
+        timeout: float = 60.0,
+        max_concurrency: int = 8,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        http2: bool = True,
+        max_connections: int = 20,
+        keepalive_expiry: float = 60.0,
+        async_client: Any = None,
+        sync_client: Any = None,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url or None
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._async_client = async_client
+        self._sync_client = sync_client
+        self._owns_async = async_client is None
+        self._owns_sync = sync_client is None
+        self._lock = threading.Lock()
+        # asyncio primitives belong to one event loop; keep them per loop
+        self._loop_state: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[asyncio.Semaphore, Dict[str, asyncio.Future]]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._sync_slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._sync_inflight: Dict[str, Future] = {}
+        self._stats = {
+            "requests": 0,
+            "coalesced": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "errors": 0,
+            "in_flight": 0,
+        }
+
+    # ----------------------------
+    # SDK clients
+    # ----------------------------
+    @property
+    def async_client(self) -> Any:
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    self._async_client = AsyncOpenAI(
+                        api_key=self.api_key or None,
+                        base_url=self.base_url,
+                        timeout=self.timeout,
+                        max_retries=0,  # retried here, under the concurrency limit
+                        http_client=httpx.AsyncClient(http2=self.http2, limits=self._limits, timeout=self.timeout),
+                    )
+        return self._async_client
+
+    @property
+    def sync_client(self) -> Any:
+        if self._sync_client is None:
+            with self._lock:
+                if self._sync_client is None:
+                    self._sync_client = OpenAI(
+                        api_key=self.api_key or None,
+                        base_url=self.base_url,
+                        timeout=self.timeout,
+                        max_retries=0,
+                        http_client=httpx.Client(http2=self.http2, limits=self._limits, timeout=self.timeout),
+                    )
+        return self._sync_client
+
+    # ----------------------------
+    # Internals
+    # ----------------------------
+    def _key(self, kind: str, payload: Dict[str, Any]) -> str:
+        raw = json.dumps([kind, self.base_url, payload], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _delay(self, attempt: int, error: Exception) -> float:
+        server = _retry_after(error)
+        if server is not None:
+            return min(server, self.backoff_max)
+        return min(self.backoff_max, self.backoff_base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+    def _count(self, name: str, delta: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += delta
+
+    def _state(self) -> Tuple[asyncio.Semaphore, Dict[str, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        state = self._loop_state.get(loop)
+        if state is None:
+            state = self._loop_state[loop] = (asyncio.Semaphore(self.max_concurrency), {})
+        return state
+
+    async def _call(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        slots, _ = self._state()
+        attempt = 0
+        while True:
+            async with slots:
+                self._count("requests")
+                self._count("in_flight")
+                try:
+                    return await fn()
+                except _RETRYABLE as e:
+                    error = e
+                except Exception:
+                    self._count("errors")
+                    raise
+                finally:
+                    self._count("in_flight", -1)
+            # Back off outside the semaphore so other callers are not blocked.
+            if isinstance(error, openai.RateLimitError):
+                self._count("rate_limited")
+            if attempt >= self.max_retries:
+                self._count("errors")
+                raise error
+            await asyncio.sleep(self._delay(attempt, error))
+            attempt += 1
+            self._count("retries")
+
+    async def _single_flight(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        _, inflight = self._state()
+        shared = inflight.get(key)
+        if shared is not None:
+            self._count("coalesced")
+            return await asyncio.shield(shared)
+        task = asyncio.ensure_future(self._call(fn))
+        inflight[key] = task
+        task.add_done_callback(lambda _: inflight.pop(key, None))
+        # A cancelled caller must not cancel the request the others wait on.
+        return await asyncio.shield(task)
+
+    def _call_sync(self, fn: Callable[[], Any]) -> Any:
+        attempt = 0
+        while True:
+            with self._sync_slots:
+                self._count("requests")
+                self._count("in_flight")
+                try:
+                    return fn()
+                except _RETRYABLE as e:
+                    error = e
+                except Exception:
+                    self._count("errors")
+                    raise
+                finally:
+                    self._count("in_flight", -1)
+            if isinstance(error, openai.RateLimitError):
+                self._count("rate_limited")
+            if attempt >= self.max_retries:
+                self._count("errors")
+                raise error
+            time.sleep(self._delay(attempt, error))
+            attempt += 1
+            self._count("retries")
+
+    def _single_flight_sync(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            shared = self._sync_inflight.get(key)
+            if shared is None:
+                future: Future = Future()
+                self._sync_inflight[key] = future
+        if shared is not None:
+            self._count("coalesced")
+            return shared.result()
+        try:
+            result = self._call_sync(fn)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._sync_inflight.pop(key, None)
+
+    # ----------------------------
+    # Public API
+    # ----------------------------
+    async def chat(self, messages: List[Dict[str, Any]], model: str = "", **params: Any) -> Any:
+        """``chat.completions.create`` through the limiter, retries and single-flight."""
+        payload = {"model": model or self.model, "messages": messages, **params}
+        return await self._single_flight(
+            self._key("chat", payload), lambda: self.async_client.chat.completions.create(**payload)
+        )
+
+    def chat_sync(self, messages: List[Dict[str, Any]], model: str = "", **params: Any) -> Any:
+        """Blocking ``chat``, safe to call from many threads."""
+        payload = {"model": model or self.model, "messages": messages, **params}
+        return self._single_flight_sync(
+            self._key("chat", payload), lambda: self.sync_client.chat.completions.create(**payload)
+        )
+
+    def embeddings_sync(self, texts: List[str], model: str) -> Any:
+        payload = {"model": model, "input": list(texts)}
+        return self._single_flight_sync(
+            self._key("embeddings", payload), lambda: self.sync_client.embeddings.create(**payload)
+        )
+
+    def after_fork(self) -> None:
+        """
+        Forget SDK clients and in-flight state inherited from a parent
+        process (their sockets belong to it); clients passed in explicitly
+        are kept.
+        """
+        self._lock = threading.Lock()
+        if self._owns_async:
+            self._async_client = None
+        if self._owns_sync:
+            self._sync_client = None
+        self._loop_state = weakref.WeakKeyDictionary()
+        self._sync_slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._sync_inflight = {}
+        self._stats["in_flight"] = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "max_concurrency": self.max_concurrency,
+                "max_retries": self.max_retries,
+                "http2": self.http2,
+                "base_url": self.base_url or "https://api.openai.com/v1",
+            }
+
+
+# ----------------------------
+# Process-wide default
+# ----------------------------
+_default: Optional[LLMClient] = None
+_default_lock = threading.Lock()
+
+
+def default_client() -> LLMClient:
+    """
+    The shared client, configured from OPENAI_API_KEY, OPENAI_BASE_URL,
+    LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES and LLM_TIMEOUT unless a server
+    installed its own with ``set_default_client``.
+    """
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = LLMClient(
+                    api_key=os.getenv("OPENAI_API_KEY", ""),
+                    base_url=os.getenv("OPENAI_BASE_URL", ""),
+                    timeout=float(os.getenv("LLM_TIMEOUT", 60.0)),
+                    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", 8)),
+                    max_retries=int(os.getenv("LLM_MAX_RETRIES", 4)),
+                )
+    return _default
+
+
+def set_default_client(client: LLMClient) -> None:
+    global _default
+    with _default_lock:
+        _default = client
@@ -0,0 +1,238 @@
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from join_graph import JoinGraph, primary_key
+from schema_index import tokenize
+
+try:  # exact counts for OpenAI models when tiktoken is installed
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # pragma: no cover - optional dependency
+    _ENCODING = None
+
+# Column names that say little on their own; these keep a short description.
+GENERIC_COLUMN_WORDS = frozenset(
+    """
+    status state type kind category class flag mode level code value val data
+    info source ref reference extra misc other note notes remark remarks stage
+    tag label group priority rank rating score amount amt qty num no
+    """.split()
+)
+DESCRIPTION_WORDS = 12
+TABLE_DESCRIPTION_WORDS = 16
+# Column stats (generate_schema_yaml.py --stats): top values listed, and the
+# null share above which it is mentioned
+STATS_VALUES = 5
+STATS_NULL_RATIO = 0.5
+
+_MARKDOWN_RE = re.compile(r"\*\*type:?\*\*:?\s*\S+|\*\*[^*]*\*\*:?|[*`#]+", re.IGNORECASE)
+# "The 'email' field in the 'clients' table is a ... that stores" -> "stores"
+_BOILERPLATE_RE = re.compile(
+    r"^(?:the\s+['\"`]?[\w. ]{1,60}?|this|['\"`][\w.]+)['\"`]?\s+(?:field|column|table)"
+    r"(?:\s+in\s+(?:the\s+)?['\"`]?[\w.]+['\"`]?\s+table)?"
+    r"(?:\s+(?:is|contains|represents)\s+(?:a|an)\s+[^.,]*?(?=\b(?:that|which|used|storing|representing)\b))?"
+    r"\s*(?:that\s+|which\s+|is\s+)?",
+    re.IGNORECASE,
+)
+# Sentences that only restate the column type carry nothing for the model.
+_TYPE_ONLY_RE = re.compile(
+    r"\b(?:varchar|variable character|character string|integer|data type|maximum length|decimal|datetime)\b",
+    re.IGNORECASE,
+)
+_MEANING_RE = re.compile(
+    r"\b(?:stores?|records?|represents?|indicates?|identif\w+|tracks?|used|refers?|captures?|holds?|denotes?)\b",
+    re.IGNORECASE,
+)
+
+
+class PromptSchema(NamedTuple):
+    text: str
+    tokens: int
+    tables: List[str]
+    columns_shown: int
+    columns_pruned: int
+
+
+def count_tokens(text: str) -> int:
+    """Token count of ``text``: exact with tiktoken, else ~4 characters per token."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return max(1, (len(text) + 3) // 4)
+
+
+def short_description(text: Any, max_words: int = DESCRIPTION_WORDS) -> str:
+    """
+    First sentence of a (possibly AI-written, markdown-laden) description with
+    the "The 'x' field in the 'y' table is a ..." preamble removed.
+    """
+    text = _MARKDOWN_RE.sub(" ", str(text or ""))
+    text = " ".join(text.split())
+    if not text:
+        return ""
+    sentences = re.split(r"(?<=[.!?])\s", text)
+    sentence = next(
+        (s for s in sentences if not _TYPE_ONLY_RE.search(s) or _MEANING_RE.search(s)),
+        "",
+    ).rstrip(".")
+    if not sentence:
+        return ""
+    sentence = _BOILERPLATE_RE.sub("", sentence, count=1) or sentence
+    words = sentence.split()
+    out = " ".join(words[:max_words])
+    return out + ("..." if len(words) > max_words else "")
+
+
+def is_ambiguous_column(name: str, col_type: str = "") -> bool:
+    """True for names like ``status``, ``type``, ``amt`` or flag-like codes."""
+    words = name.lower().split("_")
+    if name.lower().startswith(("is_", "has_")):
+        return False
+    if len(name) <= 3 or all(w in GENERIC_COLUMN_WORDS for w in words if w):
+        return True
+    t = (col_type or "").lower()
+    return t.startswith(("enum", "char(1)", "bit")) or t in ("tinyint", "tinyint(1)")
+
+
+def stats_note(stats: Any) -> str:
+    """
+    ``values: 'a', 'b'`` (most frequent first) or ``range: min..max`` from a
+    column's sampled stats, plus ``N% null`` for mostly-empty columns.
+    """
+    if not isinstance(stats, dict):
+        return ""
+    parts = []
+    top = stats.get("top")
+    if top:
+        values = ", ".join(repr(v) if isinstance(v, str) else str(v) for v in top[:STATS_VALUES])
+        more = "..." if int(stats.get("distinct") or 0) > len(top[:STATS_VALUES]) else ""
+        parts.append(f"values: {values}{more}")
+    elif stats.get("min") is not None and stats.get("max") is not None:
+        parts.append(f"range: {stats['min']}..{stats['max']}")
+    null_ratio = float(stats.get("null_ratio") or 0.0)
+    if null_ratio >= STATS_NULL_RATIO:
+        parts.append(f"{round(100 * null_ratio)}% null")
+    return ", ".join(parts)
+
+
+def naming_join_hints(tables: Dict[str, Dict[str, Any]]) -> List[str]:
+    """
+    Join hints between the given tables alone, from declared references and
+    ``<name>_id`` naming conventions.
+    """
+    return JoinGraph(tables).join_hints(tables)
+
+
+def render_compact_schema(
+    tables: Dict[str, Dict[str, Any]],
+    question: str = "",
+    token_budget: int = 0,
+    join_hints: Optional[List[str]] = None,
+    column_stats: bool = True,
+) -> PromptSchema:
+    """
+    Render tables as one DDL-like line per column (``name type [PK|FK]``),
+    keeping a short description only on ambiguous columns, followed by join
+    hints (``join_hints`` or, if None, ones inferred from column names).
+    With ``column_stats``, non-key columns that carry sampled ``stats`` get
+    their frequent values or range appended (see ``stats_note``), and a
+    question term matching one of those values makes the column relevant.
+
+    With ``token_budget`` > 0 the rendering is cut to fit: table headers, key
+    columns and join hints always stay, the remaining columns are admitted in
+    order of relevance to ``question`` until the budget is spent, and every
+    table lists how many columns were pruned. Table descriptions rank below
+    question-relevant columns and above the rest.
+    """
+    terms = set(tokenize(question))
+    if join_hints is None:
+        join_hints = naming_join_hints(tables)
+    fk_columns = {tuple(h.split(" = ")[0].split(".", 1)) for h in join_hints}
+
+    headers: Dict[str, str] = {}
+    table_desc: Dict[str, str] = {}
+    lines: Dict[str, List[Tuple[str, str]]] = {}  # table -> [(column, line)]
+    mandatory = set()
+    candidates: List[Tuple[float, int, int, str, Optional[str]]] = []
+    for t_pos, (table, info) in enumerate(tables.items()):
+        fields = info.get("fields") or {}
+        desc = short_description(info.get("description"), TABLE_DESCRIPTION_WORDS)
+        headers[table] = f"table {table}"
+        if desc:
+            # Dropped before any question-relevant column when over budget
+            table_desc[table] = f" -- {desc}"
+            candidates.append((-0.1, t_pos, -1, table, None))
+        pk = primary_key(table, fields)
+        table_terms = set(tokenize(table))
+        lines[table] = []
+        for c_pos, (col, meta) in enumerate(fields.items()):
+            meta = meta if isinstance(meta, dict) else {}
+            col_type = str(meta.get("type") or "").split(" ")[0]
+            line = f"  {col} {col_type}".rstrip()
+            is_key = col == pk or (table, col) in fk_columns
+            if col == pk:
+                line += " PK"
+            elif (table, col) in fk_columns:
+                line += " FK"
+            notes = []
+            if not is_key and is_ambiguous_column(col, col_type):
+                col_desc = short_description(meta.get("description"))
+                if col_desc:
+                    notes.append(col_desc)
+            col_stats = meta.get("stats") if column_stats and not is_key else None
+            note = stats_note(col_stats)
+            if note:
+                notes.append(note)
+            if notes:
+                line += " -- " + "; ".join(notes)
+            lines[table].append((col, line))
+            if is_key:
+                mandatory.add((table, col))
+            else:
+                name_hits = len(terms.intersection(tokenize(col)))
+                # AI-written descriptions name their own table; that is not a hit.
+                desc_hits = len(terms.intersection(tokenize(meta.get("description"))) - table_terms) if terms else 0
+                # "cancelled orders" -> the column whose values include 'cancelled'
+                value_hits = (
+                    len(terms.intersection(tokenize(" ".join(map(str, col_stats.get("top") or [])))))
+                    if terms and isinstance(col_stats, dict) else 0
+                )
+                candidates.append((-(3.0 * name_hits + 2.0 * value_hits + 0.5 * desc_hits), t_pos, c_pos, table, col))
+
+    join_block = ("joins:\n" + "\n".join(f"  {h}" for h in join_hints)) if join_hints else ""
+    keep = set(mandatory)
+    if token_budget and token_budget > 0:
+        line_cost: Dict[Tuple[str, Optional[str]], int] = {(t, c): count_tokens(line) + 1 for t in lines for c, line in lines[t]}
+        line_cost.update({(t, None): count_tokens(d) for t, d in table_desc.items()})
+        used = sum(count_tokens(h) + 1 for h in headers.values()) + count_tokens(join_block)
+        used += sum(line_cost[k] for k in mandatory)
+        # Room for the "(+N more columns)" markers
+        used += 8 * len(tables)
+        for _, _, _, table, col in sorted(candidates):
+            cost = line_cost[(table, col)]
+            if used + cost > token_budget:
+                continue
+            keep.add((table, col))
+            used += cost
+    else:
+        keep.update((table, col) for _, _, _, table, col in candidates)
+
+    out: List[str] = []
+    shown = pruned = 0
+    for table in tables:
+        out.append(headers[table] + (table_desc[table] if (table, None) in keep else ""))
+        dropped = 0
+        for col, line in lines[table]:
+            if (table, col) in keep:
+                out.append(line)
+                shown += 1
+            else:
+                dropped += 1
+        if dropped:
+            out.append(f"  (+{dropped} more columns)")
+            pruned += dropped
+    if join_block:
+        out.append(join_block)
+    text = "\n".join(out)
+    return PromptSchema(text, count_tokens(text), list(tables), shown, pruned)
@@ -0,0 +1,103 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+_WS_RE = re.compile(r"\s+")
+_EDGE_PUNCT_RE = re.compile(r"^[\s\"'`]+|[\s\"'`?.!;]+$")
+
+
+def normalize_question(text: str) -> str:
+    """
+    Canonical form of a natural-language question for cache keys:
+    case-folded, whitespace collapsed, surrounding quotes and trailing
+    punctuation removed.
+    """
+    return _EDGE_PUNCT_RE.sub("", _WS_RE.sub(" ", (text or "").casefold()))
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Canonical form of a SQL statement for cache keys. Only whitespace and the
+    trailing semicolon are normalised; literals are left untouched.
+    """
+    return _WS_RE.sub(" ", (query or "").strip()).rstrip(";").strip()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a per-entry time-to-live. Each entry can carry
+    the latency (ms) and tokens it cost to compute, which are credited to
+    ``saved_ms`` / ``saved_tokens`` on every hit. ``max_size <= 0`` disables
+    the cache.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, Tuple[float, Any, float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+            "saved_ms": 0.0,
+            "saved_tokens": 0,
+        }
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            expires_at, value, cost_ms, tokens = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            self._stats["saved_ms"] += cost_ms
+            self._stats["saved_tokens"] += tokens
+            return value
+
+    def put(self, key: Hashable, value: Any, cost_ms: float = 0.0, tokens: int = 0) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value, cost_ms, tokens)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def discard(self, key: Hashable) -> None:
+        """Drop one entry, e.g. a cached value that turned out to be wrong."""
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            if self._data:
+                self._stats["invalidations"] += 1
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "saved_ms": round(self._stats["saved_ms"], 3),
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+            }
@@ -0,0 +1,160 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from query_cache import TTLCache, normalize_sql
+from sql_validator import tokenize_sql
+
+# Full scans smaller than this are not worth mentioning in a verdict.
+FULL_SCAN_REPORT_ROWS = 1000
+
+_HINT_RE = re.compile(r"/\*\+[^*]*\bMAX_EXECUTION_TIME\s*\(", re.IGNORECASE)
+
+
+# ----------------------------
+# Execution time hint
+# ----------------------------
+def with_max_execution_time(query: str, ms: int) -> str:
+    """
+    Add ``/*+ MAX_EXECUTION_TIME(ms) */`` after the outermost SELECT keyword
+    (the main SELECT of a WITH query, the first SELECT of a UNION) so MySQL
+    aborts the statement server-side. Queries that already carry the hint, or
+    ``ms`` <= 0, are returned unchanged.
+    """
+    if ms <= 0 or _HINT_RE.search(query):
+        return query
+    tokens, _ = tokenize_sql(query)
+    depth = 0
+    best: Optional[Tuple[int, int]] = None  # (depth, end offset of SELECT)
+    for tok in tokens:
+        if tok.kind == "op" and tok.value == "(":
+            depth += 1
+        elif tok.kind == "op" and tok.value == ")":
+            depth -= 1
+        elif tok.kind == "word" and tok.upper == "SELECT" and (best is None or depth < best[0]):
+            best = (depth, tok.start + len(tok.value))
+    if best is None:
+        return query
+    pos = best[1]
+    return f"{query[:pos]} /*+ MAX_EXECUTION_TIME({int(ms)}) */{query[pos:]}"
+
+
+# ----------------------------
+# EXPLAIN FORMAT=JSON
+# ----------------------------
+def _collect_loops(node: Any, loops: List[List[Dict[str, Any]]]) -> None:
+    """Gather every join (list of table nodes, in join order) in a JSON plan."""
+    if isinstance(node, list):
+        for item in node:
+            _collect_loops(item, loops)
+        return
+    if not isinstance(node, dict):
+        return
+    if isinstance(node.get("nested_loop"), list):
+        tables = [e["table"] for e in node["nested_loop"] if isinstance(e, dict) and isinstance(e.get("table"), dict)]
+        loops.append(tables)
+        for table in tables:
+            _collect_loops(table, loops)  # materialized_from_subquery, attached subqueries
+    elif isinstance(node.get("table"), dict):
+        loops.append([node["table"]])
+        _collect_loops(node["table"], loops)
+    for key, value in node.items():
+        if key not in ("nested_loop", "table"):
+            _collect_loops(value, loops)
+
+
+def _query_costs(node: Any) -> List[float]:
+    if isinstance(node, list):
+        return [c for item in node for c in _query_costs(item)]
+    if not isinstance(node, dict):
+        return []
+    if "query_cost" in (node.get("cost_info") or {}):
+        return [_number(node["cost_info"]["query_cost"])]
+    return [c for value in node.values() for c in _query_costs(value)]
+
+
+def _number(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def plan_estimates(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Optimizer estimates from an ``EXPLAIN FORMAT=JSON`` document: total cost,
+    rows examined (each table's rows per scan times the rows produced by the
+    join prefix feeding it, summed over all joins and subqueries) and the
+    large full table scans.
+    """
+    block = plan.get("query_block", plan)
+    # UNIONs have no top-level cost; add up the member query blocks instead
+    cost = _number((block.get("cost_info") or {}).get("query_cost")) or sum(_query_costs(block))
+    loops: List[List[Dict[str, Any]]] = []
+    _collect_loops(block, loops)
+
+    examined = 0.0
+    full_scans = []
+    for tables in loops:
+        prefix = 1.0
+        for table in tables:
+            per_scan = _number(table.get("rows_examined_per_scan"))
+            examined += prefix * per_scan
+            produced = table.get("rows_produced_per_join")
+            prefix = _number(produced) if produced is not None else prefix * per_scan
+            if table.get("access_type") == "ALL" and per_scan >= FULL_SCAN_REPORT_ROWS:
+                full_scans.append({"table": table.get("table_name", "?"), "rows": int(per_scan)})
+    return {"cost": round(cost, 2), "estimated_rows": int(examined), "full_scans": full_scans}
+
+
+class PlanGuard:
+    """
+    Pre-flight cost check: runs ``EXPLAIN FORMAT=JSON`` and rejects queries
+    whose estimated rows examined or query cost exceed the thresholds (0
+    disables a threshold). Verdicts are cached by normalized SQL for
+    ``ttl_seconds``, so a repeated query costs no extra round trip.
+    """
+
+    def __init__(self, max_rows: int = 0, max_cost: float = 0.0, cache_size: int = 1024, ttl_seconds: float = 600.0):
+        self.max_rows = max_rows
+        self.max_cost = max_cost
+        self.cache = TTLCache(max_size=cache_size, ttl_seconds=ttl_seconds)
+        self.explains = 0
+
+    def evaluate(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+        verdict = plan_estimates(plan)
+        reasons = []
+        if self.max_rows and verdict["estimated_rows"] > self.max_rows:
+            reasons.append(
+                f"Estimated {verdict['estimated_rows']:,} rows examined exceeds the limit of {self.max_rows:,}."
+            )
+        if self.max_cost and verdict["cost"] > self.max_cost:
+            reasons.append(f"Estimated query cost {verdict['cost']:,} exceeds the limit of {self.max_cost:,}.")
+        if reasons:
+            reasons.extend(f"Full table scan of {s['table']} (~{s['rows']:,} rows)." for s in verdict["full_scans"])
+        verdict["allowed"] = not reasons
+        verdict["reasons"] = reasons
+        return verdict
+
+    def cached(self, query: str) -> Optional[Dict[str, Any]]:
+        return self.cache.get(normalize_sql(query))
+
+    def check(self, conn: Any, query: str) -> Dict[str, Any]:
+        """Cached verdict for ``query``, running EXPLAIN on ``conn`` on a miss."""
+        key = normalize_sql(query)
+        verdict = self.cache.get(key)
+        if verdict is not None:
+            return verdict
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"EXPLAIN FORMAT=JSON {query}")
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+        self.explains += 1
+        verdict = self.evaluate(json.loads(row[0]) if row else {})
+        self.cache.put(key, verdict)
+        return verdict
+
+    def stats(self) -> Dict[str, Any]:
+        return {"max_rows": self.max_rows, "max_cost": self.max_cost, "explains": self.explains, **self.cache.stats()}
@@ -0,0 +1,189 @@
+import base64
+import datetime
+import decimal
+import gzip
+import json
+import uuid
+from operator import itemgetter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+try:  # better ratio and much faster than gzip when installed
+    import zstandard
+except Exception:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:  # faster serializer for sizing/compressing the encoded rows
+    import orjson
+except Exception:  # pragma: no cover - optional dependency
+    orjson = None
+
+COMPRESSIONS = ("none", "auto", "gzip", "zstd")
+
+
+# ----------------------------
+# Value encoders
+# ----------------------------
+def _decimal(v: decimal.Decimal) -> str:
+    # As text: a JSON number would lose precision in most clients
+    return str(v)
+
+
+def _isoformat(v: Any) -> str:
+    return v.isoformat()
+
+
+def _timedelta(v: datetime.timedelta) -> str:
+    # MySQL TIME columns arrive as timedelta; render them the way MySQL does
+    seconds = int(v.total_seconds())
+    sign = "-" if seconds < 0 else ""
+    seconds = abs(seconds)
+    return f"{sign}{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def _bytes(v: bytes) -> str:
+    return base64.b64encode(bytes(v)).decode("ascii")
+
+
+def _set(v: Any) -> List[Any]:
+    return sorted(v, key=str)
+
+
+# type -> (label, encoder); None means JSON-native, passed through untouched
+_ENCODERS: Dict[type, Tuple[str, Optional[Callable[[Any], Any]]]] = {
+    str: ("str", None),
+    int: ("int", None),
+    float: ("float", None),
+    bool: ("bool", None),
+    decimal.Decimal: ("decimal", _decimal),
+    datetime.datetime: ("datetime", _isoformat),
+    datetime.date: ("date", _isoformat),
+    datetime.time: ("time", _isoformat),
+    datetime.timedelta: ("time", _timedelta),
+    bytes: ("bytes", _bytes),
+    bytearray: ("bytes", _bytes),
+    set: ("set", _set),
+    uuid.UUID: ("str", str),
+}
+
+
+def encode_value(v: Any) -> Any:
+    """Any single value, encoded as its column type would be."""
+    if v is None:
+        return None
+    _, encoder = _ENCODERS.get(type(v), ("str", str))
+    return v if encoder is None else encoder(v)
+
+
+def _column_type(values: Sequence[Any]) -> Tuple[str, Optional[Callable[[Any], Any]]]:
+    """Label and encoder for a column, from the types of its non-null values."""
+    kinds = {type(v) for v in values if v is not None}
+    if not kinds:
+        return "null", None
+    if len(kinds) == 1:
+        return _ENCODERS.get(kinds.pop(), ("str", str))
+    if kinds <= {int, float}:
+        return "float", None
+    return "mixed", encode_value
+
+
+def encode_rows(rows: Sequence[Any], columns: Optional[List[str]] = None) -> Tuple[List[str], List[str], List[List[Any]]]:
+    """
+    ``(columns, types, row_arrays)`` for dict rows (cursor(dictionary=True))
+    or tuple rows with ``columns`` given. Each column gets one encoder chosen
+    from its values' types; columns that are already JSON-native (str, int,
+    float, bool, null) are copied without touching their values.
+    """
+    if not rows:
+        return list(columns or []), ["null"] * len(columns or []), []
+    if isinstance(rows[0], dict):
+        columns = list(rows[0].keys()) if columns is None else columns
+        getter = itemgetter(*columns) if columns else (lambda r: ())
+        tuples = [getter(r) for r in rows]
+        if len(columns) == 1:
+            tuples = [(t,) for t in tuples]
+    else:
+        columns = list(columns or [])
+        tuples = rows
+
+    types: List[str] = []
+    encoders: List[Tuple[int, Callable[[Any], Any]]] = []
+    for i, values in enumerate(zip(*tuples)):
+        label, encoder = _column_type(values)
+        types.append(label)
+        if encoder is not None:
+            encoders.append((i, encoder))
+
+    if not encoders:  # fast path: nothing to convert
+        return columns, types, [list(t) for t in tuples]
+    out = []
+    for t in tuples:
+        row = list(t)
+        for i, encoder in encoders:
+            v = row[i]
+            if v is not None:
+                row[i] = encoder(v)
+        out.append(row)
+    return columns, types, out
+
+
+# ----------------------------
+# Serialization and compression
+# ----------------------------
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _compress(data: bytes, method: str) -> Tuple[str, bytes]:
+    if method in ("auto", "zstd") and zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=3).compress(data)
+    # zstd requested but not installed: gzip is always available
+    return "gzip", gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def decode_block(encoding: str, data: str) -> List[List[Any]]:
+    """Inverse of the compressed ``data`` block of ``compact_result``."""
+    raw = base64.b64decode(data)
+    if encoding.startswith("zstd"):
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed")
+        raw = zstandard.ZstdDecompressor().decompress(raw)
+    else:
+        raw = gzip.decompress(raw)
+    return json.loads(raw)
+
+
+def compact_result(rows: Sequence[Any], compress: str = "none", threshold_bytes: int = 65536) -> Dict[str, Any]:
+    """
+    Rows as ``columns`` + ``types`` + ``rows`` (arrays). With ``compress`` set
+    and the encoded rows at least ``threshold_bytes`` long, ``rows`` is
+    replaced by ``data``: the rows' JSON compressed with zstd (or gzip) and
+    base64-encoded, decoded with ``decode_block(encoding, data)``.
+
+    ``size`` compares the payload with the default one-dict-per-row format:
+    same values, so the difference is the repeated column names (and the
+    compression, if applied).
+    """
+    columns, types, arrays = encode_rows(rows)
+    body = _dumps(arrays)
+    # {"a":1,"b":2} vs [1,2]: each row repeats `"name":` for every column
+    key_bytes = sum(len(_dumps(c)) + 1 for c in columns)
+    row_dict_bytes = len(body) + key_bytes * len(arrays)
+
+    result: Dict[str, Any] = {"format": "compact", "columns": columns, "types": types, "row_count": len(arrays)}
+    payload_bytes = len(body)
+    if compress and compress != "none" and len(body) >= threshold_bytes:
+        method, packed = _compress(body, compress)
+        result["encoding"] = f"{method}+base64"
+        result["data"] = base64.b64encode(packed).decode("ascii")
+        payload_bytes = len(result["data"])
+    else:
+        result["rows"] = arrays
+    result["size"] = {
+        "row_dicts_bytes": row_dict_bytes,
+        "compact_bytes": len(body),
+        "payload_bytes": payload_bytes,
+        "saved_pct": round(100.0 * (1 - payload_bytes / row_dict_bytes), 1) if row_dict_bytes else 0.0,
+    }
+    return result
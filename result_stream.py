@@ -0,0 +1,229 @@
+import os
+import secrets
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import mysql.connector
+
+from db_pool import ConnectionPool
+
+
+class StreamLimitError(Exception):
+    """Raised when opening a stream would exceed the number of concurrently open streams."""
+
+
+class StreamNotFoundError(Exception):
+    """Raised for unknown, finished or expired continuation tokens."""
+
+
+class _ResultStream:
+    __slots__ = (
+        "token", "pool", "conn", "cursor", "columns", "columnar", "page_size",
+        "rows_sent", "pages", "last_access", "lock",
+    )
+
+    def __init__(self, token: str, pool: ConnectionPool, conn: Any, cursor: Any, page_size: int, columnar: bool):
+        self.token = token
+        self.pool = pool
+        self.conn = conn
+        self.cursor = cursor
+        self.columns: List[str] = list(cursor.column_names or [])
+        self.columnar = columnar
+        self.page_size = page_size
+        self.rows_sent = 0
+        self.pages = 0
+        self.last_access = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class StreamRegistry:
+    """
+    Open, unbuffered result cursors keyed by opaque continuation tokens.
+
+    Each stream holds one pooled connection with an unbuffered cursor and
+    reads exactly one page per call with ``fetchmany``, so server memory use
+    stays flat regardless of result size. A stream releases its connection
+    once the result is exhausted; streams abandoned for longer than
+    ``idle_ttl`` seconds are closed by a reaper thread, started with the
+    first stream in each process.
+
+    Streams live in the memory of the process that opened them. Tokens carry
+    its pid, so a token presented to another process (e.g. a different
+    pre-forked worker) is refused as such rather than as expired.
+    """
+
+    def __init__(self, pool: ConnectionPool, max_open: int = 2, idle_ttl: float = 300.0):
+        self._pool = pool
+        self.max_open = max_open
+        self.idle_ttl = idle_ttl
+        self._streams: Dict[str, _ResultStream] = {}
+        self._reserved = 0
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._reaper_pid = 0
+        self._stats = {"opened": 0, "completed": 0, "closed_early": 0, "expired": 0, "pages": 0, "rows": 0}
+
+    # ----------------------------
+    # Internals
+    # ----------------------------
+    def _finish(self, stream: _ResultStream, exhausted: bool) -> None:
+        with self._lock:
+            if self._streams.pop(stream.token, None) is None:
+                return
+        try:
+            stream.cursor.close()
+        except Exception:
+            pass
+        # A connection with unread rows on the wire cannot be reused safely.
+        stream.pool.release(stream.conn, discard=not exhausted)
+
+    def _page(self, stream: _ResultStream) -> Dict[str, Any]:
+        try:
+            rows = stream.cursor.fetchmany(stream.page_size)
+        except mysql.connector.Error:
+            self._finish(stream, exhausted=False)
+            raise
+        offset = stream.rows_sent
+        stream.rows_sent += len(rows)
+        stream.pages += 1
+        stream.last_access = time.monotonic()
+        done = len(rows) < stream.page_size
+        if done:
+            self._finish(stream, exhausted=True)
+            with self._lock:
+                self._stats["completed"] += 1
+        with self._lock:
+            self._stats["pages"] += 1
+            self._stats["rows"] += len(rows)
+
+        page: Dict[str, Any] = {"page": stream.pages, "row_offset": offset}
+        if stream.columnar:
+            page["columns"] = stream.columns
+            page["rows"] = [list(r) for r in rows]
+        else:
+            page["rows"] = [dict(zip(stream.columns, r)) for r in rows]
+        page["next_token"] = None if done else stream.token
+        return page
+
+    def _get(self, token: str) -> _ResultStream:
+        with self._lock:
+            stream = self._streams.get(token)
+        if stream is None:
+            owner = token.split(".", 1)[0]
+            if "." in token and owner != f"{os.getpid():x}":
+                raise StreamNotFoundError("Continuation token was issued by another server process.")
+            raise StreamNotFoundError("Unknown or expired continuation token.")
+        return stream
+
+    def _reap_forever(self) -> None:
+        interval = max(1.0, min(30.0, self.idle_ttl / 4))
+        while True:
+            time.sleep(interval)
+            try:
+                self.reap()
+            except Exception:
+                pass
+
+    def _ensure_reaper(self) -> None:
+        # One per process: a thread does not survive fork into a worker.
+        with self._lock:
+            if self._reaper is not None and self._reaper_pid == os.getpid():
+                return
+            self._reaper = threading.Thread(target=self._reap_forever, name="stream-reaper", daemon=True)
+            self._reaper_pid = os.getpid()
+            self._reaper.start()
+
+    # ----------------------------
+    # Public API (blocking; call from a worker thread)
+    # ----------------------------
+    def open(
+        self,
+        query: str,
+        page_size: int,
+        columnar: bool = False,
+        holder: Optional[Dict[str, Any]] = None,
+        pool: Optional[ConnectionPool] = None,
+    ) -> Dict[str, Any]:
+        """
+        Execute ``query`` on an unbuffered cursor and return its first page.
+        ``holder["connection_id"]`` (and ``holder["pool"]``) are set so the
+        caller can kill a slow query. ``pool`` overrides the registry's pool,
+        e.g. to read from a replica.
+        """
+        pool = pool or self._pool
+        self._ensure_reaper()
+        self.reap()
+        with self._lock:
+            if len(self._streams) + self._reserved >= self.max_open:
+                raise StreamLimitError(f"Too many open result streams (max {self.max_open}).")
+            self._reserved += 1
+        try:
+            conn = pool.acquire()
+        except Exception:
+            with self._lock:
+                self._reserved -= 1
+            raise
+
+        cursor = None
+        try:
+            if holder is not None:
+                holder["connection_id"] = conn.connection_id
+                holder["pool"] = pool
+            cursor = conn.cursor(buffered=False)
+            cursor.execute(query)
+            token = f"{os.getpid():x}.{secrets.token_urlsafe(18)}"
+            stream = _ResultStream(token, pool, conn, cursor, max(1, int(page_size)), columnar)
+        except Exception:
+            try:
+                if cursor is not None:
+                    cursor.close()
+            except Exception:
+                pass
+            pool.release(conn, discard=True)
+            with self._lock:
+                self._reserved -= 1
+            raise
+
+        with self._lock:
+            self._reserved -= 1
+            self._streams[stream.token] = stream
+            self._stats["opened"] += 1
+        with stream.lock:
+            return self._page(stream)
+
+    def next_page(self, token: str, holder: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        self.reap()
+        stream = self._get(token)
+        if holder is not None:
+            holder["connection_id"] = stream.conn.connection_id
+            holder["pool"] = stream.pool
+        with stream.lock:
+            if token not in self._streams:
+                raise StreamNotFoundError("Stream was closed.")
+            return self._page(stream)
+
+    def close(self, token: str) -> None:
+        stream = self._get(token)
+        with stream.lock:
+            self._finish(stream, exhausted=False)
+        with self._lock:
+            self._stats["closed_early"] += 1
+
+    def reap(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            expired = [s for s in self._streams.values() if now - s.last_access > self.idle_ttl]
+        for stream in expired:
+            # Skip streams that are busy serving a page right now.
+            if stream.lock.acquire(blocking=False):
+                try:
+                    self._finish(stream, exhausted=False)
+                finally:
+                    stream.lock.release()
+                with self._lock:
+                    self._stats["expired"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "open": len(self._streams), "max_open": self.max_open}
@@ -0,0 +1,226 @@
+import math
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    """
+    a an and are as at be by for from has have in is it its of on or that the
+    this to was were will with which what who whom how many much show list give
+    me all each per i we you our their my get find
+    """.split()
+)
+
+# BM25 parameters and per-zone weights (BM25F-style: a hit in a table name
+# counts for more than the same word in a prose description).
+K1 = 1.2
+B = 0.75
+ZONE_WEIGHTS = {
+    "table_name": 3.0,
+    "table_desc": 1.0,
+    "field_name": 2.0,
+    "field_desc": 0.5,
+}
+EXACT_TABLE_BONUS = 5.0
+
+
+def _stem(term: str) -> str:
+    """Very light plural folding so 'orders' and 'order' share a posting."""
+    if len(term) > 4 and term.endswith("ies"):
+        return term[:-3] + "y"
+    if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+        return term[:-1]
+    return term
+
+
+def tokenize(text: Any, keep_stopwords: bool = False) -> List[str]:
+    """
+    Lowercase, split on non-alphanumerics (so snake_case identifiers split
+    into words) and fold plurals.
+    """
+    terms = _TOKEN_RE.findall(str(text or "").lower())
+    return [_stem(t) for t in terms if keep_stopwords or t not in STOPWORDS]
+
+
+class SchemaIndex:
+    """
+    Token-level inverted index over a flat ``table -> {description, fields}``
+    mapping. Built once per schema load; lookups only touch the postings of
+    the query terms.
+    """
+
+    def __init__(self, tables: Dict[str, Dict[str, Any]]):
+        self.tables = tables
+        # Ranking: term -> {table: weighted term frequency}
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._doc_len: Dict[str, float] = {}
+        # Search: term -> tables hit by name/description, term -> (table, field) hits
+        self._table_terms: Dict[str, Set[str]] = defaultdict(set)
+        self._field_terms: Dict[str, Set[Tuple[str, str]]] = defaultdict(set)
+        # Full table names (lowercased, plural-folded) for the exact-name bonus
+        self._table_names: Dict[str, str] = {}
+        # Schema order, the tie-break for search results
+        self._position: Dict[str, int] = {table: i for i, table in enumerate(tables)}
+        # Infix search: lowercased names/descriptions as (table, field or None,
+        # text), and trigram -> ids of the texts containing it
+        self._texts: List[Tuple[str, Optional[str], str]] = []
+        self._trigrams: Dict[str, Set[int]] = defaultdict(set)
+
+        for table, info in tables.items():
+            info = info or {}
+            tf: Dict[str, float] = defaultdict(float)
+            self._table_names[_stem(table.lower())] = table
+
+            for zone, text in (
+                ("table_name", table),
+                ("table_desc", info.get("description", "")),
+            ):
+                self._add_text(table, None, text)
+                for term in tokenize(text):
+                    tf[term] += ZONE_WEIGHTS[zone]
+                    self._table_terms[term].add(table)
+
+            for field, finfo in (info.get("fields", {}) or {}).items():
+                for zone, text in (
+                    ("field_name", field),
+                    ("field_desc", (finfo or {}).get("description", "")),
+                ):
+                    self._add_text(table, field, text)
+                    for term in tokenize(text):
+                        tf[term] += ZONE_WEIGHTS[zone]
+                        self._field_terms[term].add((table, field))
+
+            for term, weight in tf.items():
+                self._postings[term][table] = weight
+            self._doc_len[table] = sum(tf.values())
+
+        n = len(tables)
+        self._avg_len = (sum(self._doc_len.values()) / n) if n else 0.0
+        self._idf: Dict[str, float] = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self._postings.items()
+        }
+        self._vocab: List[str] = sorted(set(self._table_terms) | set(self._field_terms))
+        self._postings = dict(self._postings)
+        self._table_terms = dict(self._table_terms)
+        self._field_terms = dict(self._field_terms)
+        self._trigrams = dict(self._trigrams)
+
+    def _add_text(self, table: str, field: Optional[str], text: Any) -> None:
+        text = str(text or "").lower()
+        if not text:
+            return
+        doc = len(self._texts)
+        self._texts.append((table, field, text))
+        for i in range(len(text) - 2):
+            self._trigrams[text[i:i + 3]].add(doc)
+
+    # ----------------------------
+    # Ranking
+    # ----------------------------
+    def score_tables(self, query: str) -> List[Tuple[str, float]]:
+        """
+        BM25 score of every table that shares at least one term with the query,
+        best first. Tables named verbatim in the query get a flat bonus.
+        """
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf[term]
+            for table, tf in postings.items():
+                norm = K1 * (1 - B + B * self._doc_len[table] / (self._avg_len or 1.0))
+                scores[table] += idf * tf * (K1 + 1) / (tf + norm)
+
+        words = _TOKEN_RE.findall(str(query or "").lower())
+        for phrase in self._phrases(words):
+            table = self._table_names.get(phrase)
+            if table is not None:
+                scores[table] += EXACT_TABLE_BONUS
+
+        return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+
+    @staticmethod
+    def _phrases(words: List[str], max_len: int = 4) -> Iterable[str]:
+        # Table names are snake_case, so "orders booking" should match "orders_booking".
+        for i in range(len(words)):
+            for j in range(i + 1, min(i + max_len, len(words)) + 1):
+                yield _stem("_".join(words[i:j]))
+
+    def rank_tables(self, query: str, max_tables: int = 6) -> List[str]:
+        return [t for t, _ in self.score_tables(query)[:max_tables]]
+
+    # ----------------------------
+    # Keyword search
+    # ----------------------------
+    def _expand(self, term: str) -> List[str]:
+        """All indexed terms starting with ``term`` (prefix match via the sorted vocabulary)."""
+        out = []
+        i = bisect_left(self._vocab, term)
+        while i < len(self._vocab) and self._vocab[i].startswith(term):
+            out.append(self._vocab[i])
+            i += 1
+        return out
+
+    def search(self, keyword: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Find tables and fields whose name or description contains every word
+        of ``keyword`` (each word may be a prefix, e.g. 'client' hits
+        'client_id'), merged with those containing ``keyword`` anywhere as a
+        substring (e.g. 'voice' hits 'invoice'). Returns ``{table:
+        {"table_hit": bool, "fields": {..}}}`` ordered by BM25 score, then
+        schema order.
+        """
+        hits = self._infix_search(str(keyword or "").strip().lower())
+        terms = tokenize(keyword)
+        if not terms:
+            return hits
+
+        table_hits: Set[str] = set()
+        field_hits: Set[Tuple[str, str]] = set()
+        for i, term in enumerate(terms):
+            t_set: Set[str] = set()
+            f_set: Set[Tuple[str, str]] = set()
+            for expanded in self._expand(term):
+                t_set |= self._table_terms.get(expanded, set())
+                f_set |= self._field_terms.get(expanded, set())
+            if i == 0:
+                table_hits, field_hits = t_set, f_set
+            else:
+                table_hits &= t_set
+                field_hits &= f_set
+
+        for table in table_hits:
+            hits.setdefault(table, {"table_hit": False, "fields": set()})["table_hit"] = True
+        for table, field in field_hits:
+            hits.setdefault(table, {"table_hit": False, "fields": set()})["fields"].add(field)
+        scores = dict(self.score_tables(keyword))
+        ordered = sorted(hits, key=lambda t: (-scores.get(t, 0.0), self._position.get(t, 0)))
+        return {table: hits[table] for table in ordered}
+
+    def _infix_search(self, needle: str) -> Dict[str, Dict[str, Any]]:
+        """Tables and fields whose name or description contains ``needle``, in schema order."""
+        results: Dict[str, Dict[str, Any]] = {}
+        if not needle:
+            return results
+        if len(needle) < 3:
+            docs: Iterable[int] = range(len(self._texts))
+        else:
+            postings = sorted(
+                (self._trigrams.get(needle[i:i + 3], set()) for i in range(len(needle) - 2)), key=len
+            )
+            docs = sorted(set.intersection(*postings))
+        for doc in docs:
+            table, field, text = self._texts[doc]
+            if needle not in text:
+                continue
+            hit = results.setdefault(table, {"table_hit": False, "fields": set()})
+            if field is None:
+                hit["table_hit"] = True
+            else:
+                hit["fields"].add(field)
+        return results
@@ -0,0 +1,295 @@
+import argparse
+import hashlib
+import os
+import pathlib
+import pickle
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import yaml
+
+from join_graph import JoinGraph
+from schema_index import SchemaIndex
+
+# libyaml's C loader is ~10x faster than the pure-Python SafeLoader.
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+SNAPSHOT_FORMAT_VERSION = 5
+
+
+# ----------------------------
+# YAML loading
+# ----------------------------
+def load_schema_file(file: pathlib.Path) -> Any:
+    with open(file, "r") as f:
+        return yaml.load(f, Loader=_YAML_LOADER) or {}
+
+def load_schema_descriptions(path: str = "schemas") -> dict:
+    schema_dir = pathlib.Path(path)
+    all_schemas = {}
+
+    if not schema_dir.exists() or not schema_dir.is_dir():
+        print(f"[SchemaLoadError] Schema directory not found: {path}", file=sys.stderr)
+        return {}
+
+    for file in sorted(schema_dir.glob("*.yaml")):
+        try:
+            module_name = file.stem  # e.g., "sales" from "sales.yaml"
+            all_schemas[module_name] = load_schema_file(file)
+        except Exception as e:
+            print(f"[SchemaLoadError] Failed to load {file.name}: {e}", file=sys.stderr)
+
+    return all_schemas
+
+def flatten_schema(modules: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Collapse ``module -> {table: info}`` into ``table -> info``.
+    """
+    tables: Dict[str, Any] = {}
+    for module_tables in modules.values():
+        if not isinstance(module_tables, dict):
+            continue
+        for table, info in module_tables.items():
+            if isinstance(info, dict):
+                tables[table] = info
+    return tables
+
+
+# ----------------------------
+# Source manifest
+# ----------------------------
+def _sha256(file: pathlib.Path) -> str:
+    h = hashlib.sha256()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def source_stats(path: str) -> Dict[str, Dict[str, int]]:
+    """``{file name: {"size", "mtime_ns"}}`` for every YAML file in the schema directory."""
+    schema_dir = pathlib.Path(path)
+    if not schema_dir.is_dir():
+        return {}
+    out = {}
+    for file in sorted(schema_dir.glob("*.yaml")):
+        st = file.stat()
+        out[file.name] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    return out
+
+
+# ----------------------------
+# Snapshot
+# ----------------------------
+class SchemaSnapshot:
+    """
+    Everything derived from the schema directory: the raw per-module data,
+    the flattened table map, the allowed-table set, the search index and the
+    join graph.
+    Treated as immutable once built; ``sources`` records the size, mtime and
+    SHA-256 of every source file so a pickled snapshot can be validated
+    against the directory it was compiled from.
+    """
+
+    def __init__(self, modules: Dict[str, Any], sources: Dict[str, Dict[str, Any]]):
+        self.modules = modules
+        self.sources = sources
+        self.tables: Dict[str, Any] = flatten_schema(modules)
+        self.allowed_tables = frozenset(self.tables)
+        # Lowercased table -> module (file stem), for routing queries to databases
+        self.table_modules: Dict[str, str] = {
+            table.lower(): module
+            for module, module_tables in modules.items() if isinstance(module_tables, dict)
+            for table, info in module_tables.items() if isinstance(info, dict)
+        }
+        self.index = SchemaIndex(self.tables)
+        self.join_graph = JoinGraph(self.tables)
+        self.version = hashlib.sha256(
+            "".join(f"{name}:{meta['sha256']}|" for name, meta in sorted(sources.items())).encode()
+        ).hexdigest()[:16]
+        self.built_at = time.time()
+
+    @classmethod
+    def from_directory(cls, path: str, previous: Optional["SchemaSnapshot"] = None) -> "SchemaSnapshot":
+        """
+        Parse the schema directory. With ``previous``, files whose size and
+        mtime are unchanged reuse its already-parsed data instead of being
+        read again.
+        """
+        schema_dir = pathlib.Path(path)
+        modules: Dict[str, Any] = {}
+        sources: Dict[str, Dict[str, Any]] = {}
+        if not schema_dir.is_dir():
+            print(f"[SchemaLoadError] Schema directory not found: {path}", file=sys.stderr)
+            return cls(modules, sources)
+
+        for file in sorted(schema_dir.glob("*.yaml")):
+            # Stat before reading and hash the exact bytes parsed, so a file
+            # rewritten mid-load is detected as changed by is_fresh().
+            st = file.stat()
+            known = previous.sources.get(file.name) if previous is not None else None
+            if (
+                known is not None
+                and known["size"] == st.st_size
+                and known["mtime_ns"] == st.st_mtime_ns
+                and file.stem in previous.modules
+            ):
+                sources[file.name] = known
+                modules[file.stem] = previous.modules[file.stem]
+                continue
+            data = file.read_bytes()
+            sources[file.name] = {
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "sha256": hashlib.sha256(data).hexdigest(),
+            }
+            try:
+                modules[file.stem] = yaml.load(data, Loader=_YAML_LOADER) or {}
+            except Exception as e:
+                print(f"[SchemaLoadError] Failed to load {file.name}: {e}", file=sys.stderr)
+        return cls(modules, sources)
+
+    def is_fresh(self, path: str) -> bool:
+        """
+        True if the schema directory still matches this snapshot. Size and
+        mtime are compared first; files whose mtime moved without a size
+        change (touch, git checkout) are confirmed by content hash.
+        """
+        current = source_stats(path)
+        if set(current) != set(self.sources):
+            return False
+        schema_dir = pathlib.Path(path)
+        for name, meta in current.items():
+            known = self.sources[name]
+            if meta["size"] != known["size"]:
+                return False
+            if meta["mtime_ns"] != known["mtime_ns"] and _sha256(schema_dir / name) != known["sha256"]:
+                return False
+        return True
+
+    def save(self, out_path: str) -> None:
+        """Atomically write the snapshot (temp file + rename)."""
+        out = pathlib.Path(out_path)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=out.parent, prefix=f".{out.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((SNAPSHOT_FORMAT_VERSION, self), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, out)
+        except Exception:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+
+def read_snapshot(snapshot_path: str) -> Optional[SchemaSnapshot]:
+    try:
+        with open(snapshot_path, "rb") as f:
+            fmt, snapshot = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[SchemaSnapshotError] Ignoring unreadable snapshot {snapshot_path}: {e}", file=sys.stderr)
+        return None
+    if fmt != SNAPSHOT_FORMAT_VERSION or not isinstance(snapshot, SchemaSnapshot):
+        return None
+    return snapshot
+
+
+def load_schema(path: str, snapshot_path: str = "", write_snapshot: bool = True) -> SchemaSnapshot:
+    """
+    Return the schema for ``path``: the compiled snapshot at ``snapshot_path``
+    if it is still fresh, otherwise parse the YAML (C loader when available)
+    and, if ``write_snapshot``, compile a new snapshot for the next start.
+    """
+    if snapshot_path:
+        snapshot = read_snapshot(snapshot_path)
+        if snapshot is not None and snapshot.is_fresh(path):
+            return snapshot
+
+    snapshot = SchemaSnapshot.from_directory(path)
+    if snapshot_path and write_snapshot and snapshot.sources:
+        try:
+            snapshot.save(snapshot_path)
+        except Exception as e:
+            print(f"[SchemaSnapshotError] Could not write snapshot {snapshot_path}: {e}", file=sys.stderr)
+    return snapshot
+
+
+# ----------------------------
+# Hot reload
+# ----------------------------
+class SchemaWatcher(threading.Thread):
+    """
+    Daemon thread that polls the schema directory every ``interval`` seconds.
+    When the files no longer match the current snapshot it builds a new one
+    (reusing unchanged files) and hands it to ``on_change``, all off the
+    request path.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        get_current: Callable[[], SchemaSnapshot],
+        on_change: Callable[[SchemaSnapshot], None],
+        interval: float = 2.0,
+    ):
+        super().__init__(name="schema-watcher", daemon=True)
+        self.path = path
+        self.get_current = get_current
+        self.on_change = on_change
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._last_stats: Optional[Dict[str, Dict[str, int]]] = None
+
+    def check(self) -> bool:
+        """Reload if needed; returns True when a new snapshot was published."""
+        stats = source_stats(self.path)
+        if stats == self._last_stats:
+            return False
+        current = self.get_current()
+        if current.is_fresh(self.path):
+            self._last_stats = stats
+            return False
+        snapshot = SchemaSnapshot.from_directory(self.path, previous=current)
+        self.on_change(snapshot)
+        self._last_stats = stats
+        return True
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"[SchemaReloadError] {e}", file=sys.stderr)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+# ----------------------------
+# Build step
+# ----------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compile the schema YAML directory into a binary snapshot.")
+    parser.add_argument("--schema-dir", default=os.getenv("SCHEMA_DIR", "schemas"))
+    parser.add_argument("--out", default=os.getenv("SCHEMA_SNAPSHOT", ".schema_snapshot.pkl"))
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    snapshot = SchemaSnapshot.from_directory(args.schema_dir)
+    snapshot.save(args.out)
+    print(
+        f"Compiled {len(snapshot.sources)} file(s), {len(snapshot.tables)} table(s) "
+        f"into {args.out} (version {snapshot.version}) in {time.perf_counter() - started:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    # Run through the importable module so pickled classes are recorded as
+    # schema_snapshot.SchemaSnapshot rather than __main__.SchemaSnapshot.
+    import schema_snapshot
+    schema_snapshot.main()
@@ -0,0 +1,266 @@
+import asyncio
+import gc
+import os
+import random
+import signal
+import socket
+import sys
+import time
+from typing import Any, Callable, Dict, Optional
+
+import uvicorn
+
+# Set in forked workers: the supervising process, for notify_reload()
+_MASTER_PID: Optional[int] = None
+
+
+def is_worker() -> bool:
+    return _MASTER_PID is not None and os.getppid() == _MASTER_PID
+
+
+def notify_reload() -> bool:
+    """
+    From a worker: ask the supervisor to reload the schema and replace every
+    worker. Returns False outside a pre-forked deployment.
+    """
+    if not is_worker():
+        return False
+    os.kill(_MASTER_PID, signal.SIGHUP)
+    return True
+
+
+class PreforkServer:
+    """
+    Pre-forking supervisor for an ASGI app: the parent binds the socket,
+    runs ``preload`` (load the schema snapshot and indexes) and forks
+    ``workers`` processes that each serve ``app_factory()`` with uvicorn on
+    the shared socket, letting the kernel spread connections between them.
+    Everything loaded before the fork is shared copy-on-write; ``gc.freeze()``
+    keeps the workers' garbage collector from writing to those pages.
+
+    Workers exit after ``max_requests`` requests (plus up to
+    ``max_requests_jitter``, so they do not all restart at once) or on
+    SIGTERM, finishing in-flight requests within ``graceful_timeout``
+    seconds; the parent forks a replacement. On SIGHUP, or when ``version()``
+    changes (e.g. the schema watcher installed new files), the parent calls
+    ``reload`` and replaces all workers: new ones start first, old ones
+    drain. SIGTERM/SIGINT stop everything gracefully.
+
+    The parent forks for as long as it runs, so ``preload`` must not leave
+    threads behind (a lock held by one at fork time stays locked in the
+    child). Periodic work such as watching files belongs in ``version``,
+    which is polled every ``check_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        app_factory: Callable[[], Any],
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        workers: int = 2,
+        max_requests: int = 0,
+        max_requests_jitter: int = 0,
+        graceful_timeout: float = 30.0,
+        preload: Optional[Callable[[], None]] = None,
+        version: Optional[Callable[[], str]] = None,
+        reload: Optional[Callable[[], None]] = None,
+        check_interval: float = 1.0,
+        backlog: int = 2048,
+        log_level: str = "info",
+    ):
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        self.app_factory = app_factory
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.max_requests = max(0, max_requests)
+        self.max_requests_jitter = max(0, max_requests_jitter)
+        self.graceful_timeout = graceful_timeout
+        self.preload = preload
+        self.version = version
+        self.reload = reload
+        self.check_interval = check_interval
+        self.backlog = backlog
+        self.log_level = log_level
+
+        self._sock: Optional[socket.socket] = None
+        self._children: Dict[int, float] = {}  # pid -> start time
+        self._retiring: Dict[int, float] = {}  # pid -> time SIGTERM was sent
+        self._served_version = ""
+        self._stopping = False
+        self._reload_requested = False
+        self._failures = 0
+
+    # ----------------------------
+    # Parent
+    # ----------------------------
+    def _log(self, message: str) -> None:
+        print(f"[Prefork {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+    def _bind(self) -> socket.socket:
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(self.backlog)
+        sock.set_inheritable(True)
+        return sock
+
+    def _current_version(self) -> str:
+        try:
+            return self.version() if self.version is not None else ""
+        except Exception as e:
+            self._log(f"Could not read the served version: {e}")
+            return self._served_version
+
+    def _spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._worker()
+            except BaseException as e:  # the child must never return into the parent's loop
+                print(f"[WorkerError] Worker {os.getpid()} crashed: {e}", file=sys.stderr, flush=True)
+                code = 1
+            finally:
+                os._exit(code)
+        self._children[pid] = time.monotonic()
+
+    def _retire(self, pids: Any) -> None:
+        for pid in pids:
+            if pid in self._children and pid not in self._retiring:
+                self._retiring[pid] = time.monotonic()
+                self._signal(pid, signal.SIGTERM)
+
+    def _signal(self, pid: int, sig: int) -> None:
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = self._children.pop(pid, time.monotonic())
+            retired = self._retiring.pop(pid, None) is not None
+            code = os.waitstatus_to_exitcode(status)
+            if self._stopping or retired:
+                continue
+            if code == 0:
+                self._log(f"Worker {pid} recycled")
+                self._failures = 0
+            else:
+                self._log(f"Worker {pid} exited with {code}")
+                # Crash loop (e.g. bad config): back off instead of forking non-stop
+                if time.monotonic() - started < 5.0:
+                    self._failures += 1
+                    time.sleep(min(30.0, 0.5 * 2 ** self._failures))
+
+    def _roll(self, reason: str) -> None:
+        """Replace every worker: start the new generation, then drain the old one."""
+        old = [pid for pid in self._children if pid not in self._retiring]
+        self._log(f"Replacing {len(old)} worker(s): {reason}")
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+        for _ in range(self.workers):
+            self._spawn()
+        self._retire(old)
+
+    def _on_stop(self, signum: int, _frame: Any) -> None:
+        self._stopping = True
+
+    def _on_reload(self, signum: int, _frame: Any) -> None:
+        self._reload_requested = True
+
+    def run(self) -> None:
+        self._sock = self._bind()
+        self._log(f"Listening on http://{self.host}:{self.port} with {self.workers} worker(s)")
+        if self.preload is not None:
+            self.preload()
+        self._served_version = self._current_version()
+        # Objects loaded so far are shared with the workers; stop the GC from touching them
+        gc.collect()
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        try:
+            for _ in range(self.workers):
+                self._spawn()
+            while not self._stopping:
+                time.sleep(self.check_interval)
+                self._reap()
+                if self._stopping:
+                    break
+                if self._reload_requested:
+                    self._reload_requested = False
+                    if self.reload is not None:
+                        try:
+                            self.reload()
+                        except Exception as e:
+                            self._log(f"Reload failed, keeping the current workers: {e}")
+                            continue
+                    self._served_version = self._current_version()
+                    self._roll("reload requested")
+                    continue
+                version = self._current_version()
+                if version != self._served_version:
+                    self._served_version = version
+                    self._roll(f"now serving {version}")
+                    continue
+                active = [pid for pid in self._children if pid not in self._retiring]
+                for _ in range(self.workers - len(active)):
+                    self._spawn()
+                # Old generation still draining past the grace period
+                now = time.monotonic()
+                for pid, since in list(self._retiring.items()):
+                    if now - since > self.graceful_timeout + 5:
+                        self._signal(pid, signal.SIGKILL)
+        finally:
+            self._shutdown()
+
+    def _shutdown(self) -> None:
+        self._stopping = True
+        self._log("Shutting down")
+        self._retire(list(self._children))
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self._children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self._children):
+            self._signal(pid, signal.SIGKILL)
+        while self._children:
+            try:
+                pid, _ = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            self._children.pop(pid, None)
+        if self._sock is not None:
+            self._sock.close()
+
+    # ----------------------------
+    # Worker
+    # ----------------------------
+    def _worker(self) -> None:
+        global _MASTER_PID
+        _MASTER_PID = os.getppid()
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, signal.SIG_DFL)
+        random.seed()
+        limit = self.max_requests + random.randint(0, self.max_requests_jitter) if self.max_requests else None
+        config = uvicorn.Config(
+            self.app_factory(),
+            log_level=self.log_level,
+            limit_max_requests=limit,
+            timeout_graceful_shutdown=int(self.graceful_timeout),
+        )
+        server = uvicorn.Server(config)
+        asyncio.run(server.serve(sockets=[self._sock]))
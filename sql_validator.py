@@ -0,0 +1,294 @@
+import re
+from functools import lru_cache
+from typing import FrozenSet, List, NamedTuple, Optional, Tuple
+
+_TOKEN_RE = re.compile(
+    r"""
+      (?P<ws>\s+)
+    | (?P<exec_comment>/\*!.*?\*/)
+    | (?P<comment>--(?:\s[^\n]*)?(?=\n|$)|\#[^\n]*|/\*.*?\*/)
+    | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+    | (?P<quoted>`(?:[^`]|``)+`)
+    | (?P<number>\d+(?:\.\d+)?(?:[eE][-+]?\d+)?(?![A-Za-z0-9_$]))
+    | (?P<word>\d*[A-Za-z_$][A-Za-z0-9_$]*)
+    | (?P<var>@@?[A-Za-z0-9_$.]*)
+    | (?P<unterminated>/\*|['"`])
+    | (?P<op>.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+SYSTEM_SCHEMAS = frozenset({"information_schema", "mysql", "performance_schema", "sys"})
+
+# Functions that block, read server files or take locks.
+FORBIDDEN_FUNCTIONS = frozenset({
+    "SLEEP", "BENCHMARK", "LOAD_FILE", "GET_LOCK", "RELEASE_LOCK", "RELEASE_ALL_LOCKS",
+    "IS_FREE_LOCK", "IS_USED_LOCK", "MASTER_POS_WAIT", "SOURCE_POS_WAIT",
+    "WAIT_FOR_EXECUTED_GTID_SET",
+})
+
+JOIN_KEYWORDS = frozenset({"JOIN", "STRAIGHT_JOIN"})
+
+# Words after which a MySQL 8 ``TABLE <name>`` query may follow.
+SET_OPERATORS = frozenset({"UNION", "EXCEPT", "INTERSECT", "ALL", "DISTINCT"})
+
+# Words that end a table reference, i.e. can never be a bare alias.
+CLAUSE_KEYWORDS = frozenset({
+    "WHERE", "GROUP", "ORDER", "LIMIT", "HAVING", "JOIN", "INNER", "LEFT", "RIGHT",
+    "CROSS", "NATURAL", "STRAIGHT_JOIN", "FULL", "OUTER", "ON", "USING", "UNION",
+    "EXCEPT", "INTERSECT", "WINDOW", "FOR", "LOCK", "INTO", "PARTITION", "USE",
+    "FORCE", "IGNORE", "AS", "SELECT", "FROM", "OFFSET",
+})
+
+# Clauses that end a FROM list at the same nesting level.
+FROM_TERMINATORS = frozenset({
+    "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT", "UNION", "EXCEPT", "INTERSECT",
+    "WINDOW", "INTO", "FOR", "LOCK", "SELECT",
+})
+
+
+class Token(NamedTuple):
+    kind: str   # word | quoted | string | number | var | op
+    value: str  # identifiers unquoted; words upper-cased in ``upper``
+    upper: str
+    start: int  # offset in the original query
+
+
+class SqlAnalysis(NamedTuple):
+    statement_type: str
+    tables: FrozenSet[Tuple[Optional[str], str]]  # (schema or None, table)
+    ctes: FrozenSet[str]
+    problems: Tuple[str, ...]
+
+
+class Verdict(NamedTuple):
+    allowed: bool
+    reasons: Tuple[str, ...]
+    statement_type: str
+    tables: Tuple[str, ...]
+
+
+def tokenize_sql(query: str) -> Tuple[List[Token], List[str]]:
+    """
+    Split a MySQL statement into significant tokens (whitespace and comments
+    dropped). Returns ``(tokens, problems)``.
+    """
+    tokens: List[Token] = []
+    problems: List[str] = []
+    for m in _TOKEN_RE.finditer(query):
+        kind = m.lastgroup
+        text = m.group()
+        if kind in ("ws", "comment"):
+            continue
+        if kind == "exec_comment":
+            problems.append("MySQL executable comments (/*! ... */) are not allowed.")
+            continue
+        if kind == "unterminated":
+            problems.append("Unterminated string, identifier or comment.")
+            continue
+        if kind == "quoted":
+            text = text[1:-1].replace("``", "`")
+        tokens.append(Token(kind, text, text.upper() if kind == "word" else text, m.start()))
+    return tokens, problems
+
+
+def _is_ident(tok: Optional[Token]) -> bool:
+    return tok is not None and (tok.kind == "quoted" or (tok.kind == "word" and tok.upper not in CLAUSE_KEYWORDS))
+
+
+def _is_op(tok: Optional[Token], value: str) -> bool:
+    return tok is not None and tok.kind == "op" and tok.value == value
+
+
+def _skip_parens(tokens: List[Token], i: int) -> int:
+    """``tokens[i]`` is '('; return the index just past its matching ')'."""
+    depth = 0
+    while i < len(tokens):
+        if _is_op(tokens[i], "("):
+            depth += 1
+        elif _is_op(tokens[i], ")"):
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+def _read_table_ref(tokens: List[Token], i: int, out: List[Tuple[Optional[str], str]]) -> int:
+    """
+    Record the ``[schema.]table`` at ``tokens[i]`` in ``out`` and return the
+    index past its partition list, alias and index hints.
+    """
+    n = len(tokens)
+    if i + 2 < n and _is_op(tokens[i + 1], ".") and _is_ident(tokens[i + 2]):
+        ref = (tokens[i].value, tokens[i + 2].value)
+        i += 3
+    else:
+        ref = (None, tokens[i].value)
+        i += 1
+    if not (ref[0] is None and ref[1].upper() == "DUAL"):
+        out.append(ref)
+
+    if i + 1 < n and tokens[i].upper == "PARTITION" and _is_op(tokens[i + 1], "("):
+        i = _skip_parens(tokens, i + 1)
+    if i < n and tokens[i].upper == "AS":
+        i += 1
+    if i < n and _is_ident(tokens[i]):
+        i += 1
+    while i + 1 < n and tokens[i].upper in ("USE", "FORCE", "IGNORE") and tokens[i + 1].upper in ("INDEX", "KEY"):
+        i += 2
+        while i < n and not _is_op(tokens[i], "("):
+            i += 1
+        i = _skip_parens(tokens, i)
+    return i
+
+
+@lru_cache(maxsize=4096)
+def analyze_sql(query: str) -> SqlAnalysis:
+    """
+    Statement type, referenced tables, CTE names and any structural problems
+    of ``query``. Results are cached by query text, so repeated validation of
+    the same SQL is a dictionary lookup.
+    """
+    tokens, problems = tokenize_sql(query)
+
+    # Statement count: ignore trailing semicolons
+    while tokens and _is_op(tokens[-1], ";"):
+        tokens.pop()
+    if any(_is_op(t, ";") for t in tokens):
+        problems.append("Only a single statement is allowed.")
+
+    first = next((t for t in tokens if not _is_op(t, "(")), None)
+    statement_type = first.upper if first is not None and first.kind == "word" else ""
+    if statement_type == "WITH":
+        statement_type = "SELECT"
+    if statement_type != "SELECT":
+        problems.append(f"Only read-only SELECT queries are allowed (got {statement_type or 'nothing'}).")
+
+    refs: List[Tuple[Optional[str], str]] = []
+    ctes = set()
+    # One frame per open parenthesis: [kind, in_from, expect_ref] where kind is
+    # "query" (subquery), "join" (parenthesised table list) or "expr" (function
+    # call / expression, where FROM is syntax as in EXTRACT(YEAR FROM d)).
+    stack = [["query", False, False]]
+    i, n = 0, len(tokens)
+    while i < n:
+        tok = tokens[i]
+        frame = stack[-1]
+        u = tok.upper if tok.kind == "word" else ""
+        nxt = tokens[i + 1] if i + 1 < n else None
+
+        if _is_op(tok, "("):
+            if nxt is not None and nxt.upper in ("SELECT", "WITH", "TABLE", "VALUES"):
+                kind = "query"
+            elif frame[2]:
+                kind = "join"
+            else:
+                kind = "expr"
+            frame[2] = False
+            stack.append([kind, kind == "join", kind == "join"])
+            i += 1
+            continue
+        if _is_op(tok, ")"):
+            if len(stack) > 1:
+                stack.pop()
+            i += 1
+            continue
+
+        if u == "TABLE":
+            # MySQL 8 ``TABLE t`` is a query on its own: as the statement, a
+            # subquery or a set operand. Read its table like a FROM reference.
+            prev = tokens[i - 1] if i else None
+            if i and not (_is_op(prev, "(") or prev.upper in SET_OPERATORS):
+                problems.append("TABLE is only allowed as a query or subquery.")
+            elif _is_ident(nxt):
+                i = _read_table_ref(tokens, i + 1, refs)
+                continue
+            else:
+                problems.append("TABLE must be followed by a table name.")
+            i += 1
+            continue
+
+        if frame[2]:
+            if u == "LATERAL":
+                i += 1
+                continue
+            frame[2] = False
+            if _is_ident(tok):
+                if not _is_op(nxt, "("):  # NAME( is a table function
+                    i = _read_table_ref(tokens, i, refs)
+                    continue
+            elif tok.kind != "word":
+                problems.append(f"Expected a table name, got {tok.value!r}.")
+
+        if u == "FROM" and frame[0] != "expr":
+            frame[1] = frame[2] = True
+        elif u in JOIN_KEYWORDS:
+            frame[2] = True
+        elif frame[1] and _is_op(tok, ","):
+            frame[2] = True
+        elif u in FROM_TERMINATORS:
+            frame[1] = False
+
+        if u in ("INTO", "OUTFILE", "DUMPFILE"):
+            problems.append("SELECT ... INTO is not allowed.")
+        elif u == "FOR" and nxt is not None and nxt.upper in ("UPDATE", "SHARE"):
+            problems.append("Locking reads (FOR UPDATE / FOR SHARE) are not allowed.")
+        elif u == "LOCK" and nxt is not None and nxt.upper == "IN":
+            problems.append("Locking reads (LOCK IN SHARE MODE) are not allowed.")
+        elif u in FORBIDDEN_FUNCTIONS and _is_op(nxt, "("):
+            problems.append(f"Function {u}() is not allowed.")
+        elif _is_ident(tok) and nxt is not None:
+            # CTE / named window: name [(cols)] AS (
+            j = i + 1
+            if _is_op(tokens[j], "("):
+                j = _skip_parens(tokens, j)
+            if j + 1 < n and tokens[j].upper == "AS" and _is_op(tokens[j + 1], "("):
+                ctes.add(tok.value.lower())
+        i += 1
+
+    tables = frozenset(
+        (schema, table) for schema, table in refs
+        if not (schema is None and table.lower() in ctes)
+    )
+    return SqlAnalysis(statement_type, tables, frozenset(ctes), tuple(dict.fromkeys(problems)))
+
+
+@lru_cache(maxsize=16)
+def _lowered(names: FrozenSet[str]) -> FrozenSet[str]:
+    return frozenset(n.lower() for n in names)
+
+
+def validate_sql(
+    query: str,
+    allowed_tables: FrozenSet[str],
+    allowed_schemas: FrozenSet[str] = frozenset(),
+) -> Verdict:
+    """
+    Allow/deny ``query`` with reasons: a single read-only SELECT whose every
+    table reference is in ``allowed_tables`` and whose schema qualifiers, if
+    any, are in ``allowed_schemas``. System schemas are always denied.
+    """
+    if not query or not query.strip():
+        return Verdict(False, ("Query cannot be empty.",), "", ())
+    analysis = analyze_sql(query)
+    reasons = list(analysis.problems)
+
+    allowed = _lowered(frozenset(allowed_tables))
+    schemas = _lowered(frozenset(allowed_schemas))
+    unknown = []
+    for schema, table in sorted(analysis.tables, key=lambda r: (r[0] or "", r[1])):
+        if schema is not None:
+            if schema.lower() in SYSTEM_SCHEMAS:
+                reasons.append(f"System schema '{schema}' is not allowed.")
+                continue
+            if schema.lower() not in schemas:
+                reasons.append(f"Schema '{schema}' is not allowed.")
+                continue
+        if table.lower() not in allowed:
+            unknown.append(table)
+    if unknown:
+        reasons.append(f"Unknown or unauthorized table(s): {', '.join(unknown)}.")
+
+    tables = tuple(sorted({t for _, t in analysis.tables}))
+    return Verdict(not reasons, tuple(dict.fromkeys(reasons)), analysis.statement_type, tables)
@@ -0,0 +1,138 @@
+import pytest
+
+from sql_validator import analyze_sql, tokenize_sql, validate_sql
+
+TABLES = frozenset({"orders_booking", "orders_shipment", "customers"})
+SCHEMAS = frozenset({"ornate"})
+
+
+def check(query):
+    return validate_sql(query, TABLES, SCHEMAS)
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM orders_booking",
+    "select id, total from orders_booking where id = 1;",
+    "SELECT b.id FROM orders_booking b JOIN orders_shipment s ON s.booking_id = b.id",
+    "SELECT * FROM ornate.orders_booking",
+    "SELECT * FROM `orders_booking` AS `b`",
+    "SELECT * FROM (orders_booking b LEFT JOIN customers c ON c.id = b.customer_id)",
+    "SELECT * FROM orders_booking WHERE id IN (SELECT booking_id FROM orders_shipment)",
+    "SELECT * FROM orders_booking, customers WHERE customers.id = orders_booking.customer_id",
+    "SELECT EXTRACT(YEAR FROM created_at), COUNT(*) FROM orders_booking GROUP BY 1",
+    "SELECT TRIM(BOTH ' ' FROM name), SUBSTRING(name FROM 1 FOR 3) FROM customers",
+    "SELECT 1 FROM DUAL",
+    "SELECT 1e5, 0.5 FROM orders_booking LIMIT 10, 20",
+    "SELECT 'it''s -- not a comment; DROP TABLE x' AS s FROM customers",
+    "SELECT * FROM orders_booking -- trailing comment",
+    "SELECT * FROM orders_booking UNION ALL TABLE orders_booking",
+])
+def test_allows_read_only_selects(query):
+    verdict = check(query)
+    assert verdict.allowed, verdict.reasons
+    assert verdict.statement_type == "SELECT"
+
+
+@pytest.mark.parametrize("query", [
+    "WITH recent AS (SELECT * FROM orders_booking) SELECT * FROM recent",
+    "WITH a AS (SELECT id FROM customers), b (x) AS (SELECT x FROM a) SELECT * FROM a JOIN b ON a.id = b.x",
+    "WITH RECURSIVE n AS (SELECT 1 AS v UNION ALL SELECT v + 1 FROM n WHERE v < 5) SELECT * FROM n",
+    "WITH x AS (TABLE orders_booking) SELECT * FROM x",
+])
+def test_cte_names_are_not_tables(query):
+    verdict = check(query)
+    assert verdict.allowed, verdict.reasons
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM orders_booking WHERE id IN (TABLE mysql.user)",
+    "WITH x AS (TABLE mysql.user) SELECT * FROM x",
+    "SELECT * FROM orders_booking WHERE EXISTS (TABLE information_schema.processlist)",
+    "SELECT * FROM (TABLE mysql.user) u",
+    "SELECT * FROM orders_booking UNION TABLE mysql.user",
+    "SELECT * FROM orders_booking WHERE id IN (TABLE secrets)",
+    "SELECT * FROM orders_booking WHERE id = TABLE secrets",
+])
+def test_rejects_table_statements_on_other_tables(query):
+    assert not check(query).allowed
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM 1secret",
+    'SELECT * FROM "mysql"."user"',
+    "SELECT * FROM 'orders_booking'",
+    "SELECT * FROM orders_booking JOIN 42",
+    "SELECT * FROM orders_booking, @t",
+])
+def test_rejects_non_identifiers_in_table_position(query):
+    assert not check(query).allowed
+
+
+def test_digit_leading_identifiers_are_words():
+    tokens, problems = tokenize_sql("SELECT 1secret, 1e5, 12 FROM t")
+    assert not problems
+    assert [(t.kind, t.value) for t in tokens[1:6:2]] == [("word", "1secret"), ("number", "1e5"), ("number", "12")]
+    assert analyze_sql("SELECT * FROM 1secret").tables == frozenset({(None, "1secret")})
+
+
+@pytest.mark.parametrize("query,schema", [
+    ("SELECT * FROM mysql.user", "mysql"),
+    ("SELECT * FROM information_schema.tables", "information_schema"),
+    ("SELECT * FROM `performance_schema`.`threads`", "performance_schema"),
+    ("SELECT * FROM orders_booking b JOIN sys.session s ON 1 = 1", "sys"),
+])
+def test_rejects_system_schemas(query, schema):
+    verdict = check(query)
+    assert not verdict.allowed
+    assert f"System schema '{schema}' is not allowed." in verdict.reasons
+
+
+def test_rejects_other_schemas_and_unknown_tables():
+    assert not check("SELECT * FROM other.orders_booking").allowed
+    verdict = check("SELECT * FROM orders_booking JOIN payroll ON 1 = 1")
+    assert not verdict.allowed
+    assert "Unknown or unauthorized table(s): payroll." in verdict.reasons
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM orders_booking /*!50000 UNION SELECT * FROM mysql.user */",
+    "SELECT /*!32302 1 */ FROM orders_booking",
+])
+def test_rejects_executable_comments(query):
+    assert not check(query).allowed
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM orders_booking INTO OUTFILE '/tmp/x'",
+    "SELECT * INTO @v FROM orders_booking",
+    "SELECT * FROM orders_booking INTO DUMPFILE '/tmp/x'",
+    "SELECT * FROM orders_booking FOR UPDATE",
+    "SELECT * FROM orders_booking FOR SHARE",
+    "SELECT * FROM orders_booking LOCK IN SHARE MODE",
+])
+def test_rejects_into_and_locking_reads(query):
+    assert not check(query).allowed
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM orders_booking; DROP TABLE orders_booking",
+    "SELECT 1; SELECT 2",
+])
+def test_rejects_multiple_statements(query):
+    verdict = check(query)
+    assert not verdict.allowed
+    assert "Only a single statement is allowed." in verdict.reasons
+
+
+@pytest.mark.parametrize("query", [
+    "",
+    "   ",
+    "DELETE FROM orders_booking",
+    "UPDATE orders_booking SET total = 0",
+    "TABLE orders_booking",
+    "SHOW TABLES",
+    "SELECT SLEEP(10) FROM orders_booking",
+    "SELECT * FROM orders_booking WHERE name = 'unterminated",
+])
+def test_rejects_other_statements_and_functions(query):
+    assert not check(query).allowed
@@ -167,15 +167,36 @@
 
 import os
 import re
+import json
 import sys
 import yaml
-import pathlib
-from typing import Dict, Any, List, Tuple
+import threading
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, FrozenSet, List, Sequence, Tuple, Optional
 
 from dotenv import load_dotenv
 from mcp.server.fastmcp import FastMCP
+from starlette.requests import Request
+from starlette.responses import JSONResponse
 import mysql.connector
-from openai import OpenAI
+
+from db_pool import ConnectionPool, PoolTimeoutError
+from db_router import RoutingError, build_router
+from answer_store import AnswerRefresher, AnswerStore
+from example_store import ExampleStore
+from schema_snapshot import SchemaSnapshot, SchemaWatcher, load_schema
+from vector_index import HAS_NUMPY, SemanticRetriever, get_embedder, reciprocal_rank_fusion
+from query_cache import TTLCache, normalize_question, normalize_sql
+from result_stream import StreamRegistry, StreamLimitError, StreamNotFoundError
+from sql_validator import Verdict, validate_sql
+from prompt_builder import count_tokens, render_compact_schema
+from query_plan import PlanGuard, with_max_execution_time
+from tracing import Tracer
+from llm_client import LLMClient, set_default_client
+from result_format import COMPRESSIONS, compact_result
+from serve import PreforkServer, is_worker, notify_reload
 
 # ----------------------------
 # Bootstrapping
@@ -210,9 +231,175 @@ try:
         "password": DB_PASSWORD,
         "database": DB_NAME,
     }
+
+    DB_POOL_SIZE = _env_or_raise("DB_POOL_SIZE", 5, int)
+    DB_POOL_TIMEOUT = _env_or_raise("DB_POOL_TIMEOUT", 10.0, float)
+    DB_POOL_MAX_IDLE = _env_or_raise("DB_POOL_MAX_IDLE", 300.0, float)
+    DB_POOL_MAX_LIFETIME = _env_or_raise("DB_POOL_MAX_LIFETIME", 1800.0, float)
+    DB_EXECUTOR_WORKERS = _env_or_raise("DB_EXECUTOR_WORKERS", DB_POOL_SIZE, int)
+    # Read routing (see db_router.py): DB_ROUTES_FILE maps schema modules to
+    # databases and their replicas; without it, DB_READ_REPLICAS
+    # ("host[:port],...") are replicas of DB_HOST. Replicas further than
+    # DB_REPLICA_MAX_LAG seconds behind are skipped (0 = do not check).
+    DB_ROUTES_FILE = os.getenv("DB_ROUTES_FILE", "")
+    DB_READ_REPLICAS = [h.strip() for h in os.getenv("DB_READ_REPLICAS", "").split(",") if h.strip()]
+    DB_REPLICA_MAX_LAG = _env_or_raise("DB_REPLICA_MAX_LAG", 30.0, float)
+    DB_REPLICA_CHECK_INTERVAL = _env_or_raise("DB_REPLICA_CHECK_INTERVAL", 5.0, float)
+    DB_REPLICA_FALLBACK_PRIMARY = _env_or_raise("DB_REPLICA_FALLBACK_PRIMARY", "1").lower() in ("1", "true", "yes")
+
+    # Per-call timeouts (seconds)
+    LLM_TIMEOUT = _env_or_raise("LLM_TIMEOUT", 60.0, float)
+    DB_QUERY_TIMEOUT = _env_or_raise("DB_QUERY_TIMEOUT", 30.0, float)
+    # Server-side cap on every SELECT via a MAX_EXECUTION_TIME hint (ms; 0 disables).
+    # Streams keep their statement open while pages are read, so they get their own.
+    DB_MAX_EXECUTION_MS = _env_or_raise("DB_MAX_EXECUTION_MS", int(DB_QUERY_TIMEOUT * 1000), int)
+    STREAM_MAX_EXECUTION_MS = _env_or_raise("STREAM_MAX_EXECUTION_MS", 600000, int)
+    # Driver socket timeout (seconds), a backstop should KILL QUERY not get through
+    DB_CONFIG["read_timeout"] = _env_or_raise("DB_READ_TIMEOUT", int(DB_QUERY_TIMEOUT) + 5, int)
+
+    # EXPLAIN pre-flight: "off", "reject" (refuse expensive queries) or "rewrite"
+    # (run them with PLAN_REWRITE_MAX_ROWS and PLAN_REWRITE_EXECUTION_MS instead)
+    PLAN_GUARD_MODE = _env_or_raise("PLAN_GUARD", "off")
+    PLAN_MAX_ROWS = _env_or_raise("PLAN_MAX_ROWS", 5000000, int)
+    PLAN_MAX_COST = _env_or_raise("PLAN_MAX_COST", 0.0, float)
+    PLAN_CACHE_TTL = _env_or_raise("PLAN_CACHE_TTL", 600.0, float)
+    PLAN_REWRITE_MAX_ROWS = _env_or_raise("PLAN_REWRITE_MAX_ROWS", 100, int)
+    PLAN_REWRITE_EXECUTION_MS = _env_or_raise("PLAN_REWRITE_EXECUTION_MS", 5000, int)
+
+    # Streaming results: each open stream holds one pooled connection
+    STREAM_MAX_OPEN = _env_or_raise("STREAM_MAX_OPEN", max(1, DB_POOL_SIZE // 2), int)
+    STREAM_IDLE_TTL = _env_or_raise("STREAM_IDLE_TTL", 300.0, float)
+    STREAM_MAX_PAGE_SIZE = _env_or_raise("STREAM_MAX_PAGE_SIZE", 5000, int)
+    # result_format="compact" results are compressed (if asked) from this many bytes
+    RESULT_COMPRESS_THRESHOLD = _env_or_raise("RESULT_COMPRESS_THRESHOLD", 65536, int)
+
+    # Table retrieval: "bm25" (lexical only), "vector" (embeddings only) or
+    # "hybrid"; the default is hybrid when numpy is installed, bm25 otherwise
+    RETRIEVAL_MODE = _env_or_raise("RETRIEVAL_MODE", "hybrid" if HAS_NUMPY else "bm25")
+    if RETRIEVAL_MODE != "bm25" and not HAS_NUMPY:
+        print(f"[RetrievalWarning] RETRIEVAL_MODE={RETRIEVAL_MODE} without numpy scores vectors in pure Python (slow).", file=sys.stderr)
+    EMBEDDING_BACKEND = _env_or_raise("EMBEDDING_BACKEND", "hashing")
+    VECTOR_INDEX_DIR = _env_or_raise("VECTOR_INDEX_DIR", ".vector_index")
+
+    SCHEMA_DIR = _env_or_raise("SCHEMA_DIR", "schemas")
+    # Compiled schema + prebuilt indexes (see schema_snapshot.py); rebuilt when stale
+    SCHEMA_SNAPSHOT = _env_or_raise("SCHEMA_SNAPSHOT", ".schema_snapshot.pkl")
+    # Poll the schema directory and hot-swap the snapshot on change; 0 disables
+    SCHEMA_WATCH_INTERVAL = _env_or_raise("SCHEMA_WATCH_INTERVAL", 2.0, float)
+    # NL -> SQL cache (keyed by normalized question + schema version) and SQL -> rows cache
+    SQL_CACHE_SIZE = _env_or_raise("SQL_CACHE_SIZE", 1024, int)
+    SQL_CACHE_TTL = _env_or_raise("SQL_CACHE_TTL", 86400.0, float)
+    RESULT_CACHE_SIZE = _env_or_raise("RESULT_CACHE_SIZE", 256, int)
+    RESULT_CACHE_TTL = _env_or_raise("RESULT_CACHE_TTL", 60.0, float)
+    # Materialized answers (SQLite file shared by all workers; empty disables):
+    # the ANSWER_MAX_ENTRIES SELECTs with the most time to save (seen at least
+    # ANSWER_MIN_HITS times, slower than ANSWER_MIN_MS) are re-run every
+    # ANSWER_REFRESH_INTERVAL seconds and served while younger than ANSWER_MAX_AGE.
+    ANSWER_STORE = os.getenv("ANSWER_STORE", "")
+    ANSWER_MAX_ENTRIES = _env_or_raise("ANSWER_MAX_ENTRIES", 50, int)
+    ANSWER_MIN_HITS = _env_or_raise("ANSWER_MIN_HITS", 3.0, float)
+    ANSWER_MIN_MS = _env_or_raise("ANSWER_MIN_MS", 200.0, float)
+    ANSWER_REFRESH_INTERVAL = _env_or_raise("ANSWER_REFRESH_INTERVAL", 300.0, float)
+    ANSWER_MAX_AGE = _env_or_raise("ANSWER_MAX_AGE", 900.0, float)
+    # Schema context for generate_sql: "compact" (one line per column, pruned
+    # to PROMPT_TOKEN_BUDGET tokens) or "yaml" (full YAML of each table)
+    PROMPT_FORMAT = _env_or_raise("PROMPT_FORMAT", "compact")
+    PROMPT_TOKEN_BUDGET = _env_or_raise("PROMPT_TOKEN_BUDGET", 1500, int)
+    # Append sampled values/ranges (generate_schema_yaml.py --stats) to the columns shown
+    PROMPT_COLUMN_STATS = _env_or_raise("PROMPT_COLUMN_STATS", "1").lower() in ("1", "true", "yes")
+    # Bridge tables added to connect the retrieved ones through the join graph
+    JOIN_MAX_HOPS = _env_or_raise("JOIN_MAX_HOPS", 3, int)
+    JOIN_MAX_BRIDGES = _env_or_raise("JOIN_MAX_BRIDGES", 3, int)
+    # ask_db repair loop: SQL attempts per question and overall deadline (seconds)
+    ASK_DB_MAX_ATTEMPTS = _env_or_raise("ASK_DB_MAX_ATTEMPTS", 3, int)
+    ASK_DB_DEADLINE = _env_or_raise("ASK_DB_DEADLINE", 90.0, float)
+    # ask_db_batch: questions per call, questions per combined LLM request,
+    # tables in a combined prompt and queries executed at once
+    ASK_DB_BATCH_MAX = _env_or_raise("ASK_DB_BATCH_MAX", 50, int)
+    ASK_DB_BATCH_SIZE = _env_or_raise("ASK_DB_BATCH_SIZE", 8, int)
+    ASK_DB_BATCH_TABLES = _env_or_raise("ASK_DB_BATCH_TABLES", 12, int)
+    ASK_DB_BATCH_CONCURRENCY = _env_or_raise("ASK_DB_BATCH_CONCURRENCY", DB_EXECUTOR_WORKERS, int)
+    ASK_DB_BATCH_TOKEN_BUDGET = _env_or_raise("ASK_DB_BATCH_TOKEN_BUDGET", 2 * PROMPT_TOKEN_BUDGET, int)
+    # Question -> SQL pairs that ask_db ran successfully (SQLite file; empty
+    # disables): the FEWSHOT_K most similar are shown to the model, and with
+    # FEWSHOT_EXACT the same question (ignoring case, whitespace and trailing
+    # punctuation) reuses its SQL without an LLM call.
+    FEWSHOT_STORE = os.getenv("FEWSHOT_STORE", ".fewshot_examples.db")
+    FEWSHOT_MAX_EXAMPLES = _env_or_raise("FEWSHOT_MAX_EXAMPLES", 500, int)
+    FEWSHOT_K = _env_or_raise("FEWSHOT_K", 3, int)
+    FEWSHOT_MIN_SIMILARITY = _env_or_raise("FEWSHOT_MIN_SIMILARITY", 0.3, float)
+    FEWSHOT_EXACT = _env_or_raise("FEWSHOT_EXACT", "0").lower() in ("1", "true", "yes")
+    # Shared LLM client: OpenAI-compatible endpoint (unset = api.openai.com),
+    # model, requests in flight and retries on 429/5xx
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")
+    LLM_MODEL = _env_or_raise("LLM_MODEL", "gpt-4o-mini")
+    LLM_MAX_CONCURRENCY = _env_or_raise("LLM_MAX_CONCURRENCY", 8, int)
+    LLM_MAX_RETRIES = _env_or_raise("LLM_MAX_RETRIES", 4, int)
+    # Per-stage spans: appended as JSON lines to TRACE_LOG (unset = no file),
+    # mirrored to OpenTelemetry with TRACE_OTEL=1, summarised by get_metrics
+    TRACE_LOG = os.getenv("TRACE_LOG", "")
+    TRACE_OTEL = _env_or_raise("TRACE_OTEL", "0").lower() in ("1", "true", "yes")
+    METRICS_WINDOW = _env_or_raise("METRICS_WINDOW", 2048, int)
+    # Transport: "stdio" (one client per process), "streamable-http" or "sse"
+    MCP_TRANSPORT = _env_or_raise("MCP_TRANSPORT", "stdio")
+    if MCP_TRANSPORT not in ("stdio", "streamable-http", "sse"):
+        raise ValueError(f"MCP_TRANSPORT must be stdio, streamable-http or sse, not '{MCP_TRANSPORT}'")
+    MCP_HOST = _env_or_raise("MCP_HOST", "127.0.0.1")
+    MCP_PORT = _env_or_raise("MCP_PORT", 8000, int)
+    # streamable-http with MCP_WORKERS > 1: stateless workers forked from a
+    # parent that loaded the schema (see serve.py), each with its own DB pool
+    # and caches, replaced after MCP_WORKER_MAX_REQUESTS requests (0 = never).
+    # Nothing held in process memory is shared: SQL_CACHE and RESULT_CACHE
+    # warm separately per worker (hit rates drop roughly by the worker count,
+    # and restarts empty them), and run_sql_query streaming is refused since
+    # a continuation could reach another worker. The SQLite-backed answer and
+    # example stores are shared.
+    MCP_WORKERS = _env_or_raise("MCP_WORKERS", 1, int)
+    MCP_WORKER_MAX_REQUESTS = _env_or_raise("MCP_WORKER_MAX_REQUESTS", 0, int)
+    MCP_WORKER_MAX_REQUESTS_JITTER = _env_or_raise("MCP_WORKER_MAX_REQUESTS_JITTER", MCP_WORKER_MAX_REQUESTS // 10, int)
+    MCP_GRACEFUL_TIMEOUT = _env_or_raise("MCP_GRACEFUL_TIMEOUT", 30.0, float)
 except Exception as e:
     raise RuntimeError(f"[RuntimeError] Failed to configure environment: {e}")
 
+# ----------------------------
+# Connection pool
+# ----------------------------
+# Owned by the server process; connections are created lazily on first use.
+DB_POOL = ConnectionPool(
+    DB_CONFIG,
+    max_size=DB_POOL_SIZE,
+    acquire_timeout=DB_POOL_TIMEOUT,
+    max_idle_seconds=DB_POOL_MAX_IDLE,
+    max_lifetime_seconds=DB_POOL_MAX_LIFETIME,
+)
+# One pool per server the router may send reads to; DB_POOL is the primary's.
+def _make_pool(config: Dict[str, Any]) -> ConnectionPool:
+    return ConnectionPool(
+        config,
+        max_size=DB_POOL_SIZE,
+        acquire_timeout=DB_POOL_TIMEOUT,
+        max_idle_seconds=DB_POOL_MAX_IDLE,
+        max_lifetime_seconds=DB_POOL_MAX_LIFETIME,
+    )
+
+try:
+    ROUTER = build_router(
+        DB_CONFIG,
+        _make_pool,
+        DB_POOL,
+        routes_file=DB_ROUTES_FILE,
+        replicas=DB_READ_REPLICAS,
+        max_lag=DB_REPLICA_MAX_LAG,
+        lag_check_interval=DB_REPLICA_CHECK_INTERVAL,
+        primary_fallback=DB_REPLICA_FALLBACK_PRIMARY,
+    )
+except Exception as e:
+    raise RuntimeError(f"[RuntimeError] Failed to configure DB routing: {e}")
+# Blocking driver calls run here so that they never stall the event loop.
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="mysql")
+STREAMS = StreamRegistry(DB_POOL, max_open=STREAM_MAX_OPEN, idle_ttl=STREAM_IDLE_TTL)
+PLAN_GUARD = PlanGuard(max_rows=PLAN_MAX_ROWS, max_cost=PLAN_MAX_COST, ttl_seconds=PLAN_CACHE_TTL)
+
 # ----------------------------
 # Schema loading
 # ----------------------------
@@ -230,31 +417,177 @@ except Exception as e:
 #         print(f"[SchemaLoadError] Failed to load schema file: {e}", file=sys.stderr)
 #         return {}
 
-def load_schema_descriptions(path: str = "schemas") -> dict:
-    schema_dir = pathlib.Path(path)
-    all_schemas = {}
+# ----------------------------
+# Caches
+# ----------------------------
+SQL_CACHE = TTLCache(max_size=SQL_CACHE_SIZE, ttl_seconds=SQL_CACHE_TTL)
+RESULT_CACHE = TTLCache(max_size=RESULT_CACHE_SIZE, ttl_seconds=RESULT_CACHE_TTL)
+ANSWERS = AnswerStore(
+    ANSWER_STORE,
+    max_entries=ANSWER_MAX_ENTRIES,
+    min_hits=ANSWER_MIN_HITS,
+    min_ms=ANSWER_MIN_MS,
+    refresh_interval=ANSWER_REFRESH_INTERVAL,
+    max_age=ANSWER_MAX_AGE,
+) if ANSWER_STORE else None
+_answer_refresher: Optional[AnswerRefresher] = None
 
-    if not schema_dir.exists() or not schema_dir.is_dir():
-        print(f"[SchemaLoadError] Schema directory not found: {path}", file=sys.stderr)
-        return {}
+# ----------------------------
+# Tracing
+# ----------------------------
+# Every tool call is a root span; stages below it (retrieval, prompt.build,
+# llm.completion, sql.validate, sql.explain, db.acquire/execute/fetch,
+# result.encode) nest under it. Spans are timed whether or not a log or
+# exporter is configured.
+TRACER = Tracer("chat_with_db", log_path=TRACE_LOG, window=METRICS_WINDOW, otel=TRACE_OTEL)
 
-    for file in schema_dir.glob("*.yaml"):
+# ----------------------------
+# Schema snapshot
+# ----------------------------
+# The schema is not parsed at import: the first caller loads the compiled
+# snapshot (or parses the YAML and writes one) via get_schema(). Afterwards
+# SchemaWatcher replaces it whenever the files change; readers just take
+# whatever snapshot get_schema() returns, which is never mutated.
+_schema: Optional[SchemaSnapshot] = None
+_schema_lock = threading.Lock()
+_retriever: Optional[Tuple[SchemaSnapshot, SemanticRetriever]] = None
+_watcher: Optional[SchemaWatcher] = None
+# A pre-fork supervisor polls the watcher from its own loop instead (see
+# serve_http): forking while another thread holds a lock can deadlock the child.
+_watch_in_thread = True
+_watch_polled_at = 0.0
+# Set by serve_http for stateless pre-forked workers: any worker may get any
+# call, so per-process state such as open result streams cannot be resumed.
+_stateless_workers = False
+
+def get_schema() -> SchemaSnapshot:
+    global _schema
+    if _schema is None:
+        with _schema_lock:
+            if _schema is None:
+                _schema = load_schema(SCHEMA_DIR, SCHEMA_SNAPSHOT)
+                _start_schema_watcher()
+    return _schema
+
+def get_retriever() -> SemanticRetriever:
+    """
+    Vector retriever bound to the current schema snapshot.
+    """
+    global _retriever
+    schema = get_schema()
+    current = _retriever
+    if current is None or current[0] is not schema:
+        previous = current
+        current = (schema, SemanticRetriever(schema.tables, EMBEDDING_BACKEND, VECTOR_INDEX_DIR))
+        _retriever = current
+        if previous is not None:
+            previous[1].close()
+    return current[1]
+
+def install_schema(snapshot: SchemaSnapshot) -> None:
+    """
+    Publish a new schema snapshot. The vector index is built before the swap
+    so requests never wait on it; caches keyed on the old schema are dropped
+    and the snapshot file is rewritten for the next cold start.
+    """
+    global _schema, _retriever
+    retriever = SemanticRetriever(snapshot.tables, EMBEDDING_BACKEND, VECTOR_INDEX_DIR)
+    if RETRIEVAL_MODE != "bm25":
         try:
-            with open(file, "r") as f:
-                data = yaml.safe_load(f) or {}
-                module_name = file.stem  # e.g., "sales" from "sales.yaml"
-                all_schemas[module_name] = data
+            retriever.warm()
         except Exception as e:
-            print(f"[SchemaLoadError] Failed to load {file.name}: {e}", file=sys.stderr)
-
-    return all_schemas
+            print(f"[RetrievalError] Could not prebuild vector index: {e}", file=sys.stderr)
+    with _schema_lock:
+        previous = _retriever
+        _retriever = (snapshot, retriever)
+        _schema = snapshot
+    # Frees the old index's mmap and file handle once in-flight queries finish
+    if previous is not None:
+        previous[1].close()
+    SQL_CACHE.clear()
+    RESULT_CACHE.clear()
+    if ANSWERS is not None:
+        try:
+            ANSWERS.clear()
+        except Exception as e:
+            print(f"[AnswerStoreError] Could not drop answers for the old schema: {e}", file=sys.stderr)
+    if SCHEMA_SNAPSHOT:
+        try:
+            snapshot.save(SCHEMA_SNAPSHOT)
+        except Exception as e:
+            print(f"[SchemaSnapshotError] Could not write snapshot {SCHEMA_SNAPSHOT}: {e}", file=sys.stderr)
+    print(
+        f"[SchemaReload] Now serving schema {snapshot.version} ({len(snapshot.tables)} tables)",
+        file=sys.stderr,
+    )
+
+def _start_schema_watcher() -> None:
+    global _watcher
+    if SCHEMA_WATCH_INTERVAL > 0 and _watcher is None:
+        _watcher = SchemaWatcher(SCHEMA_DIR, get_schema, install_schema, interval=SCHEMA_WATCH_INTERVAL)
+        if _watch_in_thread:
+            _watcher.start()
+
+def _poll_schema_version() -> str:
+    """
+    Supervisor's version check: run the schema watcher on the calling
+    thread (at most every SCHEMA_WATCH_INTERVAL seconds), then report the
+    version being served.
+    """
+    global _watch_polled_at
+    now = time.monotonic()
+    if _watcher is not None and now - _watch_polled_at >= SCHEMA_WATCH_INTERVAL:
+        _watch_polled_at = now
+        try:
+            _watcher.check()
+        except Exception as e:
+            print(f"[SchemaReloadError] {e}", file=sys.stderr)
+    return check_schema_version()
 
-TABLE_DESCRIPTIONS: Dict[str, Any] = load_schema_descriptions()
-ALLOWED_TABLES: set = set(TABLE_DESCRIPTIONS.keys())
+def check_schema_version() -> str:
+    """
+    Version of the schema currently being served; part of every cache key.
+    """
+    return get_schema().version
+
+_LAZY_SCHEMA_ATTRS = {
+    "TABLE_DESCRIPTIONS": lambda schema: schema.modules,
+    "SCHEMA_TABLES": lambda schema: schema.tables,
+    "SCHEMA_INDEX": lambda schema: schema.index,
+    "ALLOWED_TABLES": lambda schema: schema.allowed_tables,
+    "SCHEMA_VERSION": lambda schema: schema.version,
+}
+
+def __getattr__(name: str) -> Any:
+    # Former module-level schema globals, now resolved lazily from the snapshot.
+    if name in _LAZY_SCHEMA_ATTRS:
+        return _LAZY_SCHEMA_ATTRS[name](get_schema())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ----------------------------
 # Utilities
 # ----------------------------
+# One client for the whole process (also used by the OpenAI embedder): pooled
+# keep-alive connections, a concurrency cap, 429 backoff and coalescing of
+# identical in-flight prompts.
+LLM = LLMClient(
+    api_key=OPENAI_API_KEY,
+    base_url=OPENAI_BASE_URL,
+    model=LLM_MODEL,
+    timeout=LLM_TIMEOUT,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    max_retries=LLM_MAX_RETRIES,
+)
+set_default_client(LLM)
+
+# Few-shot examples are matched with the retrieval embedder unless retrieval is lexical only.
+EXAMPLES = ExampleStore(
+    FEWSHOT_STORE,
+    max_examples=FEWSHOT_MAX_EXAMPLES,
+    embedder=get_embedder(EMBEDDING_BACKEND) if RETRIEVAL_MODE != "bm25" else None,
+    min_similarity=FEWSHOT_MIN_SIMILARITY,
+) if FEWSHOT_STORE else None
+
 def extract_text_from_openai_response(resp) -> str:
     """
     Handles both the modern 'content is a list of blocks' format and older 'string'
@@ -282,46 +615,13 @@ def extract_text_from_openai_response(resp) -> str:
     except Exception:
         return ""
 
-def is_single_statement(query: str) -> bool:
-    # Rough check to block multi-statements
-    # Count semicolons; allow a single trailing semicolon
-    q = query.strip()
-    if not q:
-        return False
-    # Remove trailing semicolon if present
-    if q.endswith(";"):
-        q = q[:-1]
-    return ";" not in q
-
-def is_read_only_select(query: str) -> bool:
-    q = query.strip().lower()
-    if not q.startswith("select"):
-        return False
-    # Block writes/DDL keywords appearing anywhere
-    forbidden = [
-        "insert", "update", "delete", "drop", "alter", "create", "truncate",
-        "grant", "revoke", "replace", "rename", "call", "do", "handler", "load",
-        "lock", "unlock"
-    ]
-    return not any(f in q for f in forbidden)
-
-def references_only_allowed_tables(query: str, allowed_tables: set) -> bool:
-    """
-    Very lightweight whitelist check. We simply ensure at least one allowed table appears,
-    and block obvious system schemas.
-    For stricter control you could parse the SQL AST with sqlglot or moz-sql-parser.
-    """
-    q = query.lower()
-    system_schemas = ["information_schema", "mysql.", "performance_schema", "sys."]
-    if any(s in q for s in system_schemas):
-        return False
-
-    # If no tables are whitelisted, allow nothing
-    if not allowed_tables:
-        return False
-
-    # Require that at least one allowed table name is present
-    return any(t.lower() in q for t in allowed_tables)
+def validate_query(query: str) -> Verdict:
+    """
+    Tokenizer-based safety check: a single read-only SELECT that only reads
+    tables from the loaded schema (optionally qualified with DB_NAME). Parse
+    results are cached per query text, so repeat checks cost microseconds.
+    """
+    return validate_sql(query, get_schema().allowed_tables, frozenset({DB_NAME}))
 
 def ensure_limit(query: str, max_rows: int) -> str:
     """
@@ -344,50 +644,82 @@ def ensure_limit(query: str, max_rows: int) -> str:
 
 def pick_relevant_tables(natural_query: str, max_tables: int = 6) -> List[str]:
     """
-    Simple keyword scoring to pick relevant tables from TABLE_DESCRIPTIONS.
+    Rank tables against the question using RETRIEVAL_MODE: BM25 over the
+    snapshot's SchemaIndex, top-k from the persisted vector index, or both fused by
+    reciprocal rank. Falls back to BM25 if the vector index is unavailable.
+    The ranked tables are then joined up through the schema's join graph,
+    appending the bridge tables on the shortest connecting paths.
     """
-    nq = (natural_query or "").lower()
-    if not nq:
+    if not natural_query:
         return []
-    scores: List[Tuple[str, int]] = []
-    for table, info in TABLE_DESCRIPTIONS.items():
-        score = 0
-        tdesc = str(info.get("description", "")).lower()
-        if table.lower() in nq:
-            score += 5
-        score += sum(1 for w in nq.split() if w in tdesc)
-
-        fields = info.get("fields", {}) or {}
-        for fname, finfo in fields.items():
-            if fname.lower() in nq:
-                score += 2
-            fdesc = str((finfo or {}).get("description", "")).lower()
-            score += sum(1 for w in nq.split() if w in fdesc)
-        if score > 0:
-            scores.append((table, score))
-    scores.sort(key=lambda x: x[1], reverse=True)
-    return [t for t, _ in scores[:max_tables]]
+    with TRACER.span("retrieval", mode=RETRIEVAL_MODE) as span:
+        schema = get_schema()
+        ranked = rank_tables(natural_query, max_tables)
+        tables = schema.join_graph.connect(ranked, max_hops=JOIN_MAX_HOPS, max_bridges=JOIN_MAX_BRIDGES)
+        span.set(tables=len(tables), bridges=len(tables) - len(ranked))
+        return tables
+
+def rank_tables(natural_query: str, max_tables: int) -> List[str]:
+    index = get_schema().index
+    if RETRIEVAL_MODE == "bm25":
+        return index.rank_tables(natural_query, max_tables=max_tables)
+
+    lexical = index.rank_tables(natural_query, max_tables=max_tables * 2)
+    try:
+        semantic = get_retriever().top_tables(natural_query, k=max_tables * 2)
+    except Exception as e:
+        print(f"[RetrievalError] Vector retrieval failed, using BM25 only: {e}", file=sys.stderr)
+        return lexical[:max_tables]
+    if RETRIEVAL_MODE == "vector":
+        return semantic[:max_tables]
+    return reciprocal_rank_fusion([lexical, semantic])[:max_tables]
 
 def schema_subset_yaml(tables: List[str]) -> str:
-    partial = {t: TABLE_DESCRIPTIONS[t] for t in tables if t in TABLE_DESCRIPTIONS}
+    schema_tables = get_schema().tables
+    partial = {t: schema_tables[t] for t in tables if t in schema_tables}
     return yaml.safe_dump(partial, default_flow_style=False, allow_unicode=True)
 
+def build_schema_context(tables: List[str], question: str, token_budget: int) -> Tuple[str, str, Dict[str, Any]]:
+    """
+    Schema section of the generate_sql prompt as ``(label, text, stats)``.
+    """
+    schema = get_schema()
+    join_hints = schema.join_graph.join_hints(tables)
+    if PROMPT_FORMAT == "yaml":
+        text = schema_subset_yaml(tables)
+        if join_hints:
+            text += "joins:\n" + "".join(f"  {h}\n" for h in join_hints)
+        return "Schema (YAML)", text, {"format": "yaml", "schema_tokens": count_tokens(text)}
+    partial = {t: schema.tables[t] for t in tables if t in schema.tables}
+    rendered = render_compact_schema(
+        partial, question, token_budget=token_budget, join_hints=join_hints, column_stats=PROMPT_COLUMN_STATS
+    )
+    return "Schema (table, then one `column type [PK|FK] [-- note]` per line)", rendered.text, {
+        "format": "compact",
+        "schema_tokens": rendered.tokens,
+        "columns_shown": rendered.columns_shown,
+        "columns_pruned": rendered.columns_pruned,
+    }
+
 # ----------------------------
 # MCP Tools
 # ----------------------------
 @mcp.tool()
+@TRACER.traced()
 def get_table_info(module: str = "") -> Dict[str, Any]:
     """
     Returns schema information for a specific table (module) or all tables.
     """
     try:
+        modules = get_schema().modules
         if module:
-            return {module: TABLE_DESCRIPTIONS.get(module, {"error": f"No table named '{module}' found."})}
-        return TABLE_DESCRIPTIONS
+            return {module: modules.get(module, {"error": f"No table named '{module}' found."})}
+        return modules
     except Exception as e:
         return {"error": f"[UnexpectedError] {str(e)}"}
 
 @mcp.tool()
+@TRACER.traced()
 def search_schema(keyword: str) -> Dict[str, Any]:
     """
     Search for tables and fields in the schema by keyword.
@@ -396,149 +728,1068 @@ def search_schema(keyword: str) -> Dict[str, Any]:
         if not keyword:
             return {"error": "Keyword cannot be empty."}
 
+        schema = get_schema()
         results: Dict[str, Any] = {}
-        k = keyword.lower()
-
-        for table, table_info in TABLE_DESCRIPTIONS.items():
-            t_hit = k in table.lower() or k in str(table_info.get("description", "")).lower()
-            fields_hit: Dict[str, Any] = {}
-            for field, field_info in (table_info.get("fields", {}) or {}).items():
-                if (
-                    k in field.lower()
-                    or k in str((field_info or {}).get("description", "")).lower()
-                ):
-                    fields_hit[field] = field_info
-
-            if t_hit or fields_hit:
-                results[table] = {
-                    **table_info,
-                    **({"fields": fields_hit} if fields_hit else {})
-                }
+        for table, hit in schema.index.search(keyword).items():
+            table_info = schema.tables[table]
+            fields_hit = {
+                field: field_info
+                for field, field_info in (table_info.get("fields", {}) or {}).items()
+                if field in hit["fields"]
+            }
+            results[table] = {
+                **table_info,
+                **({"fields": fields_hit} if fields_hit else {})
+            }
 
         return results if results else {"message": "No matches found."}
     except Exception as e:
         return {"error": f"[UnexpectedError] {str(e)}"}
 
+def _sql_cache_key(natural_query: str, restrict_to_tables_csv: str, token_budget: int) -> Tuple[Any, ...]:
+    return (normalize_question(natural_query), restrict_to_tables_csv.strip(), token_budget, check_schema_version())
+
+def build_sql_prompt(
+    natural_query: str, tables: List[str], token_budget: int, examples: Sequence[Dict[str, Any]] = ()
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    The generate_sql prompt for ``tables`` (with verified ``examples``) and its token statistics.
+    """
+    with TRACER.span("prompt.build", tables=len(tables), examples=len(examples)) as span:
+        prompt, prompt_stats = _render_sql_prompt(natural_query, tables, token_budget, examples)
+        span.set(**prompt_stats)
+        return prompt, prompt_stats
+
+SQL_CONSTRAINTS = """Constraints:
+- ONLY one statement.
+- SELECT only (no DDL/DML).
+- Prefer explicit column lists over SELECT * when possible.
+- Add reasonable JOINs and WHERE filters as needed.
+- Do not reference tables outside the provided schema.
+- Only use columns that are listed in the schema.
+- Do not include explanations, only return the SQL."""
+
+def _render_sql_prompt(
+    natural_query: str, tables: List[str], token_budget: int, examples: Sequence[Dict[str, Any]] = ()
+) -> Tuple[str, Dict[str, Any]]:
+    schema_label, schema_text, prompt_stats = build_schema_context(tables, natural_query, token_budget)
+    shots = ""
+    if examples:
+        shots = "Verified queries for similar requests:\n" + "".join(
+            f"Q: {ex['question']}\nSQL: {ex['sql']}\n\n" for ex in examples
+        )
+        prompt_stats["examples"] = len(examples)
+
+    prompt = f"""
+You are an expert MySQL SQL generator. You MUST produce a single, read-only SELECT statement that works on MySQL.
+{schema_label} for relevant tables:
+---
+{schema_text}
+---
+
+{shots}User request:
+{natural_query}
+
+{SQL_CONSTRAINTS}
+"""
+    prompt_stats["prompt_tokens"] = count_tokens(prompt)
+    return prompt, prompt_stats
+
+def _strip_code_fences(text: str, lang: str = "sql") -> str:
+    return re.sub(rf"^```(?:{lang})?\s*|\s*```$", "", text.strip(), flags=re.IGNORECASE)
+
+async def _complete_sql(messages: List[Dict[str, str]], timeout: float, **params: Any) -> Tuple[str, int]:
+    """
+    Ask the model for SQL; returns ``(sql, total_tokens)`` with code fences
+    stripped. Raises asyncio.TimeoutError after ``timeout`` seconds.
+    """
+    with TRACER.span("llm.completion", model=LLM.model, messages=len(messages)) as span:
+        resp = await asyncio.wait_for(LLM.chat(messages, temperature=0.1, **params), timeout=timeout)
+        sql = _strip_code_fences(extract_text_from_openai_response(resp))
+        usage = getattr(resp, "usage", None)
+        span.set(
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+            total_tokens=getattr(usage, "total_tokens", 0) or 0,
+        )
+        return sql, getattr(usage, "total_tokens", 0) or 0
+
+def _sync_examples() -> None:
+    """Blocking: drop stored examples made stale by the schema being served."""
+    schema = get_schema()
+    EXAMPLES.sync_schema(schema.version, schema.tables)
+
+def _find_examples(natural_query: str) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Blocking: ``(exact, similar)`` from EXAMPLES for a question, where
+    ``exact`` is a stored pair to reuse as is (FEWSHOT_EXACT) and
+    ``similar`` the few-shot examples for its prompt.
+    """
+    if EXAMPLES is None:
+        return None, []
+    with TRACER.span("examples.lookup") as span:
+        try:
+            _sync_examples()
+            exact = EXAMPLES.exact(natural_query) if FEWSHOT_EXACT else None
+            similar = EXAMPLES.similar(natural_query, k=FEWSHOT_K) if exact is None and FEWSHOT_K > 0 else []
+        except Exception as e:
+            span.fail(str(e))
+            print(f"[FewShotError] Example lookup failed, prompting without examples: {e}", file=sys.stderr)
+            return None, []
+        span.set(exact=exact is not None, examples=len(similar))
+        return exact, similar
+
+def _remember_example(natural_query: str, sql: str) -> None:
+    """Blocking: store a question and the SQL that answered it."""
+    try:
+        EXAMPLES.add(natural_query, sql, validate_query(sql).tables, get_schema().tables)
+    except Exception as e:
+        print(f"[FewShotError] Could not store example: {e}", file=sys.stderr)
+
 @mcp.tool()
-def generate_sql(natural_query: str, restrict_to_tables_csv: str = "") -> Dict[str, Any]:
+@TRACER.traced()
+async def generate_sql(natural_query: str, restrict_to_tables_csv: str = "", token_budget: int = 0) -> Dict[str, Any]:
     """
     Generate a MySQL SELECT query from a natural-language request using schema knowledge.
     You can optionally pass a comma-separated list of tables to restrict the context.
+    token_budget caps the schema part of the prompt (0 = PROMPT_TOKEN_BUDGET);
+    the result reports the token count of the prompt that was sent.
+
+    Verified question/SQL pairs from earlier ask_db calls that resemble the
+    request are included in the prompt (`examples`). With FEWSHOT_EXACT, a
+    stored pair for the same question (up to case, whitespace and trailing
+    punctuation) is returned without calling the model (`example`).
     """
     try:
         if not natural_query or not natural_query.strip():
             return {"error": "natural_query cannot be empty."}
 
+        token_budget = int(token_budget) if token_budget and int(token_budget) > 0 else PROMPT_TOKEN_BUDGET
+        cache_key = _sql_cache_key(natural_query, restrict_to_tables_csv, token_budget)
+        cached = SQL_CACHE.get(cache_key)
+        if cached is not None:
+            return {**cached, "cached": True}
+        started = time.perf_counter()
+
         # Build schema context (smaller is cheaper + more accurate)
         tables = []
         if restrict_to_tables_csv.strip():
             tables = [t.strip() for t in restrict_to_tables_csv.split(",") if t.strip()]
+
+        exact, examples = await asyncio.to_thread(_find_examples, natural_query)
+        restricted = {t.lower() for t in tables}
+        if exact is not None and (not restricted or {t.lower() for t in exact["tables"]} <= restricted):
+            return {
+                "query": exact["sql"],
+                "tables_context": exact["tables"],
+                "example": {"question": exact["question"]},
+            }
+
         if not tables:
-            tables = pick_relevant_tables(natural_query) or list(ALLOWED_TABLES)[:6]
+            # Retrieval is CPU-bound (and may build the vector index on first use).
+            tables = await asyncio.to_thread(pick_relevant_tables, natural_query) or sorted(get_schema().allowed_tables)[:6]
 
-        schema_yaml = schema_subset_yaml(tables)
+        prompt, prompt_stats = build_sql_prompt(natural_query, tables, token_budget, examples)
+        sql, tokens = await _complete_sql([{"role": "user", "content": prompt}], timeout=LLM_TIMEOUT)
+        if not sql:
+            return {"error": "Model returned empty SQL."}
+        result = {"query": sql, "tables_context": tables, "prompt": prompt_stats}
+        if examples:
+            result["examples"] = examples
+        SQL_CACHE.put(cache_key, result, cost_ms=(time.perf_counter() - started) * 1000, tokens=tokens)
+        return result
+    except asyncio.TimeoutError:
+        return {"error": f"[TimeoutError] SQL generation exceeded {LLM_TIMEOUT}s."}
+    except Exception as e:
+        return {"error": f"[OpenAIError] {str(e)}"}
 
-        prompt = f"""
-You are an expert MySQL SQL generator. You MUST produce a single, read-only SELECT statement that works on MySQL.
-Schema (YAML) for relevant tables:
----
-{schema_yaml}
----
+def _query_modules(tables: Sequence[str]) -> FrozenSet[str]:
+    """Schema modules of the tables a query reads, for ROUTER."""
+    table_modules = get_schema().table_modules
+    return frozenset(table_modules[t.lower()] for t in tables if t.lower() in table_modules)
 
-User request:
-{natural_query}
+def _warm_connection(loop: asyncio.AbstractEventLoop) -> None:
+    """
+    Open a connection while the LLM is working; failures surface in
+    run_sql_query. Only for a single database without replicas: otherwise
+    the server is not known until the SQL is, and warming the primary would
+    just add connections there.
+    """
+    if len(ROUTER.clusters) > 1 or any(c.replicas for c in ROUTER.clusters.values()):
+        return
+    warm = loop.run_in_executor(DB_EXECUTOR, DB_POOL.ensure_idle)
+    warm.add_done_callback(lambda f: f.cancelled() or f.exception())
 
-Constraints:
-- ONLY one statement.
-- SELECT only (no DDL/DML).
-- Prefer explicit column lists over SELECT * when possible.
-- Add reasonable JOINs and WHERE filters as needed.
-- Do not reference tables outside the provided schema.
-- Do not include explanations, only return the SQL.
-"""
+def _execute_select(safe_query: str, holder: Dict[str, Any], modules: FrozenSet[str] = frozenset()) -> Dict[str, Any]:
+    """
+    Blocking half of run_sql_query, run on DB_EXECUTOR: check out a pooled
+    connection on the server ROUTER picks for ``modules``, execute and fetch.
+    The connection id and pool are published in ``holder`` so that a
+    timed-out or cancelled call can kill the query.
+    """
+    with TRACER.span("db.acquire") as span:
+        try:
+            target, conn = ROUTER.acquire(modules)
+            span.set(target=target.name)
+        except RoutingError as e:
+            span.fail(str(e))
+            return {"error": f"[RoutingError] {e}"}
+        except (PoolTimeoutError, mysql.connector.Error) as conn_err:
+            span.fail(str(conn_err))
+            return {"error": f"[ConnectionError] Could not connect to database: {conn_err}"}
 
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,
+    cursor = None
+    discard = False
+    try:
+        holder["connection_id"] = conn.connection_id
+        holder["pool"] = target.pool
+        if holder.get("cancelled"):
+            return {"error": "[CancelledError] Query was cancelled before it started."}
+        cursor = conn.cursor(dictionary=True)
+        with TRACER.span("db.execute", connection_id=conn.connection_id):
+            cursor.execute(safe_query)
+        with TRACER.span("db.fetch") as span:
+            rows = cursor.fetchall()
+            span.set(rows=len(rows))
+        if target.role == "replica":
+            return {"rows": rows, "replica": target.name, "replica_lag_seconds": target.lag}
+        return {"rows": rows}
+    except mysql.connector.Error as query_err:
+        # Lost/broken connections must not go back into the pool.
+        discard = isinstance(
+            query_err,
+            (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError),
         )
-        sql = extract_text_from_openai_response(resp)
-        # Strip code fences if present
-        sql = re.sub(r"^```(?:sql)?\s*|\s*```$", "", sql.strip(), flags=re.IGNORECASE)
-        if not sql:
-            return {"error": "Model returned empty SQL."}
-        return {"query": sql, "tables_context": tables}
+        if getattr(query_err, "errno", None) in (2003, 2006):  # server unreachable / gone away
+            ROUTER.mark_failed(target, query_err)
+        return {"error": f"[QueryError] Failed to execute query: {query_err}"}
+    finally:
+        try:
+            if cursor is not None:
+                cursor.close()
+        except Exception:
+            pass
+        target.pool.release(conn, discard=discard)
+
+async def _kill_query(holder: Dict[str, Any]) -> None:
+    """
+    Stop the statement started by _execute_select. Uses a dedicated connection
+    and the default executor, since the pool and DB_EXECUTOR may be saturated.
+    """
+    holder["cancelled"] = True
+    connection_id = holder.get("connection_id")
+    if connection_id is None:
+        return
+
+    def _kill() -> None:
+        # KILL must go to the server running the query
+        conn = mysql.connector.connect(**holder.get("pool", DB_POOL).config)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"KILL QUERY {int(connection_id)}")
+            cursor.close()
+        finally:
+            conn.close()
+
+    try:
+        await asyncio.to_thread(_kill)
     except Exception as e:
-        return {"error": f"[OpenAIError] {str(e)}"}
+        print(f"[CancelError] Failed to kill query on connection {connection_id}: {e}", file=sys.stderr)
+
+async def _run_db_call(fn, *args) -> Any:
+    """
+    Run a blocking stream call on DB_EXECUTOR under DB_QUERY_TIMEOUT, killing
+    the statement on timeout or cancellation. ``fn`` receives a trailing
+    ``holder`` dict in which it publishes the connection id.
+    """
+    holder: Dict[str, Any] = {}
+    future = asyncio.get_running_loop().run_in_executor(DB_EXECUTOR, TRACER.bind(fn, *args, holder))
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), timeout=DB_QUERY_TIMEOUT)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        await _kill_query(holder)
+        raise
+
+def _explain_select(query: str, modules: FrozenSet[str], holder: Dict[str, Any]) -> Dict[str, Any]:
+    target, conn = ROUTER.acquire(modules)
+    try:
+        holder["connection_id"] = conn.connection_id
+        holder["pool"] = target.pool
+        with TRACER.span("db.explain", target=target.name):
+            return PLAN_GUARD.check(conn, query)
+    finally:
+        target.pool.release(conn)
+
+def _open_stream(query: str, page_size: int, columnar: bool, modules: FrozenSet[str], holder: Dict[str, Any]) -> Dict[str, Any]:
+    return STREAMS.open(query, page_size, columnar, holder, pool=ROUTER.target_for(modules).pool)
+
+async def check_query_plan(query: str, modules: FrozenSet[str] = frozenset()) -> Optional[Dict[str, Any]]:
+    """
+    Cached EXPLAIN verdict for ``query``, or None if the guard is off or the
+    EXPLAIN itself failed (the MAX_EXECUTION_TIME hint still applies then).
+    """
+    if PLAN_GUARD_MODE == "off":
+        return None
+    with TRACER.span("sql.explain") as span:
+        verdict = PLAN_GUARD.cached(query)
+        if verdict is not None:
+            span.set(cached=True, allowed=verdict["allowed"])
+            return verdict
+        try:
+            verdict = await _run_db_call(_explain_select, query, modules)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            span.fail(str(e))
+            print(f"[PlanError] EXPLAIN failed, running without plan check: {e}", file=sys.stderr)
+            return None
+        span.set(allowed=verdict["allowed"], estimated_rows=verdict["estimated_rows"])
+        return verdict
+
+def _materialize(query: str) -> List[Any]:
+    """
+    Blocking: run a hot SELECT for the answer store, on the server ROUTER
+    picks, under the usual MAX_EXECUTION_TIME. Raises on failure.
+    """
+    modules = _query_modules(validate_query(query).tables)
+    target, conn = ROUTER.acquire(modules)
+    cursor = None
+    try:
+        cursor = conn.cursor(dictionary=True)
+        with TRACER.span("answers.refresh", target=target.name) as span:
+            cursor.execute(with_max_execution_time(query, DB_MAX_EXECUTION_MS))
+            rows = cursor.fetchall()
+            span.set(rows=len(rows))
+        return rows
+    finally:
+        if cursor is not None:
+            cursor.close()
+        target.pool.release(conn)
+
+def _start_answer_refresher() -> None:
+    # Started by the first query in the serving process (never in a pre-fork
+    # supervisor, which must not hold DB connections across fork).
+    global _answer_refresher
+    if ANSWERS is not None and _answer_refresher is None:
+        _answer_refresher = AnswerRefresher(ANSWERS, _materialize, period=min(30.0, ANSWER_REFRESH_INTERVAL))
+        _answer_refresher.start()
+
+async def _stream_response(fn, *args) -> Dict[str, Any]:
+    try:
+        with TRACER.span("db.stream", call=fn.__name__) as span:
+            page = await _run_db_call(fn, *args)
+            span.set(rows=len(page.get("rows") or []))
+            return page
+    except asyncio.TimeoutError:
+        return {"error": f"[TimeoutError] Page fetch exceeded {DB_QUERY_TIMEOUT}s and the stream was cancelled."}
+    except (StreamLimitError, StreamNotFoundError) as e:
+        return {"error": f"[StreamError] {e}"}
+    except RoutingError as e:
+        return {"error": f"[RoutingError] {e}"}
+    except (PoolTimeoutError, mysql.connector.errors.InterfaceError) as e:
+        return {"error": f"[ConnectionError] Could not connect to database: {e}"}
+    except mysql.connector.Error as e:
+        return {"error": f"[QueryError] Failed to execute query: {e}"}
+
+def _shape_rows(rows: List[Any], result_format: str, compress: str) -> Dict[str, Any]:
+    """The rows part of a run_sql_query response in the requested format."""
+    if result_format != "compact":
+        return {"rows": rows}
+    with TRACER.span("result.encode", rows=len(rows), compress=compress) as span:
+        shaped = compact_result(rows, compress=compress, threshold_bytes=RESULT_COMPRESS_THRESHOLD)
+        span.set(**shaped["size"])
+        return shaped
 
 @mcp.tool()
-def run_sql_query(query: str, max_rows: int = 200) -> Dict[str, Any]:
+@TRACER.traced()
+async def run_sql_query(
+    query: str,
+    max_rows: int = 200,
+    page_size: int = 0,
+    columnar: bool = False,
+    result_format: str = "rows",
+    compress: str = "none",
+) -> Dict[str, Any]:
     """
     Executes a read-only SELECT SQL query on the MySQL database with safety checks.
+
+    With page_size > 0 the result is streamed instead: no LIMIT is added, the
+    first page_size rows are returned together with a `next_token` to pass to
+    fetch_next_page (null once the result is exhausted). columnar=True returns
+    `columns` once and each row as a list instead of a dict. Streaming needs
+    a single server process: with MCP_WORKERS > 1 over streamable-http a
+    later call may reach another worker, so page_size > 0 is rejected there.
+
+    result_format="compact" (non-streamed results) returns `columns`, `types`
+    and `rows` as arrays, with decimals as strings and dates/times as ISO
+    8601. compress="auto"|"zstd"|"gzip" additionally replaces `rows` by a
+    base64 `data` block (see `encoding`) once the rows exceed
+    RESULT_COMPRESS_THRESHOLD bytes. `size` reports the bytes saved.
+
+    Every statement runs under a server-side MAX_EXECUTION_TIME. With
+    PLAN_GUARD enabled, queries whose EXPLAIN estimate exceeds the configured
+    rows/cost are rejected or run with a tighter limit and time budget.
+
+    With ANSWER_STORE set, frequent slow queries are precomputed on a
+    schedule; those are answered from the store, with `materialized`
+    reporting when the rows were refreshed and their age in seconds.
     """
     try:
-        if not query or not query.strip():
-            return {"error": "Query cannot be empty."}
-        if not is_single_statement(query):
-            return {"error": "Only a single statement is allowed."}
-        if not is_read_only_select(query):
-            return {"error": "Only read-only SELECT queries are allowed."}
-        if not references_only_allowed_tables(query, ALLOWED_TABLES):
-            return {"error": "Query references unauthorized tables or system schemas."}
+        if result_format not in ("rows", "compact"):
+            return {"error": f"[FormatError] Unknown result_format '{result_format}' (use rows or compact)."}
+        if compress not in COMPRESSIONS:
+            return {"error": f"[FormatError] Unknown compress '{compress}' (use {', '.join(COMPRESSIONS)})."}
+        with TRACER.span("sql.validate") as span:
+            verdict = validate_query(query)
+            span.set(allowed=verdict.allowed, tables=len(verdict.tables))
+        if not verdict.allowed:
+            return {"error": verdict.reasons[0], "reasons": list(verdict.reasons)}
+        modules = _query_modules(verdict.tables)
+
+        if page_size > 0:
+            if _stateless_workers:
+                return {"error": "[StreamError] Streaming is unavailable with MCP_WORKERS > 1; use max_rows instead."}
+            page_size = min(int(page_size), STREAM_MAX_PAGE_SIZE)
+            plan = await check_query_plan(query, modules)
+            execution_ms = STREAM_MAX_EXECUTION_MS
+            if plan is not None and not plan["allowed"]:
+                if PLAN_GUARD_MODE != "rewrite":
+                    return {"error": f"[PlanError] {plan['reasons'][0]}", "plan": plan, "applied_query": query}
+                execution_ms = PLAN_REWRITE_EXECUTION_MS
+            applied = with_max_execution_time(query, execution_ms)
+            page = await _stream_response(_open_stream, applied, page_size, columnar, modules)
+            return {**page, "applied_query": applied}
 
         safe_query = ensure_limit(query, max_rows=max(1, int(max_rows)))
-
+        cache_key = (normalize_sql(safe_query), check_schema_version())
+        cached = RESULT_CACHE.get(cache_key)
+        if cached is not None:
+            return {**_shape_rows(cached, result_format, compress), "applied_query": safe_query, "cached": True}
+        if ANSWERS is not None:
+            _start_answer_refresher()
+            answer = ANSWERS.lookup(safe_query)
+            if answer is not None:
+                return {
+                    **_shape_rows(answer["rows"], result_format, compress),
+                    "applied_query": safe_query,
+                    "materialized": answer["materialized"],
+                }
+        started = time.perf_counter()
+
+        plan = await check_query_plan(safe_query, modules)
+        execution_ms = DB_MAX_EXECUTION_MS
+        rewritten = False
+        if plan is not None and not plan["allowed"]:
+            if PLAN_GUARD_MODE != "rewrite":
+                return {"error": f"[PlanError] {plan['reasons'][0]}", "plan": plan, "applied_query": safe_query}
+            safe_query = ensure_limit(safe_query, max_rows=PLAN_REWRITE_MAX_ROWS)
+            execution_ms = min(execution_ms, PLAN_REWRITE_EXECUTION_MS) if execution_ms > 0 else PLAN_REWRITE_EXECUTION_MS
+            rewritten = True
+        applied = with_max_execution_time(safe_query, execution_ms)
+
+        holder: Dict[str, Any] = {}
+        future = asyncio.get_running_loop().run_in_executor(DB_EXECUTOR, TRACER.bind(_execute_select, applied, holder, modules))
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-        except mysql.connector.Error as conn_err:
-            return {"error": f"[ConnectionError] Could not connect to database: {conn_err}"}
+            res = await asyncio.wait_for(asyncio.shield(future), timeout=DB_QUERY_TIMEOUT)
+        except asyncio.TimeoutError:
+            await _kill_query(holder)
+            return {
+                "error": f"[TimeoutError] Query exceeded {DB_QUERY_TIMEOUT}s and was cancelled.",
+                "applied_query": applied,
+            }
+        except asyncio.CancelledError:
+            await _kill_query(holder)
+            raise
+
+        if "error" in res:
+            return {**res, "applied_query": applied}
+        result = {**_shape_rows(res["rows"], result_format, compress), "applied_query": applied}
+        if "replica" in res:
+            result["replica"] = res["replica"]
+            result["replica_lag_seconds"] = res["replica_lag_seconds"]
+        if rewritten:
+            result["plan"] = {**plan, "rewritten": True}
+        else:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            RESULT_CACHE.put(cache_key, res["rows"], cost_ms=elapsed_ms)
+            if ANSWERS is not None:
+                ANSWERS.record(safe_query, elapsed_ms)
+        return result
+    except Exception as e:
+        return {"error": f"[UnexpectedError] {str(e)}"}
 
-        try:
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute(safe_query)
-            rows = cursor.fetchall()
-            return {"rows": rows, "applied_query": safe_query}
-        except mysql.connector.Error as query_err:
-            return {"error": f"[QueryError] Failed to execute query: {query_err}", "applied_query": safe_query}
-        finally:
-            try:
-                cursor.close()
-            except Exception:
-                pass
-            try:
-                conn.close()
-            except Exception:
-                pass
+@mcp.tool()
+@TRACER.traced()
+async def fetch_next_page(next_token: str) -> Dict[str, Any]:
+    """
+    Returns the next page of a streamed run_sql_query result.
+    """
+    try:
+        if not next_token:
+            return {"error": "next_token cannot be empty."}
+        return await _stream_response(STREAMS.next_page, next_token)
+    except Exception as e:
+        return {"error": f"[UnexpectedError] {str(e)}"}
+
+@mcp.tool()
+@TRACER.traced()
+async def close_stream(next_token: str) -> Dict[str, Any]:
+    """
+    Abandons a streamed result early and frees its database connection.
+    """
+    try:
+        await asyncio.get_running_loop().run_in_executor(DB_EXECUTOR, STREAMS.close, next_token)
+        return {"closed": True}
+    except StreamNotFoundError as e:
+        return {"error": f"[StreamError] {e}"}
     except Exception as e:
         return {"error": f"[UnexpectedError] {str(e)}"}
 
+# Failures another SQL attempt cannot fix
+_UNREPAIRABLE_ERRORS = (
+    "[ConnectionError]", "[StreamError]", "[CancelledError]", "[UnexpectedError]", "[TimeoutError]", "[FormatError]",
+)
+
+REPAIR_PROMPT = """The query above failed:
+{error}
+
+Fix it using only the schema given earlier. Return only the corrected single SELECT statement."""
+
+def _repair_feedback(exec_res: Dict[str, Any]) -> str:
+    reasons = exec_res.get("reasons") or []
+    lines = [str(exec_res.get("error", ""))] + [f"- {r}" for r in reasons[1:]]
+    plan = exec_res.get("plan")
+    if plan and plan.get("reasons"):
+        lines += [f"- {r}" for r in plan["reasons"][1:]]
+    return "\n".join(lines)
+
 @mcp.tool()
-def ask_db(natural_query: str, max_rows: int = 200) -> Dict[str, Any]:
+@TRACER.traced()
+async def ask_db(
+    natural_query: str,
+    max_rows: int = 200,
+    max_attempts: int = 0,
+    result_format: str = "rows",
+    compress: str = "none",
+) -> Dict[str, Any]:
     """
     End-to-end helper: NL -> SQL -> Results.
     Picks relevant tables, generates SQL, applies safety checks, runs it, returns rows + SQL.
+    Without read replicas, a pooled connection is warmed up concurrently with SQL generation.
+
+    If the SQL is rejected (validator, plan guard) or fails in MySQL, the error
+    is sent back to the model in the same conversation, reusing the schema
+    context, for up to max_attempts attempts (0 = ASK_DB_MAX_ATTEMPTS) within
+    ASK_DB_DEADLINE seconds. `attempts` lists each query with its timings.
+    result_format and compress are passed to run_sql_query.
+
+    Questions whose SQL returns rows are remembered as examples for
+    generate_sql (FEWSHOT_STORE); a reused example that fails is forgotten.
     """
     try:
-        gen = generate_sql(natural_query)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + ASK_DB_DEADLINE
+        max_attempts = int(max_attempts) if max_attempts and int(max_attempts) > 0 else ASK_DB_MAX_ATTEMPTS
+
+        _warm_connection(loop)
+
+        started = time.perf_counter()
+        gen = await generate_sql(natural_query)
         if "error" in gen:
             return gen
-        sql = gen.get("query", "")
-        if not sql:
+        if not gen.get("query"):
             return {"error": "Failed to generate SQL."}
+        generate_ms = round((time.perf_counter() - started) * 1000, 1)
+        return await _execute_with_repair(
+            natural_query, gen, generate_ms, deadline, max_rows, max_attempts, result_format, compress
+        )
+    except Exception as e:
+        return {"error": f"[UnexpectedError] {str(e)}"}
 
-        exec_res = run_sql_query(sql, max_rows=max_rows)
-        # Include the candidate SQL and the context tables for transparency
-        return {
+async def _execute_with_repair(
+    natural_query: str,
+    gen: Dict[str, Any],
+    generate_ms: float,
+    deadline: float,
+    max_rows: int,
+    max_attempts: int,
+    result_format: str,
+    compress: str,
+) -> Dict[str, Any]:
+    """
+    Run the generated SQL (``gen`` as returned by generate_sql) and repair it
+    on failure until it succeeds, ``max_attempts`` is reached or the event
+    loop clock passes ``deadline``. Returns the ask_db response.
+    """
+    loop = asyncio.get_running_loop()
+    sql = gen["query"]
+    tables = gen.get("tables_context", [])
+
+    attempts: List[Dict[str, Any]] = []
+    attempt = {"attempt": 1, "query": sql, "generate_ms": generate_ms}
+    if gen.get("cached"):
+        attempt["cached"] = True
+    messages: List[Dict[str, str]] = []
+    while True:
+        started = time.perf_counter()
+        try:
+            exec_res = await asyncio.wait_for(
+                run_sql_query(sql, max_rows=max_rows, result_format=result_format, compress=compress),
+                timeout=max(0.0, deadline - loop.time()),
+            )
+        except asyncio.TimeoutError:
+            exec_res = {"error": f"[TimeoutError] ask_db exceeded its {ASK_DB_DEADLINE}s deadline."}
+        attempt["execute_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        error = exec_res.get("error")
+        if error:
+            attempt["error"] = error
+        attempts.append(attempt)
+
+        remaining = deadline - loop.time()
+        if not error or error.startswith(_UNREPAIRABLE_ERRORS) or len(attempts) >= max_attempts or remaining <= 0:
+            break
+
+        # Repair: same prompt (rebuilt deterministically if the SQL came
+        # from the cache or a batch), plus the failed query and its error.
+        started = time.perf_counter()
+        if not messages:
+            prompt, _ = build_sql_prompt(natural_query, tables, PROMPT_TOKEN_BUDGET, gen.get("examples") or ())
+            messages.append({"role": "user", "content": prompt})
+        messages.append({"role": "assistant", "content": sql})
+        messages.append({"role": "user", "content": REPAIR_PROMPT.format(error=_repair_feedback(exec_res))})
+        try:
+            sql, _ = await _complete_sql(messages, timeout=min(LLM_TIMEOUT, remaining))
+        except asyncio.TimeoutError:
+            attempt["repair_error"] = "[TimeoutError] SQL repair did not finish before the deadline."
+            break
+        if not sql:
+            attempt["repair_error"] = "Model returned empty SQL."
+            break
+        attempt = {
+            "attempt": len(attempts) + 1,
             "query": sql,
-            "tables_context": gen.get("tables_context", []),
-            **exec_res
+            "generate_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    cache_key = _sql_cache_key(natural_query, "", PROMPT_TOKEN_BUDGET)
+    if error:
+        # Do not keep serving SQL that is known to fail.
+        SQL_CACHE.discard(cache_key)
+    elif len(attempts) > 1:
+        SQL_CACHE.put(cache_key, {**{k: v for k, v in gen.items() if k != "cached"}, "query": sql})
+    if EXAMPLES is not None:
+        if error:
+            if gen.get("example"):
+                await asyncio.to_thread(EXAMPLES.discard, natural_query)
+        elif (exec_res.get("row_count") or len(exec_res.get("rows") or [])) and not (gen.get("example") and len(attempts) == 1):
+            # An empty result is too weak a sign that the SQL answers the question.
+            await asyncio.to_thread(_remember_example, natural_query, sql)
+
+    # Include the candidate SQL and the context tables for transparency
+    return {
+        "query": sql,
+        "tables_context": tables,
+        **exec_res,
+        "attempts": attempts,
+    }
+
+BATCH_SQL_PROMPT = """
+You are an expert MySQL SQL generator. For EACH numbered request, produce a single, read-only SELECT statement that works on MySQL.
+{schema_label} for relevant tables:
+---
+{schema_text}
+---
+
+User requests:
+{requests}
+
+{constraints}
+Answer with a JSON object only: {{"queries": [{{"id": <request number>, "sql": "<SELECT statement>"}}]}}, one entry per request.
+"""
+
+def _batch_tables(per_question: List[List[str]], limit: int) -> List[str]:
+    """
+    Shared context for a group of questions: each question's best table,
+    then the others by how many questions retrieved them, up to ``limit``.
+    """
+    score: Dict[str, Tuple[int, int]] = {}
+    for tables in per_question:
+        for rank, table in enumerate(tables):
+            votes, best = score.get(table, (0, rank))
+            score[table] = (votes + 1, min(best, rank))
+    ranked = sorted(score, key=lambda t: (-score[t][0], score[t][1], t))
+    first = [tables[0] for tables in per_question if tables]
+    merged = list(dict.fromkeys(first + ranked))
+    return merged[:max(limit, len(set(first)))]
+
+def _parse_batch_sql(text: str, count: int) -> Dict[int, str]:
+    """``{position: sql}`` from the model's JSON answer; malformed entries are left out."""
+    try:
+        data = json.loads(_strip_code_fences(text, "json"))
+    except ValueError:
+        return {}
+    items = data.get("queries") if isinstance(data, dict) else data
+    out: Dict[int, str] = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            pos = int(item.get("id")) - 1
+        except (TypeError, ValueError):
+            continue
+        sql = _strip_code_fences(str(item.get("sql") or ""))
+        if 0 <= pos < count and sql:
+            out[pos] = sql
+    return out
+
+async def _generate_sql_batch(questions: List[str], tables: List[str]) -> Tuple[Dict[int, str], Dict[str, Any], int]:
+    """
+    SQL for several questions from one completion over one schema context.
+    Returns ``({position: sql}, prompt_stats, total_tokens)``.
+    """
+    with TRACER.span("prompt.build", tables=len(tables), questions=len(questions)) as span:
+        schema_label, schema_text, prompt_stats = build_schema_context(
+            tables, "\n".join(questions), ASK_DB_BATCH_TOKEN_BUDGET
+        )
+        prompt = BATCH_SQL_PROMPT.format(
+            schema_label=schema_label,
+            schema_text=schema_text,
+            requests="\n".join(f"{i}. {' '.join(q.split())}" for i, q in enumerate(questions, 1)),
+            constraints=SQL_CONSTRAINTS,
+        )
+        prompt_stats["prompt_tokens"] = count_tokens(prompt)
+        span.set(**prompt_stats)
+    text, tokens = await _complete_sql(
+        [{"role": "user", "content": prompt}], timeout=LLM_TIMEOUT, response_format={"type": "json_object"}
+    )
+    return _parse_batch_sql(text, len(questions)), prompt_stats, tokens
+
+def _exact_examples(questions: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """Blocking: the stored example reusable as is for each question, or None."""
+    try:
+        _sync_examples()
+        return [EXAMPLES.exact(q) for q in questions]
+    except Exception as e:
+        print(f"[FewShotError] Example lookup failed: {e}", file=sys.stderr)
+        return [None] * len(questions)
+
+def _retrieve_all(questions: List[str]) -> List[List[str]]:
+    fallback = sorted(get_schema().allowed_tables)[:6]
+    return [pick_relevant_tables(q) or fallback for q in questions]
+
+@mcp.tool()
+@TRACER.traced()
+async def ask_db_batch(
+    questions: List[str],
+    max_rows: int = 200,
+    max_concurrency: int = 0,
+    result_format: str = "rows",
+    compress: str = "none",
+) -> Dict[str, Any]:
+    """
+    ask_db for many related questions at once (e.g. the panels of a dashboard).
+    Tables are retrieved for all questions in one pass; questions without
+    cached SQL go to the model ASK_DB_BATCH_SIZE at a time, one request per
+    group over a shared schema context (any question the model skips falls
+    back to generate_sql). Each group's queries start as soon as its SQL is
+    back and run concurrently, at most max_concurrency at a time
+    (0 = ASK_DB_BATCH_CONCURRENCY), each with ask_db's repair loop.
+
+    `results` has one entry per question, in order, with its own `error` if
+    it failed and `timings` (ms); `summary` counts successes, failures,
+    cache and stored-example hits and LLM requests.
+    """
+    try:
+        if not isinstance(questions, list) or not questions:
+            return {"error": "questions must be a non-empty list."}
+        if len(questions) > ASK_DB_BATCH_MAX:
+            return {"error": f"Too many questions ({len(questions)}); the limit is {ASK_DB_BATCH_MAX}."}
+        if result_format not in ("rows", "compact"):
+            return {"error": f"[FormatError] Unknown result_format '{result_format}' (use rows or compact)."}
+        if compress not in COMPRESSIONS:
+            return {"error": f"[FormatError] Unknown compress '{compress}' (use {', '.join(COMPRESSIONS)})."}
+        loop = asyncio.get_running_loop()
+        batch_started = time.perf_counter()
+        limit = int(max_concurrency) if max_concurrency and int(max_concurrency) > 0 else ASK_DB_BATCH_CONCURRENCY
+        slots = asyncio.Semaphore(max(1, limit))
+        _warm_connection(loop)
+
+        def elapsed_ms(since: float) -> float:
+            return round((time.perf_counter() - since) * 1000, 1)
+
+        results: List[Dict[str, Any]] = [{"index": i, "question": q} for i, q in enumerate(questions)]
+        timings: List[Dict[str, float]] = [{} for _ in questions]
+        counts = {"sql_cached": 0, "example_hits": 0, "llm_requests": 0, "fallbacks": 0}
+
+        async def run(i: int, gen: Dict[str, Any], generate_ms: float) -> None:
+            try:
+                if "error" in gen:
+                    results[i]["error"] = gen["error"]
+                    return
+                queued = time.perf_counter()
+                async with slots:
+                    timings[i]["queue_ms"] = elapsed_ms(queued)
+                    started = time.perf_counter()
+                    response = await _execute_with_repair(
+                        questions[i], gen, generate_ms, loop.time() + ASK_DB_DEADLINE,
+                        max_rows, ASK_DB_MAX_ATTEMPTS, result_format, compress,
+                    )
+                    timings[i]["execute_ms"] = elapsed_ms(started)
+                results[i].update(response)
+            except Exception as e:
+                results[i]["error"] = f"[UnexpectedError] {str(e)}"
+            finally:
+                timings[i]["total_ms"] = elapsed_ms(batch_started)
+
+        async def generate_one(i: int) -> None:
+            started = time.perf_counter()
+            gen = await generate_sql(questions[i])
+            timings[i]["generate_ms"] = elapsed_ms(started)
+            if "error" not in gen and not gen.get("cached"):
+                counts["llm_requests"] += 1
+            await run(i, gen, timings[i]["generate_ms"])
+
+        async def generate_group(group: List[int], group_tables: List[List[str]]) -> None:
+            started = time.perf_counter()
+            tables = _batch_tables(group_tables, ASK_DB_BATCH_TABLES)
+            try:
+                sqls, prompt_stats, tokens = await _generate_sql_batch([questions[i] for i in group], tables)
+            except Exception as e:
+                print(f"[BatchError] Combined SQL generation failed, asking per question: {e}", file=sys.stderr)
+                sqls, prompt_stats, tokens = {}, {}, 0
+            counts["llm_requests"] += 1
+            generate_ms = elapsed_ms(started)
+            tasks = []
+            for pos, i in enumerate(group):
+                if pos not in sqls:
+                    counts["fallbacks"] += 1
+                    tasks.append(generate_one(i))
+                    continue
+                timings[i]["generate_ms"] = generate_ms
+                gen = {"query": sqls[pos], "tables_context": tables, "prompt": {**prompt_stats, "batch_size": len(group)}}
+                SQL_CACHE.put(
+                    _sql_cache_key(questions[i], "", PROMPT_TOKEN_BUDGET), gen,
+                    cost_ms=generate_ms / len(group), tokens=tokens // len(group),
+                )
+                tasks.append(run(i, gen, generate_ms))
+            await asyncio.gather(*tasks)
+
+        tasks = []
+        todo: List[int] = []
+        for i, q in enumerate(questions):
+            if not isinstance(q, str) or not q.strip():
+                results[i]["error"] = "natural_query cannot be empty."
+                continue
+            cached = SQL_CACHE.get(_sql_cache_key(q, "", PROMPT_TOKEN_BUDGET))
+            if cached is not None:
+                counts["sql_cached"] += 1
+                timings[i]["generate_ms"] = 0.0
+                tasks.append(run(i, {**cached, "cached": True}, 0.0))
+            else:
+                todo.append(i)
+        if todo and EXAMPLES is not None and FEWSHOT_EXACT:
+            exact = await asyncio.to_thread(_exact_examples, [questions[i] for i in todo])
+            for i, hit in zip(list(todo), exact):
+                if hit is not None:
+                    todo.remove(i)
+                    counts["example_hits"] += 1
+                    timings[i]["generate_ms"] = 0.0
+                    gen = {"query": hit["sql"], "tables_context": hit["tables"], "example": {"question": hit["question"]}}
+                    tasks.append(run(i, gen, 0.0))
+
+        size = max(1, ASK_DB_BATCH_SIZE)
+        groups = [todo[k:k + size] for k in range(0, len(todo), size)]
+        # A lone question gets the regular single-question prompt
+        if groups and len(groups[-1]) == 1:
+            tasks.append(generate_one(groups.pop()[0]))
+
+        # One retrieval pass (CPU-bound) for every question sent in a group
+        grouped = [i for group in groups for i in group]
+        started = time.perf_counter()
+        per_question = await asyncio.to_thread(_retrieve_all, [questions[i] for i in grouped]) if grouped else []
+        retrieval_ms = elapsed_ms(started)
+        tables_of = dict(zip(grouped, per_question))
+        for i in grouped:
+            timings[i]["retrieval_ms"] = retrieval_ms
+        for group in groups:
+            tasks.append(generate_group(group, [tables_of[i] for i in group]))
+        await asyncio.gather(*tasks)
+
+        for i, item in enumerate(results):
+            item["timings"] = timings[i]
+        failed = sum(1 for item in results if "error" in item)
+        return {
+            "results": results,
+            "summary": {
+                "questions": len(questions),
+                "succeeded": len(questions) - failed,
+                "failed": failed,
+                **counts,
+                "max_concurrency": max(1, limit),
+                "retrieval_ms": retrieval_ms,
+                "total_ms": elapsed_ms(batch_started),
+            },
+        }
+    except Exception as e:
+        return {"error": f"[UnexpectedError] {str(e)}"}
+
+@mcp.tool()
+@TRACER.traced()
+def get_pool_stats() -> Dict[str, Any]:
+    """
+    Returns database connection pool counters (checkouts, waits, creates, recycles)
+    and current size, for sizing DB_POOL_SIZE. `routing` has the reads sent
+    to primaries and replicas, failovers, and each server's lag and pool.
+    """
+    try:
+        return {**DB_POOL.stats(), "streams": STREAMS.stats(), "routing": ROUTER.stats()}
+    except Exception as e:
+        return {"error": f"[UnexpectedError] {str(e)}"}
+
+def _reload_schema() -> bool:
+    current = get_schema()
+    if current.is_fresh(SCHEMA_DIR):
+        return False
+    install_schema(SchemaSnapshot.from_directory(SCHEMA_DIR, previous=current))
+    return True
+
+@mcp.tool()
+@TRACER.traced()
+async def reload_schema() -> Dict[str, Any]:
+    """
+    Reloads the schema files now instead of waiting for the watcher.
+    Unchanged files are reused; returns the version being served.
+    """
+    try:
+        if is_worker():
+            # Reloading here would update this worker only: the supervisor
+            # reloads once and replaces all workers with ones serving the new files.
+            schema = get_schema()
+            stale = not await asyncio.to_thread(schema.is_fresh, SCHEMA_DIR)
+            if stale:
+                notify_reload()
+            return {"reloaded": False, "workers_replaced": stale, "version": schema.version, "tables": len(schema.tables)}
+        reloaded = await asyncio.to_thread(_reload_schema)
+        schema = get_schema()
+        return {"reloaded": reloaded, "version": schema.version, "tables": len(schema.tables)}
+    except Exception as e:
+        return {"error": f"[SchemaReloadError] {str(e)}"}
+
+@mcp.tool()
+@TRACER.traced()
+def get_cache_stats() -> Dict[str, Any]:
+    """
+    Returns hit/miss counters and estimated latency/token savings for the
+    NL->SQL cache, the SQL->rows result cache and the EXPLAIN verdict cache,
+    the materialized answer store's size, refreshes and answers served, and
+    the few-shot example store's size, exact hits and evictions.
+    """
+    try:
+        return {
+            "schema_version": check_schema_version(),
+            "sql_cache": SQL_CACHE.stats(),
+            "result_cache": RESULT_CACHE.stats(),
+            "plan_cache": PLAN_GUARD.stats(),
+            "answers": ANSWERS.stats() if ANSWERS is not None else None,
+            "examples": EXAMPLES.stats() if EXAMPLES is not None else None,
         }
     except Exception as e:
         return {"error": f"[UnexpectedError] {str(e)}"}
 
+@mcp.tool()
+@TRACER.traced()
+def get_metrics(reset: bool = False) -> Dict[str, Any]:
+    """
+    Returns rolling p50/p95/p99 latency (ms), call and error counts per stage:
+    one `tool.<name>` entry per MCP tool called by a client (a tool called by
+    another, e.g. generate_sql inside ask_db, is a `stage.<name>` entry) plus
+    retrieval, prompt.build, llm.completion, sql.validate, sql.explain and
+    db.* stages, over the last METRICS_WINDOW calls of each, and the shared
+    LLM client's request, retry, rate-limit and coalescing counters.
+    reset=True clears the windows after reading.
+    """
+    try:
+        stages = TRACER.stats.snapshot()
+        if reset:
+            TRACER.stats.clear()
+        return {
+            "stages": stages,
+            "window": TRACER.stats.window,
+            "trace_log": TRACE_LOG or None,
+            "otel": TRACE_OTEL,
+            "llm": LLM.stats(),
+        }
+    except Exception as e:
+        return {"error": f"[UnexpectedError] {str(e)}"}
+
+# ----------------------------
+# HTTP serving
+# ----------------------------
+@mcp.custom_route("/ready", methods=["GET"])
+async def ready(request: Request) -> JSONResponse:
+    """
+    Readiness probe for the HTTP transports: 200 once this process serves a
+    schema snapshot, 503 before.
+    """
+    schema = _schema
+    if schema is None:
+        return JSONResponse({"ready": False, "pid": os.getpid(), "reason": "schema not loaded"}, status_code=503)
+    return JSONResponse({
+        "ready": True,
+        "pid": os.getpid(),
+        "schema_version": schema.version,
+        "tables": len(schema.tables),
+        "pool": DB_POOL.stats(),
+    })
+
+def preload() -> None:
+    """
+    Load the schema snapshot and indexes up front, so that the first request
+    does not pay for them (and pre-forked workers inherit them).
+    """
+    schema = get_schema()
+    if RETRIEVAL_MODE != "bm25":
+        get_retriever().warm()
+    print(f"[Serve] Schema {schema.version} loaded ({len(schema.tables)} tables)", file=sys.stderr)
+
+def _worker_app() -> Any:
+    # Runs in each forked worker; the schema watcher stays in the supervisor.
+    LLM.after_fork()
+    return mcp.streamable_http_app()
+
+def serve_http() -> None:
+    global _watch_in_thread, _stateless_workers
+    mcp.settings.host = MCP_HOST
+    mcp.settings.port = MCP_PORT
+    if MCP_WORKERS > 1 and MCP_TRANSPORT == "streamable-http":
+        # Any worker may get any request, so no per-process MCP sessions
+        mcp.settings.stateless_http = True
+        _stateless_workers = True
+        # The supervisor forks repeatedly, so it must stay single-threaded.
+        _watch_in_thread = False
+        PreforkServer(
+            _worker_app,
+            host=MCP_HOST,
+            port=MCP_PORT,
+            workers=MCP_WORKERS,
+            max_requests=MCP_WORKER_MAX_REQUESTS,
+            max_requests_jitter=MCP_WORKER_MAX_REQUESTS_JITTER,
+            graceful_timeout=MCP_GRACEFUL_TIMEOUT,
+            preload=preload,
+            version=_poll_schema_version,
+            reload=_reload_schema,
+        ).run()
+        return
+    if MCP_WORKERS > 1:
+        print("[ServeWarning] SSE sessions live in one process; ignoring MCP_WORKERS.", file=sys.stderr)
+    preload()
+    mcp.run(transport=MCP_TRANSPORT)
+
 # ----------------------------
 # Entrypoint
 # ----------------------------
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
\ No newline at end of file
+    if MCP_TRANSPORT == "stdio":
+        mcp.run(transport="stdio")
+    else:
+        serve_http()
\ No newline at end of file
@@ -0,0 +1,267 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import math
+import secrets
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
+from typing import Any, Callable, Deque, Dict, Iterator, Optional
+
+try:  # spans are mirrored to OpenTelemetry when the API is installed and enabled
+    from opentelemetry import trace as otel_trace
+    from opentelemetry.trace import Status, StatusCode
+except Exception:  # pragma: no cover - optional dependency
+    otel_trace = None
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    One timed stage. ``attributes`` carry the stage's sizes (tokens, rows,
+    bytes, cache hits); a span ends with status OK or ERROR.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "_t0", "duration_ms", "attributes", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self._t0 = time.perf_counter_ns()
+        self.duration_ms = 0.0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def fail(self, message: str) -> None:
+        self.error = message
+
+    def finish(self) -> None:
+        elapsed = time.perf_counter_ns() - self._t0
+        self.end_ns = self.start_ns + elapsed
+        self.duration_ms = elapsed / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        """OTLP/JSON field names, with attributes as a flat mapping."""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+
+
+class LatencyStats:
+    """Rolling window of the last ``window`` durations per span name."""
+
+    def __init__(self, window: int = 2048):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, list] = {}  # name -> [count, errors]
+        self._lock = threading.Lock()
+
+    def add(self, name: str, duration_ms: float, error: bool) -> None:
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+                self._counts[name] = [0, 0]
+            samples.append(duration_ms)
+            self._counts[name][0] += 1
+            self._counts[name][1] += int(error)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            data = {name: (sorted(s), *self._counts[name]) for name, s in self._samples.items()}
+        out = {}
+        for name, (values, count, errors) in sorted(data.items()):
+            out[name] = {
+                "count": count,
+                "errors": errors,
+                "window": len(values),
+                "p50_ms": _percentile(values, 50),
+                "p95_ms": _percentile(values, 95),
+                "p99_ms": _percentile(values, 99),
+                "max_ms": round(values[-1], 3) if values else 0.0,
+            }
+        return out
+
+    def clear(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+
+def _percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return round(sorted_values[rank - 1], 3)
+
+
+def _otel_value(value: Any) -> Any:
+    return value if isinstance(value, (str, bool, int, float)) else str(value)
+
+
+class Tracer:
+    """
+    Records nested spans (parents tracked through a context variable, so
+    they follow ``await`` and ``asyncio.to_thread``; use ``bind`` for other
+    executors), aggregates their durations into ``LatencyStats`` and
+    optionally appends every finished span as one JSON line to ``log_path``.
+    With ``otel=True`` each span is also started on the OpenTelemetry API,
+    so any configured OTel SDK/exporter receives the same tree.
+    """
+
+    def __init__(self, service: str, log_path: str = "", window: int = 2048, otel: bool = False):
+        self.service = service
+        self.stats = LatencyStats(window)
+        self.log_path = log_path
+        self._log = None
+        self._log_lock = threading.Lock()
+        self._otel = otel_trace.get_tracer(service) if otel and otel_trace is not None else None
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        otel_cm = self._otel.start_as_current_span(name) if self._otel is not None else None
+        otel_span = otel_cm.__enter__() if otel_cm is not None else None
+        try:
+            yield span
+        except BaseException as e:
+            span.fail("cancelled" if isinstance(e, asyncio.CancelledError) else f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            span.finish()
+            _current_span.reset(token)
+            if otel_span is not None:
+                otel_span.set_attributes({k: _otel_value(v) for k, v in span.attributes.items() if v is not None})
+                if span.error:
+                    otel_span.set_status(Status(StatusCode.ERROR, span.error))
+                otel_cm.__exit__(None, None, None)
+            self._record(span)
+
+    def _record(self, span: Span) -> None:
+        self.stats.add(span.name, span.duration_ms, span.error is not None)
+        if not self.log_path:
+            return
+        line = json.dumps({"service": self.service, **span.to_dict()}, default=str)
+        try:
+            with self._log_lock:
+                if self._log is None:
+                    self._log = open(self.log_path, "a", encoding="utf-8", buffering=1)
+                self._log.write(line + "\n")
+        except OSError as e:
+            print(f"[TraceError] Could not write {self.log_path}, disabling the trace log: {e}", file=sys.stderr)
+            self.log_path = ""
+
+    @staticmethod
+    def current() -> Optional[Span]:
+        return _current_span.get()
+
+    @staticmethod
+    def bind(fn: Callable[..., Any], *args: Any) -> Callable[[], Any]:
+        """``fn(*args)`` in a copy of the current context, for ``run_in_executor``."""
+        return functools.partial(contextvars.copy_context().run, fn, *args)
+
+    def traced(self, name: str = "") -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """
+        Decorator for MCP tools: one root span per call, marked as an error
+        when the tool returns ``{"error": ...}``, with its row count and an
+        estimate of the response size (the response is not serialized just
+        to measure it). A tool called from inside another span (e.g.
+        generate_sql from ask_db) records a ``stage.<name>`` child span
+        instead, so ``tool.*`` counts only client calls.
+        """
+        def decorate(fn: Callable[..., Any]) -> Callable[..., Any]:
+            tool_name = name or f"tool.{fn.__name__}"
+            stage_name = f"stage.{fn.__name__}"
+
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                    span_name = tool_name if _current_span.get() is None else stage_name
+                    with self.span(span_name) as span:
+                        result = await fn(*args, **kwargs)
+                        _describe_result(span, result)
+                        return result
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                span_name = tool_name if _current_span.get() is None else stage_name
+                with self.span(span_name) as span:
+                    result = fn(*args, **kwargs)
+                    _describe_result(span, result)
+                    return result
+            return wrapper
+        return decorate
+
+    def close(self) -> None:
+        with self._log_lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+
+# Items of a list/dict measured before extrapolating to the rest
+_SIZE_SAMPLE = 8
+
+
+def _estimate_bytes(value: Any) -> int:
+    """
+    Approximate JSON size of ``value``: containers are measured on their
+    first ``_SIZE_SAMPLE`` items and scaled to their length, so the cost
+    does not grow with the number of rows.
+    """
+    if isinstance(value, str):
+        return len(value) + 2
+    if value is None or isinstance(value, bool):
+        return 5
+    if isinstance(value, (int, float)):
+        return len(repr(value))
+    if isinstance(value, dict):
+        items = list(islice(value.items(), _SIZE_SAMPLE))
+        sampled = sum(len(str(k)) + 4 + _estimate_bytes(v) for k, v in items)
+        return 2 + (sampled * len(value) // len(items) if items else 0)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = list(islice(value, _SIZE_SAMPLE))
+        sampled = sum(_estimate_bytes(v) + 1 for v in items)
+        return 2 + (sampled * len(value) // len(items) if items else 0)
+    return len(str(value)) + 2
+
+
+def _describe_result(span: Span, result: Any) -> None:
+    if not isinstance(result, dict):
+        return
+    if "error" in result:
+        span.fail(str(result["error"]))
+    if isinstance(result.get("rows"), list):
+        span.set(rows=len(result["rows"]))
+    elif isinstance(result.get("row_count"), int):
+        span.set(rows=result["row_count"])
+    if result.get("cached"):
+        span.set(cached=True)
+    span.set(response_bytes=_estimate_bytes(result))
+    size = result.get("size")
+    if isinstance(size, dict) and "payload_bytes" in size:
+        span.set(payload_bytes=size["payload_bytes"])
@@ -0,0 +1,343 @@
+import hashlib
+import importlib
+import json
+import math
+import mmap
+import os
+import pathlib
+import sys
+import threading
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from schema_index import tokenize
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python scoring fallback
+    np = None
+
+# Without numpy, scoring every vector in pure Python is far slower than BM25.
+HAS_NUMPY = np is not None
+
+# Field-level hits are a weaker signal than a match on the table's own description.
+FIELD_WEIGHT = 0.8
+INDEX_FORMAT_VERSION = 1
+
+
+# ----------------------------
+# Embedding backends
+# ----------------------------
+class HashingEmbedder:
+    """
+    Offline, deterministic embedder: signed feature hashing of word unigrams
+    and bigrams into a fixed number of dimensions. No model download or
+    network access, so it is suitable for tests and air-gapped deployments.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> Iterable[str]:
+        words = tokenize(text)
+        yield from words
+        for a, b in zip(words, words[1:]):
+            yield f"{a} {b}"
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        out = []
+        for text in texts:
+            vec = [0.0] * self.dim
+            for feat in self._features(text):
+                h = int.from_bytes(hashlib.blake2b(feat.encode(), digest_size=8).digest(), "little")
+                vec[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+            out.append(vec)
+        return out
+
+
+class OpenAIEmbedder:
+    """
+    Embeddings from the OpenAI API, batched to keep request count low. Calls
+    go through the process-wide LLMClient (shared connections, rate-limit
+    backoff) unless a dedicated ``api_key`` is given.
+    """
+
+    def __init__(self, model: str = "text-embedding-3-small", api_key: Optional[str] = None, batch_size: int = 256):
+        from llm_client import LLMClient, default_client
+
+        self.model = model
+        self.name = f"openai-{model}"
+        self.batch_size = batch_size
+        self._client = LLMClient(api_key=api_key) if api_key else default_client()
+        self.dim = 0  # known after the first call
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        out: List[List[float]] = []
+        for i in range(0, len(texts), self.batch_size):
+            resp = self._client.embeddings_sync(list(texts[i:i + self.batch_size]), model=self.model)
+            out.extend(d.embedding for d in resp.data)
+        if out:
+            self.dim = len(out[0])
+        return out
+
+
+def get_embedder(spec: str) -> Any:
+    """
+    Resolve an embedder from a spec string:
+    ``hashing`` / ``hashing:<dim>``, ``openai`` / ``openai:<model>``, or
+    ``package.module:ClassName`` for a custom backend exposing
+    ``name``, ``dim`` and ``embed(texts)``.
+    """
+    kind, _, arg = (spec or "hashing").partition(":")
+    if kind == "hashing":
+        return HashingEmbedder(int(arg) if arg else 512)
+    if kind == "openai":
+        return OpenAIEmbedder(arg or "text-embedding-3-small")
+    module = importlib.import_module(kind)
+    return getattr(module, arg)()
+
+
+# ----------------------------
+# Documents
+# ----------------------------
+def schema_documents(tables: Dict[str, Any]) -> List[Tuple[str, Optional[str], str]]:
+    """
+    One document per table and one per field: ``(table, field_or_None, text)``.
+    """
+    docs: List[Tuple[str, Optional[str], str]] = []
+    for table, info in tables.items():
+        info = info or {}
+        docs.append((table, None, f"{table.replace('_', ' ')}: {info.get('description', '')}"))
+        for field, finfo in (info.get("fields", {}) or {}).items():
+            finfo = finfo or {}
+            docs.append((
+                table,
+                field,
+                f"{table.replace('_', ' ')} {field.replace('_', ' ')} ({finfo.get('type', '')}): {finfo.get('description', '')}",
+            ))
+    return docs
+
+
+def _normalize(vec: Sequence[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+# ----------------------------
+# Persisted index
+# ----------------------------
+class VectorIndex:
+    """
+    Unit-normalised float32 vectors for every schema document, stored as a
+    raw matrix file that is memory-mapped on load. Files are named by a hash
+    of the embedder and all document texts, so an unchanged schema reuses the
+    existing index and any schema edit produces a new one; vectors for
+    documents whose text did not change are copied from the previous index
+    instead of being re-embedded.
+    """
+
+    def __init__(self, ids: List[Tuple[str, Optional[str]]], dim: int, matrix_path: pathlib.Path):
+        self.ids = ids
+        self.dim = dim
+        self.matrix_path = matrix_path
+        self._file = None
+        self._mmap = None
+        if np is not None:
+            self._matrix = np.memmap(matrix_path, dtype=np.float32, mode="r", shape=(len(ids), dim)) if ids else None
+        else:
+            self._file = open(matrix_path, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if ids else None
+            self._matrix = memoryview(self._mmap).cast("f") if ids else None
+
+    @classmethod
+    def build_or_load(cls, tables: Dict[str, Any], embedder: Any, index_dir: str) -> "VectorIndex":
+        directory = pathlib.Path(index_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        docs = schema_documents(tables)
+        text_hashes = [_text_hash(text) for _, _, text in docs]
+        content_hash = hashlib.sha256(
+            f"{INDEX_FORMAT_VERSION}|{embedder.name}|".encode() + "".join(text_hashes).encode()
+        ).hexdigest()[:24]
+        meta_path = directory / f"{content_hash}.json"
+        matrix_path = directory / f"{content_hash}.f32"
+
+        if meta_path.exists() and matrix_path.exists():
+            try:
+                meta = json.loads(meta_path.read_text())
+                ids = [(t, f) for t, f in meta["ids"]]
+                return cls(ids, meta["dim"], matrix_path)
+            except Exception as e:
+                print(f"[VectorIndexError] Ignoring unreadable index {meta_path.name}: {e}", file=sys.stderr)
+
+        reused = cls._previous_vectors(directory, embedder.name)
+        vectors: List[Optional[List[float]]] = [reused.get(h) for h in text_hashes]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            fresh = embedder.embed([docs[i][2] for i in missing])
+            for i, vec in zip(missing, fresh):
+                vectors[i] = _normalize(vec)
+        dim = len(vectors[0]) if vectors else getattr(embedder, "dim", 0)
+
+        flat = array("f")
+        for vec in vectors:
+            flat.extend(vec)
+        tmp_matrix = matrix_path.with_suffix(f".f32.tmp{os.getpid()}")
+        tmp_meta = meta_path.with_suffix(f".json.tmp{os.getpid()}")
+        with open(tmp_matrix, "wb") as f:
+            flat.tofile(f)
+        tmp_meta.write_text(json.dumps({
+            "version": INDEX_FORMAT_VERSION,
+            "embedder": embedder.name,
+            "dim": dim,
+            "ids": [[t, f] for t, f, _ in docs],
+            "text_hashes": text_hashes,
+        }))
+        # Matrix first: a meta file is only ever visible next to a complete matrix.
+        os.replace(tmp_matrix, matrix_path)
+        os.replace(tmp_meta, meta_path)
+        cls._prune(directory, keep=3)
+        print(
+            f"[VectorIndex] Built {content_hash} ({len(docs)} docs, {len(missing)} embedded, "
+            f"{len(docs) - len(missing)} reused)",
+            file=sys.stderr,
+        )
+        return cls([(t, f) for t, f, _ in docs], dim, matrix_path)
+
+    @staticmethod
+    def _previous_vectors(directory: pathlib.Path, embedder_name: str) -> Dict[str, List[float]]:
+        """Vectors of the most recent index built with the same embedder, keyed by text hash."""
+        candidates = sorted(directory.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for meta_path in candidates:
+            try:
+                meta = json.loads(meta_path.read_text())
+                if meta.get("embedder") != embedder_name or meta.get("version") != INDEX_FORMAT_VERSION:
+                    continue
+                dim = meta["dim"]
+                flat = array("f")
+                with open(meta_path.with_suffix(".f32"), "rb") as f:
+                    flat.fromfile(f, len(meta["ids"]) * dim)
+                return {
+                    h: list(flat[i * dim:(i + 1) * dim])
+                    for i, h in enumerate(meta.get("text_hashes", []))
+                }
+            except Exception:
+                continue
+        return {}
+
+    @staticmethod
+    def _prune(directory: pathlib.Path, keep: int) -> None:
+        """Delete all but the ``keep`` most recent indexes (open mmaps stay valid on POSIX)."""
+        metas = sorted(directory.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for meta_path in metas[keep:]:
+            for path in (meta_path, meta_path.with_suffix(".f32")):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def _similarities(self, query_vec: List[float]) -> Sequence[float]:
+        if np is not None:
+            return self._matrix @ np.asarray(query_vec, dtype=np.float32)
+        # Only the query's non-zero dimensions contribute, which keeps the
+        # pure-Python path cheap for sparse (hashing) query vectors.
+        m, dim = self._matrix, self.dim
+        nonzero = [(d, q) for d, q in enumerate(query_vec) if q]
+        return [
+            sum(m[base + d] * q for d, q in nonzero)
+            for base in range(0, len(self.ids) * dim, dim)
+        ]
+
+    def top_tables(self, query_vec: List[float], k: int = 6) -> List[Tuple[str, float]]:
+        """
+        Tables ranked by the best of their own similarity and (down-weighted)
+        their best field's similarity to the query vector.
+        """
+        if self._matrix is None:
+            return []
+        sims = self._similarities(_normalize(query_vec))
+        scores: Dict[str, float] = {}
+        for row, (table, field) in enumerate(self.ids):
+            s = float(sims[row]) * (FIELD_WEIGHT if field else 1.0)
+            if s > scores.get(table, -1.0):
+                scores[table] = s
+        return sorted(scores.items(), key=lambda x: (-x[1], x[0]))[:k]
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._matrix.release()
+            self._mmap.close()
+        if self._file is not None:
+            self._file.close()
+        self._matrix = self._mmap = self._file = None
+
+
+class SemanticRetriever:
+    """
+    Lazily builds/loads the VectorIndex on first use so server start-up does
+    not pay for embedding. ``close`` releases the index (its mmap and file)
+    once queries already running on it have finished.
+    """
+
+    def __init__(self, tables: Dict[str, Any], embedder_spec: str, index_dir: str):
+        self._tables = tables
+        self._embedder_spec = embedder_spec
+        self._index_dir = index_dir
+        self._embedder = None
+        self._index: Optional[VectorIndex] = None
+        self._lock = threading.Lock()
+        self._users = 0
+        self._closed = False
+
+    def _ensure(self) -> VectorIndex:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._embedder = get_embedder(self._embedder_spec)
+                    self._index = VectorIndex.build_or_load(self._tables, self._embedder, self._index_dir)
+        return self._index
+
+    def warm(self) -> None:
+        """Build or load the index now instead of on the first query."""
+        self._ensure()
+
+    def top_tables(self, query: str, k: int = 6) -> List[str]:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Vector index was replaced by a schema reload.")
+            self._users += 1
+        try:
+            index = self._ensure()
+            query_vec = self._embedder.embed([query])[0]
+            return [t for t, _ in index.top_tables(query_vec, k=k)]
+        finally:
+            with self._lock:
+                self._users -= 1
+            if self._closed:
+                self.close()
+
+    def close(self) -> None:
+        """Stop serving queries; the index is closed by the last one still running."""
+        with self._lock:
+            self._closed = True
+            if self._users:
+                return
+            index, self._index = self._index, None
+        if index is not None:
+            index.close()
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """
+    Merge several ranked lists; items ranked high in any list float to the top.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return [item for item, _ in sorted(scores.items(), key=lambda x: (-x[1], x[0]))]